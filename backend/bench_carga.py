@@ -0,0 +1,273 @@
+"""
+Teste de carga HTTP dos endpoints de leitura da API
+
+Dispara uma mistura ponderada de consultas realistas (/api/dados, /api/dados/agregados,
+/api/stats, /api/empresas) com concorrência configurável contra uma instância em
+execução e reporta vazão, latência p50/p95/p99 e taxa de erro por endpoint. O
+resultado é gravado em JSON e comparado com a execução anterior.
+
+Uso:
+    python bench_carga.py --url http://localhost:8000 --concorrencia 16 --duracao 30
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from bench_ingestao import commit_atual, percentil
+
+# Peso relativo de cada tipo de consulta na mistura (tráfego típico do dashboard)
+MISTURA_PADRAO = {
+    "dados": 4,
+    "agregados": 4,
+    "stats": 1,
+    "empresas": 2
+}
+
+
+class GeradorConsultas:
+    """Sorteia consultas realistas a partir das empresas e anos da própria instância"""
+
+    def __init__(self, empresas, anos, mistura, semente=42, indice=0):
+        self.empresas = empresas or ["ENERGIA"]
+        self.anos = anos or [None]
+        self.mistura = mistura
+        self.tipos = list(mistura)
+        self.pesos = [mistura[tipo] for tipo in self.tipos]
+        self.semente = semente
+        self.rnd = random.Random(f"{self.semente}-{indice}")
+
+    def para_worker(self, indice):
+        """
+        Gerador próprio do worker, semeado pelo índice (e não pela thread): a mesma
+        semente repete a mesma sequência de consultas por worker entre execuções
+        """
+        return GeradorConsultas(self.empresas, self.anos, self.mistura, self.semente, indice)
+
+    def substring_empresa(self):
+        """Trecho de um nome real, como o usuário digita no filtro"""
+        palavras = [p for p in self.rnd.choice(self.empresas).split() if len(p) >= 3]
+        return self.rnd.choice(palavras) if palavras else None
+
+    def ano(self):
+        return self.rnd.choice(self.anos)
+
+    def sortear(self):
+        """Retorna (endpoint, caminho, parâmetros)"""
+        tipo = self.rnd.choices(self.tipos, weights=self.pesos)[0]
+        parametros = {}
+
+        if tipo == "dados":
+            if self.rnd.random() < 0.6:
+                parametros["empresa"] = self.substring_empresa()
+            if self.rnd.random() < 0.7:
+                parametros["ano"] = self.ano()
+            parametros["limit"] = self.rnd.choice([100, 500, 1000])
+            if self.rnd.random() < 0.2:
+                parametros["skip"] = self.rnd.choice([1000, 5000])
+            return "/api/dados", "/api/dados", parametros
+
+        if tipo == "agregados":
+            parametros["group_by"] = self.rnd.choice(["mes", "mes", "empresa", "ano"])
+            if self.rnd.random() < 0.4:
+                parametros["empresa"] = self.substring_empresa()
+            if self.rnd.random() < 0.6:
+                parametros["ano"] = self.ano()
+            return "/api/dados/agregados", "/api/dados/agregados", parametros
+
+        if tipo == "empresas":
+            if self.rnd.random() < 0.5:
+                parametros["ano"] = self.ano()
+            return "/api/empresas", "/api/empresas", parametros
+
+        return "/api/stats", "/api/stats", parametros
+
+
+class ResultadosCarga:
+    """Latências e erros por endpoint, seguro para threads"""
+
+    def __init__(self):
+        self.latencias = {}
+        self.erros = {}
+        self.status = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, endpoint, segundos, status):
+        with self._lock:
+            self.latencias.setdefault(endpoint, []).append(segundos * 1000)
+            chave = f"{endpoint} {status}"
+            self.status[chave] = self.status.get(chave, 0) + 1
+            if status == "erro" or (isinstance(status, int) and status >= 400):
+                self.erros[endpoint] = self.erros.get(endpoint, 0) + 1
+
+    def resumo(self, duracao):
+        with self._lock:
+            endpoints = {}
+            for endpoint, latencias in sorted(self.latencias.items()):
+                erros = self.erros.get(endpoint, 0)
+                endpoints[endpoint] = {
+                    "requisicoes": len(latencias),
+                    "erros": erros,
+                    "taxa_erro": round(erros / len(latencias), 4),
+                    "rps": round(len(latencias) / duracao, 2),
+                    "p50_ms": round(percentil(latencias, 50), 2),
+                    "p95_ms": round(percentil(latencias, 95), 2),
+                    "p99_ms": round(percentil(latencias, 99), 2),
+                    "max_ms": round(max(latencias), 2)
+                }
+            todas = [valor for latencias in self.latencias.values() for valor in latencias]
+            total_erros = sum(self.erros.values())
+            return {
+                "total": {
+                    "requisicoes": len(todas),
+                    "erros": total_erros,
+                    "taxa_erro": round(total_erros / len(todas), 4) if todas else None,
+                    "rps": round(len(todas) / duracao, 2),
+                    "p50_ms": round(percentil(todas, 50), 2) if todas else None,
+                    "p95_ms": round(percentil(todas, 95), 2) if todas else None,
+                    "p99_ms": round(percentil(todas, 99), 2) if todas else None
+                },
+                "endpoints": endpoints,
+                "status": dict(sorted(self.status.items()))
+            }
+
+
+def descobrir_filtros(url, timeout):
+    """Busca empresas e anos reais para montar filtros plausíveis"""
+    empresas, anos = [], []
+    try:
+        empresas = requests.get(f"{url}/api/empresas", timeout=timeout).json().get("empresas", [])
+        anos = requests.get(f"{url}/api/anos", timeout=timeout).json().get("anos", [])
+    except Exception as e:
+        print(f"⚠️  Não foi possível descobrir empresas/anos: {e}")
+    return empresas, [str(ano) for ano in anos]
+
+
+def executar_carga(url, gerador, resultados, concorrencia, duracao, max_requisicoes, timeout):
+    """Cada worker repete consultas até o fim da duração ou do total de requisições"""
+    fim = time.monotonic() + duracao
+    contador = {"enviadas": 0}
+    lock = threading.Lock()
+
+    def worker(indice):
+        gerador_worker = gerador.para_worker(indice)
+        sessao = requests.Session()
+        while time.monotonic() < fim:
+            if max_requisicoes:
+                with lock:
+                    if contador["enviadas"] >= max_requisicoes:
+                        return
+                    contador["enviadas"] += 1
+            endpoint, caminho, parametros = gerador_worker.sortear()
+            parametros = {chave: valor for chave, valor in parametros.items() if valor is not None}
+            inicio = time.perf_counter()
+            try:
+                resposta = sessao.get(f"{url}{caminho}", params=parametros, timeout=timeout)
+                resposta.content
+                status = resposta.status_code
+            except requests.RequestException:
+                status = "erro"
+            resultados.registrar(endpoint, time.perf_counter() - inicio, status)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        futuros = [executor.submit(worker, indice) for indice in range(concorrencia)]
+        # Erro num worker (fora do HTTP) invalida a medição: propaga em vez de sumir
+        for futuro in futuros:
+            futuro.result()
+    return time.perf_counter() - inicio
+
+
+def comparar(anterior, atual):
+    """Imprime a variação de vazão e latência por endpoint em relação ao baseline anterior"""
+    print(f"\n📊 Comparação com baseline ({anterior.get('git_commit')} em {anterior.get('timestamp')}):")
+    for endpoint, metricas in atual["endpoints"].items():
+        antes = anterior.get("endpoints", {}).get(endpoint)
+        if not antes:
+            print(f"   {endpoint}: sem referência")
+            continue
+        partes = []
+        for chave in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if antes.get(chave):
+                variacao = (metricas[chave] - antes[chave]) / antes[chave] * 100
+                partes.append(f"{chave} {antes[chave]} → {metricas[chave]} ({variacao:+.1f}%)")
+        print(f"   {endpoint}: " + ", ".join(partes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga dos endpoints de leitura")
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--duracao", type=float, default=30, help="Segundos de carga")
+    parser.add_argument("--requisicoes", type=int, default=0, help="Limite de requisições (0 = só a duração)")
+    parser.add_argument("--aquecimento", type=float, default=3, help="Segundos de aquecimento descartados")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mistura", default=None,
+                        help='Pesos em JSON, ex.: \'{"dados": 1, "agregados": 3}\'')
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--baseline", default="bench_carga.json")
+    parser.add_argument("--sem-salvar", action="store_true", help="Não sobrescreve o baseline")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    mistura = json.loads(args.mistura) if args.mistura else MISTURA_PADRAO
+    tipos_invalidos = set(mistura) - set(MISTURA_PADRAO)
+    if tipos_invalidos:
+        parser.error(f"tipos de consulta desconhecidos: {', '.join(sorted(tipos_invalidos))}")
+
+    empresas, anos = descobrir_filtros(url, args.timeout)
+    print(f"🎯 {url}: {len(empresas)} empresas, anos {anos}")
+    gerador = GeradorConsultas(empresas, anos, mistura, args.semente)
+
+    if args.aquecimento:
+        print(f"🔥 Aquecimento de {args.aquecimento}s...")
+        executar_carga(url, gerador, ResultadosCarga(), args.concorrencia, args.aquecimento, 0, args.timeout)
+
+    print(f"🚀 Carga: {args.concorrencia} clientes por {args.duracao}s...")
+    resultados = ResultadosCarga()
+    duracao = executar_carga(
+        url, gerador, resultados, args.concorrencia, args.duracao, args.requisicoes, args.timeout
+    )
+
+    resultado = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit_atual(),
+        "config": {
+            "url": url,
+            "concorrencia": args.concorrencia,
+            "duracao": round(duracao, 2),
+            "mistura": mistura,
+            "semente": args.semente
+        },
+        **resultados.resumo(duracao)
+    }
+
+    print("\n📈 RESULTADO")
+    print(f"{'endpoint':<24}{'req':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'erros':>8}")
+    for endpoint, metricas in resultado["endpoints"].items():
+        print(
+            f"{endpoint:<24}{metricas['requisicoes']:>8}{metricas['rps']:>9}"
+            f"{metricas['p50_ms']:>9}{metricas['p95_ms']:>9}{metricas['p99_ms']:>9}{metricas['erros']:>8}"
+        )
+    total = resultado["total"]
+    print(f"Total: {total['requisicoes']} requisições, {total['rps']} req/s, "
+          f"p95 {total['p95_ms']} ms, taxa de erro {total['taxa_erro']}")
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), resultado)
+
+    if not args.sem_salvar:
+        with open(args.baseline, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline gravado em {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Benchmark de ingestão contra um datastore CKAN falso local
+
+Sobe um servidor HTTP que imita o datastore_search da CCEE com meses sintéticos
+(tamanho, latência e taxa de erro configuráveis), roda o CCEEDataLoader e o
+CCEEDataUpdater contra ele e um MongoDB local, e grava o resultado em JSON para
+comparar com a execução anterior.
+
+Uso:
+    python bench_ingestao.py --meses 4 --registros-por-mes 20000 --latencia-ms 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def registro_sintetico(mes_referencia, indice, semente=42):
+    """Gera um registro determinístico no formato do datastore da CCEE"""
+    rnd = random.Random(f"{semente}-{mes_referencia}-{indice}")
+    empresa = rnd.randint(1, 800)
+    perfil = empresa * 10 + rnd.randint(0, 4)
+    return {
+        "_id": indice + 1,
+        "MES_REFERENCIA": mes_referencia,
+        "NOME_EMPRESARIAL": f"EMPRESA SINTETICA {empresa:04d} S.A.",
+        "CNPJ": f"{empresa:08d}0001{empresa % 100:02d}",
+        "CODIGO_PERFIL_AGENTE": str(perfil),
+        "SIGLA_PERFIL_AGENTE": f"SINT{perfil}",
+        "CONTRATACAO_VENDA": f"{rnd.paretovariate(1.5) * 100:.3f}",
+        "CONTRATACAO_COMPRA": f"{rnd.paretovariate(1.5) * 80:.3f}"
+    }
+
+
+class ServidorCKANFalso:
+    """Servidor local que responde datastore_search com meses sintéticos (e o catálogo do pacote)"""
+
+    def __init__(self, meses, registros_por_mes, latencia_ms=0, taxa_erro=0.0, semente=42):
+        self.meses = set(meses)
+        self.registros_por_mes = registros_por_mes
+        self.latencia_ms = latencia_ms
+        self.taxa_erro = taxa_erro
+        self.semente = semente
+        self.paginas = 0
+        self.erros = 0
+        self.registros_servidos = 0
+        self._lock = threading.Lock()
+        self._rnd = random.Random(semente)
+        self._servidor = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}/api/3/action"
+
+    def contadores(self):
+        with self._lock:
+            return {"paginas": self.paginas, "erros": self.erros, "registros": self.registros_servidos}
+
+    def responder(self, caminho, parametros):
+        """Retorna (status, corpo) para uma requisição"""
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+        with self._lock:
+            sortear_erro = self._rnd.random() < self.taxa_erro
+        if sortear_erro:
+            with self._lock:
+                self.erros += 1
+            return 500, {"success": False, "error": {"message": "erro sintético"}}
+
+        if caminho.endswith("/resource_show"):
+            return 200, {"success": True, "result": {"id": parametros.get("id", [""])[0], "package_id": "bench-ccee"}}
+        if caminho.endswith("/package_show"):
+            anos = sorted({mes[:4] for mes in self.meses})
+            recursos = [{"id": f"bench-{ano}", "name": f"Contratos {ano}", "datastore_active": True} for ano in anos]
+            return 200, {"success": True, "result": {"name": "bench-ccee", "resources": recursos}}
+        if not caminho.endswith("/datastore_search"):
+            return 404, {"success": False, "error": {"message": "ação desconhecida"}}
+
+        filtros = json.loads(parametros.get("filters", ["{}"])[0])
+        mes_referencia = filtros.get("MES_REFERENCIA")
+        limite = int(parametros.get("limit", ["100"])[0])
+        offset = int(parametros.get("offset", ["0"])[0])
+
+        total = self.registros_por_mes if mes_referencia in self.meses else 0
+        fim = min(offset + limite, total)
+        registros = [registro_sintetico(mes_referencia, i, self.semente) for i in range(offset, fim)]
+
+        with self._lock:
+            self.paginas += 1
+            self.registros_servidos += len(registros)
+
+        return 200, {
+            "success": True,
+            "result": {"records": registros, "total": total, "limit": limite, "offset": offset}
+        }
+
+    def iniciar(self):
+        servidor_falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, corpo = servidor_falso.responder(url.path, parse_qs(url.query))
+                dados = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[posicao]
+
+
+def pico_rss_mb():
+    """Pico de memória residente do processo (ru_maxrss é KB no Linux e bytes no macOS)"""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 / 1024 if sys.platform == "darwin" else pico / 1024
+
+
+def commit_atual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).strip()
+    except Exception:
+        return None
+
+
+def medir_fase(servidor, funcao, verbose):
+    """Executa uma fase de ingestão e devolve (resultado, segundos, páginas servidas)"""
+    antes = servidor.contadores()
+    inicio = time.perf_counter()
+    saida = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with saida:
+        resultado = funcao()
+    segundos = time.perf_counter() - inicio
+    depois = servidor.contadores()
+    return resultado, segundos, depois["paginas"] - antes["paginas"]
+
+
+def resumo_fase(registros, segundos, paginas):
+    return {
+        "registros": registros,
+        "segundos": round(segundos, 3),
+        "registros_por_s": round(registros / segundos, 1) if segundos else None,
+        "paginas": paginas,
+        "paginas_por_s": round(paginas / segundos, 2) if segundos else None
+    }
+
+
+def resumo_latencias(latencias):
+    return {
+        "chamadas": len(latencias),
+        "p50": round(percentil(latencias, 50), 2) if latencias else None,
+        "p95": round(percentil(latencias, 95), 2) if latencias else None,
+        "max": round(max(latencias), 2) if latencias else None
+    }
+
+
+def comparar(anterior, atual):
+    """Imprime a variação das métricas principais em relação ao baseline anterior"""
+    metricas = [
+        ("loader", "registros_por_s"),
+        ("loader", "paginas_por_s"),
+        ("updater", "registros_por_s"),
+        ("insert_latencia_ms", "p50"),
+        ("insert_latencia_ms", "p95"),
+        ("troca_latencia_ms", "p50"),
+        ("troca_latencia_ms", "p95"),
+        (None, "pico_rss_mb")
+    ]
+    print(f"\n📊 Comparação com baseline ({anterior.get('git_commit')} em {anterior.get('timestamp')}):")
+    for grupo, chave in metricas:
+        valor_antes = anterior.get(grupo, {}).get(chave) if grupo else anterior.get(chave)
+        valor_agora = atual.get(grupo, {}).get(chave) if grupo else atual.get(chave)
+        nome = f"{grupo}.{chave}" if grupo else chave
+        if not valor_antes or valor_agora is None:
+            print(f"   {nome}: {valor_agora} (sem referência)")
+            continue
+        variacao = (valor_agora - valor_antes) / valor_antes * 100
+        print(f"   {nome}: {valor_antes} → {valor_agora} ({variacao:+.1f}%)")
+
+
+def executar_benchmark(args):
+    meses = [f"{args.ano}{mes:02d}" for mes in range(1, args.meses + 1)]
+    servidor = ServidorCKANFalso(
+        meses, args.registros_por_mes, args.latencia_ms, args.taxa_erro, args.semente
+    ).iniciar()
+    print(f"🧪 CKAN falso em {servidor.url} ({len(meses)} meses x {args.registros_por_mes:,} registros)")
+
+    # Loader e updater leem a configuração do ambiente
+    os.environ["MONGODB_DB"] = args.database
+    os.environ["CCEE_API_URL"] = servidor.url
+    os.environ["CCEE_PAGE_DELAY"] = "0"
+
+    from data_loader import CCEEDataLoader
+    from data_updater import CCEEDataUpdater
+
+    # Loader e updater gravam cada mês no staging (PublicadorMes.encenar) e depois
+    # publicam mês a mês (PublicadorMes.trocar_mes): séries separadas
+    from publicacao import PublicadorMes
+    originais = {"encenar": PublicadorMes.encenar, "trocar_mes": PublicadorMes.trocar_mes}
+    latencias = {"encenar": [], "trocar_mes": []}
+
+    def cronometrar(nome):
+        original = originais[nome]
+
+        def cronometrado(self, *args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return original(self, *args, **kwargs)
+            finally:
+                latencias[nome].append((time.perf_counter() - inicio) * 1000)
+        return cronometrado
+
+    for nome in originais:
+        setattr(PublicadorMes, nome, cronometrar(nome))
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            loader = CCEEDataLoader()
+        # Database só do benchmark: apaga tudo (staging, versoes_mes, dashboard, catálogo...)
+        # para cada execução partir do mesmo estado
+        loader.client.drop_database(args.database)
+        with contextlib.redirect_stdout(io.StringIO()):
+            loader.create_indexes()
+
+        # Fase 1: carga inicial de todos os meses menos o último
+        total_loader, seg_loader, pag_loader = medir_fase(
+            servidor, lambda: loader.load_year_data(args.ano, list(range(1, args.meses))), args.verbose
+        )
+
+        # Fase 2: o updater encontra e baixa o mês seguinte
+        def atualizar():
+            updater = CCEEDataUpdater()
+            try:
+                return updater.update_new_data()
+            finally:
+                updater.close_connection()
+
+        total_updater, seg_updater, pag_updater = medir_fase(servidor, atualizar, args.verbose)
+
+        meses_vazios = [mes for mes in meses if loader.collection.count_documents({"MES_REFERENCIA": mes}) == 0]
+        loader.close_connection()
+    finally:
+        for nome, original in originais.items():
+            setattr(PublicadorMes, nome, original)
+        servidor.parar()
+
+    resultado = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit_atual(),
+        "config": {
+            "meses": args.meses,
+            "registros_por_mes": args.registros_por_mes,
+            "latencia_ms": args.latencia_ms,
+            "taxa_erro": args.taxa_erro,
+            "semente": args.semente
+        },
+        "loader": resumo_fase(total_loader, seg_loader, pag_loader),
+        "updater": resumo_fase(total_updater or 0, seg_updater, pag_updater),
+        "insert_latencia_ms": resumo_latencias(latencias["encenar"]),
+        "troca_latencia_ms": resumo_latencias(latencias["trocar_mes"]),
+        "pico_rss_mb": round(pico_rss_mb(), 1),
+        "erros_servidos": servidor.erros,
+        "meses_sem_dados": meses_vazios
+    }
+
+    print("\n📈 RESULTADO")
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), resultado)
+
+    if not args.sem_salvar:
+        with open(args.baseline, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline gravado em {args.baseline}")
+
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão CCEE com CKAN falso local")
+    parser.add_argument("--meses", type=int, default=3, help="Meses sintéticos de --ano, 2 a 12 (o último é baixado pelo updater)")
+    parser.add_argument("--registros-por-mes", type=int, default=5000)
+    parser.add_argument("--latencia-ms", type=float, default=0, help="Latência artificial por página")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de páginas que respondem HTTP 500")
+    parser.add_argument("--ano", default="2025")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--database", default="ccee_bench", help="Database MongoDB usado (é apagado!)")
+    parser.add_argument("--baseline", default="bench_ingestao.json")
+    parser.add_argument("--sem-salvar", action="store_true", help="Não sobrescreve o baseline")
+    parser.add_argument("--verbose", action="store_true", help="Mostra a saída do loader/updater")
+    args = parser.parse_args()
+
+    if not 2 <= args.meses <= 12:
+        # Todos os meses no mesmo ano: o loader carrega um ano por vez (load_year_data)
+        parser.error("--meses deve estar entre 2 (loader + updater) e 12")
+    if args.database == os.getenv("DATABASE_NAME", "ccee_data"):
+        parser.error("não rode o benchmark no database da aplicação")
+
+    executar_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
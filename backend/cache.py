@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Cache em memória com expiração, seguro para threads"""
+
+    def __init__(self, ttl_seconds=60, max_entries=512):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Retorna (True, valor) se a chave estiver válida, senão (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return True, entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Descarta a entrada que expira primeiro
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def get_or_set(self, key, func):
+        """Retorna o valor em cache ou calcula uma única vez, mesmo entre threads concorrentes"""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Outra thread pode ter calculado enquanto esperávamos
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+            value = func()
+            self.set(key, value)
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else None,
+            "ttl_seconds": self.ttl_seconds
+        }
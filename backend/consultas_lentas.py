@@ -0,0 +1,228 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from bson import json_util
+from pymongo import monitoring
+
+from metricas import endpoint_atual
+
+# Comandos de leitura que valem um explain
+COMANDOS_EXPLICAVEIS = {"find", "aggregate", "count", "distinct"}
+
+# Pipelines que gravam (rollup, publicação) são registrados, mas nunca explicados
+ESTAGIOS_DE_ESCRITA = ("$merge", "$out")
+
+# Formas de consulta lembradas para não repetir o explain (limpa ao passar disso)
+MAX_FORMAS = 1000
+
+
+def _comando_para_explain(comando):
+    """Remove campos de sessão/driver que o explain não aceita"""
+    return {
+        chave: valor for chave, valor in comando.items()
+        if not chave.startswith("$") and chave not in ("lsid", "txnNumber", "readConcern")
+    }
+
+
+def _grava(comando):
+    """Pipeline com estágio de escrita: o explain não vale o risco"""
+    return any(
+        isinstance(estagio, dict) and any(chave in ESTAGIOS_DE_ESCRITA for chave in estagio)
+        for estagio in comando.get("pipeline") or []
+    )
+
+
+def _forma(valor):
+    """Estrutura de um filtro/pipeline sem os valores (listas de valores viram uma só)"""
+    if isinstance(valor, dict):
+        return {chave: _forma(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        if all(not isinstance(item, (dict, list, tuple)) for item in valor):
+            return "[?]"
+        return [_forma(item) for item in valor]
+    return "?"
+
+
+def forma_da_consulta(nome_comando, database, comando):
+    """Chave da consulta a menos dos parâmetros: mesma forma, mesmo plano"""
+    return json.dumps([
+        database,
+        nome_comando,
+        comando.get(nome_comando),
+        _forma(comando.get("filter") or comando.get("query")),
+        _forma(comando.get("pipeline")),
+        _forma(comando.get("sort")),
+        comando.get("key")
+    ], sort_keys=True, default=str)
+
+
+def _procurar(documento, chave):
+    """Busca recursiva da primeira ocorrência de uma chave (formato do explain varia por versão/comando)"""
+    if isinstance(documento, dict):
+        if chave in documento:
+            return documento[chave]
+        valores = documento.values()
+    elif isinstance(documento, list):
+        valores = documento
+    else:
+        return None
+    for valor in valores:
+        encontrado = _procurar(valor, chave)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+def _estagios_do_plano(plano, estagios=None):
+    """Lista (estágio, índice) do plano vencedor"""
+    if estagios is None:
+        estagios = []
+    if isinstance(plano, dict):
+        if "stage" in plano:
+            estagios.append((plano["stage"], plano.get("indexName")))
+        for chave in ("inputStage", "queryPlan"):
+            if chave in plano:
+                _estagios_do_plano(plano[chave], estagios)
+        for filho in plano.get("inputStages", []):
+            _estagios_do_plano(filho, estagios)
+    return estagios
+
+
+def resumir_explain(explain):
+    """Resumo do plano vencedor (queryPlanner): índices usados e se há COLLSCAN"""
+    estagios = _estagios_do_plano(_procurar(explain, "winningPlan") or {})
+    indices = sorted({indice for _, indice in estagios if indice})
+    return {
+        "indices": indices,
+        "collscan": any(estagio == "COLLSCAN" for estagio, _ in estagios),
+        "estagios": [estagio for estagio, _ in estagios]
+    }
+
+
+class RegistroConsultasLentas(monitoring.CommandListener):
+    """
+    Detecta comandos acima do limite, captura o explain em segundo plano e grava
+    uma linha JSON por consulta lenta
+
+    O explain usa a verbosidade queryPlanner, que só escolhe o plano: com
+    executionStats a consulta lenta rodaria de novo justamente quando o banco já está
+    lento. Cada forma de consulta é explicada no máximo uma vez a cada
+    intervalo_explain segundos; as repetições reaproveitam o último plano.
+    """
+
+    def __init__(self, limite_ms=200, arquivo=None, max_recentes=200, intervalo_explain=300):
+        self.limite_ms = limite_ms
+        self.arquivo = arquivo
+        self.intervalo_explain = intervalo_explain
+        self.client = None
+        self.recentes = deque(maxlen=max_recentes)
+        self._pendentes = {}
+        self._explicados = {}
+        self._fila = queue.Queue(maxsize=100)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def started(self, event):
+        if event.command_name not in COMANDOS_EXPLICAVEIS:
+            return
+        # Só a referência ao comando: a cópia fica para quando a consulta passar do limite
+        with self._lock:
+            self._pendentes[(event.connection_id, event.request_id)] = (
+                event.database_name, event.command, endpoint_atual.get()
+            )
+
+    def succeeded(self, event):
+        with self._lock:
+            pendente = self._pendentes.pop((event.connection_id, event.request_id), None)
+        if pendente is None:
+            return
+        duracao_ms = event.duration_micros / 1000
+        if duracao_ms < self.limite_ms:
+            return
+
+        database, comando, endpoint = pendente
+        comando = dict(comando)
+        registro = {
+            "timestamp": datetime.now().isoformat(),
+            "endpoint": endpoint,
+            "comando": event.command_name,
+            "database": database,
+            "collection": comando.get(event.command_name),
+            "filtro": comando.get("filter") or comando.get("query"),
+            "pipeline": comando.get("pipeline"),
+            "duracao_ms": round(duracao_ms, 2)
+        }
+        if _grava(comando):
+            registro["explain"] = {"ignorado": "pipeline com $merge/$out"}
+            self._gravar(registro)
+            return
+
+        forma = forma_da_consulta(event.command_name, database, comando)
+        agora = time.monotonic()
+        with self._lock:
+            anterior = self._explicados.get(forma)
+            if anterior is not None and agora - anterior[0] < self.intervalo_explain:
+                registro["explain"] = {**(anterior[1] or {"pendente": True}), "reaproveitado": True}
+            else:
+                if len(self._explicados) >= MAX_FORMAS:
+                    self._explicados.clear()
+                self._explicados[forma] = (agora, None)
+        if "explain" in registro:
+            self._gravar(registro)
+            return
+
+        try:
+            self._fila.put_nowait((registro, database, comando, forma))
+            self._iniciar_worker()
+        except queue.Full:
+            # Nunca bloqueia a requisição: sem explain, mas ainda registra
+            registro["explain"] = {"erro": "fila de explain cheia"}
+            self._gravar(registro)
+
+    def failed(self, event):
+        with self._lock:
+            self._pendentes.pop((event.connection_id, event.request_id), None)
+
+    def _iniciar_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._processar, name="explain-consultas-lentas", daemon=True)
+                self._worker.start()
+
+    def _processar(self):
+        while True:
+            registro, database, comando, forma = self._fila.get()
+            try:
+                if self.client is None:
+                    raise RuntimeError("cliente MongoDB não configurado")
+                explain = self.client[database].command(
+                    {"explain": _comando_para_explain(comando), "verbosity": "queryPlanner"}
+                )
+                registro["explain"] = resumir_explain(explain)
+                with self._lock:
+                    self._explicados[forma] = (time.monotonic(), registro["explain"])
+            except Exception as e:
+                registro["explain"] = {"erro": str(e)}
+            self._gravar(registro)
+
+    def _gravar(self, registro):
+        registro = json.loads(json_util.dumps(registro))
+        self.recentes.append(registro)
+        explain = registro.get("explain", {})
+        print(
+            f"🐢 Consulta lenta ({registro['duracao_ms']} ms) em {registro['endpoint']}: "
+            f"{registro['comando']} {registro['collection']} "
+            f"collscan={explain.get('collscan')} índices={explain.get('indices')}"
+        )
+        if self.arquivo:
+            try:
+                with self._lock:
+                    with open(self.arquivo, "a", encoding="utf-8") as arquivo:
+                        arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️  Não foi possível gravar o log de consultas lentas: {e}")
+
@@ -0,0 +1,162 @@
+"""
+Bundle pré-calculado da primeira tela do dashboard
+
+A tela inicial precisa de anos, empresas, totais por mês e top empresas; em vez de
+quatro consultas sobre a coleção bruta, um bundle por visão ("geral" e um por ano) é
+montado a partir do rollup mensal logo depois de cada ingestão e guardado em Mongo
+já serializado (JSON) e, opcionalmente, comprimido (gzip). GET /api/dashboard só lê
+um documento pelo _id e devolve os bytes.
+
+O ETag é o hash do conteúdo (sem gerado_em): rematerializar sem mudança nos dados
+não invalida o cache do navegador.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+from rollup import ROLLUP_COLLECTION
+
+DASHBOARD_COLLECTION = "dashboard_bundles"
+CHAVE_GERAL = "geral"
+TOP_EMPRESAS = 10
+
+
+class DashboardMaterializado:
+    """Monta, grava e lê os bundles do dashboard a partir do rollup mensal"""
+
+    def __init__(self, db, nivel_gzip=None):
+        self.rollup = db[ROLLUP_COLLECTION]
+        self.collection = db[DASHBOARD_COLLECTION]
+        self.nivel_gzip = nivel_gzip if nivel_gzip is not None else int(os.getenv("DASHBOARD_GZIP_LEVEL", "6"))
+
+    def anos(self):
+        return sorted((ano for ano in self.rollup.distinct("ANO") if ano), reverse=True)
+
+    def montar(self, ano=None, anos=None):
+        """Conteúdo do bundle (mesmo formato de /api/dados/agregados, /api/empresas e /api/anos)"""
+        filtro = {"ANO": ano} if ano else {}
+        agregados = list(self.rollup.aggregate([
+            {"$match": filtro},
+            {
+                "$group": {
+                    "_id": "$MES_REFERENCIA",
+                    "total_venda": {"$sum": "$total_venda"},
+                    "total_compra": {"$sum": "$total_compra"},
+                    "quantidade_registros": {"$sum": "$registros"},
+                    "quantidade_empresas": {"$sum": 1}
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "mes": "$_id",
+                    "total_venda": 1,
+                    "total_compra": 1,
+                    "quantidade_registros": 1,
+                    "quantidade_empresas": 1,
+                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]}
+                }
+            },
+            {"$sort": {"mes": 1}}
+        ]))
+        top_empresas = list(self.rollup.aggregate([
+            {"$match": filtro},
+            {
+                "$group": {
+                    "_id": "$NOME_EMPRESARIAL",
+                    "total_venda": {"$sum": "$total_venda"},
+                    "total_compra": {"$sum": "$total_compra"},
+                    "meses_ativos": {"$sum": 1}
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "empresa": "$_id",
+                    "total_venda": 1,
+                    "total_compra": 1,
+                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
+                    "meses_ativos": 1
+                }
+            },
+            {"$sort": {"saldo_liquido": -1}},
+            {"$limit": TOP_EMPRESAS}
+        ]))
+        empresas = sorted(empresa for empresa in self.rollup.distinct("NOME_EMPRESARIAL", filtro) if empresa)
+
+        total_venda = sum(linha["total_venda"] for linha in agregados)
+        total_compra = sum(linha["total_compra"] for linha in agregados)
+        return {
+            "ano": ano,
+            "anos": anos if anos is not None else self.anos(),
+            "empresas": empresas,
+            "agregados": agregados,
+            "top_empresas": top_empresas,
+            "resumo": {
+                "total_registros": sum(linha["quantidade_registros"] for linha in agregados),
+                "quantidade_empresas": len(empresas),
+                "meses": [linha["mes"] for linha in agregados],
+                "total_venda": total_venda,
+                "total_compra": total_compra,
+                "saldo_liquido": total_venda - total_compra
+            }
+        }
+
+    def materializar_ano(self, ano=None, anos=None):
+        """Monta e grava o bundle de um ano (None = visão geral)"""
+        bundle = self.montar(ano, anos)
+        etag = hashlib.sha1(json.dumps(bundle, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+        agora = datetime.now()
+        bundle["gerado_em"] = agora.isoformat()
+        corpo = json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        comprimido = gzip.compress(corpo, compresslevel=self.nivel_gzip) if self.nivel_gzip > 0 else None
+        documento = {
+            "_id": ano or CHAVE_GERAL,
+            "etag": etag,
+            "json": corpo,
+            "gzip": comprimido,
+            "bytes": len(corpo),
+            "bytes_gzip": len(comprimido) if comprimido else None,
+            "gerado_em": agora
+        }
+        self.collection.replace_one({"_id": documento["_id"]}, documento, upsert=True)
+        return documento
+
+    def materializar(self):
+        """Regrava a visão geral e a de cada ano; remove bundles de anos que sumiram"""
+        inicio = time.perf_counter()
+        anos = self.anos()
+        documentos = [self.materializar_ano(ano, anos) for ano in [None, *anos]]
+        self.collection.delete_many({"_id": {"$nin": [CHAVE_GERAL, *anos]}})
+        total = sum(documento["bytes"] for documento in documentos)
+        total_gzip = sum(documento["bytes_gzip"] or documento["bytes"] for documento in documentos)
+        print(f"🧱 Dashboard materializado: {len(documentos)} bundles "
+              f"({total / 1024:,.1f} KB, {total_gzip / 1024:,.1f} KB gzip) em {time.perf_counter() - inicio:.2f}s")
+        return {"bundles": len(documentos), "bytes": total, "bytes_gzip": total_gzip}
+
+    def obter(self, ano=None):
+        """
+        Bundle gravado do ano (ou da visão geral), montado na hora se ainda não existir
+
+        Returns:
+            dict ou None se o ano não tiver dados
+        """
+        documento = self.collection.find_one({"_id": ano or CHAVE_GERAL})
+        if documento is not None:
+            return documento
+        anos = self.anos()
+        if ano and ano not in anos:
+            return None
+        return self.materializar_ano(ano, anos)
+
+
+def materializar_dashboard(db):
+    """Rematerializa após uma ingestão; uma falha aqui não desfaz a carga"""
+    try:
+        return DashboardMaterializado(db).materializar()
+    except Exception as e:
+        print(f"⚠️  Falha ao materializar o dashboard: {e}")
+        return None
@@ -1,10 +1,20 @@
+import argparse
 import requests
 import json
 from pymongo import MongoClient
-from datetime import datetime
 import sys
 import os
 import time
+from rollup import MonthlyRollup
+from dashboard import materializar_dashboard
+from indices import garantir_indices
+from publicacao import PublicadorMes, PublicacaoInvalida
+from versoes import filtro_visivel
+from eventos import barramento, ProgressoPaginas
+from importacao import ImportadorOffline
+from descoberta import DescobertaCKAN
+from memoria import perfil_memoria
+from lease import LeaseMongo, LeaseOcupado, LEASE_ATUALIZACAO
 
 class CCEEDataLoader:
     def __init__(self):
@@ -22,6 +32,8 @@ class CCEEDataLoader:
             self.client = MongoClient(MONGODB_URI)
             self.db = self.client[MONGODB_DB]
             self.collection = self.db["energy_contracts"]
+            self.rollup = MonthlyRollup(self.db)
+            self.publicador = PublicadorMes(self.db)
             
             # Testar conexão e autenticação
             self.client.admin.command('ping')
@@ -33,28 +45,30 @@ class CCEEDataLoader:
                 print(f"📁 Database {MONGODB_DB} será criado na primeira inserção")
             else:
                 print(f"📁 Database {MONGODB_DB} encontrado")
+            
+            # Índices uma vez por processo (rollup e staging dependem deles), não a cada carga
+            self.create_indexes()
                 
         except Exception as e:
             print(f"❌ Erro de autenticação/conexão: {e}")
             print(f"💡 Verifique se o MongoDB está rodando e as credenciais estão corretas")
             sys.exit(1)
         
-        # Resource IDs conhecidos
-        self.resource_ids = {
-            "2024": "f6b478a0-bf4d-4d18-8f7f-067d01fefbd0",
-            "2025": "e14c30bf-e02e-40a5-afd2-0491e41e03c7"
-        }
+        # API CCEE (CKAN) - configurável para testes/benchmark com servidor local
+        self.api_url = os.getenv("CCEE_API_URL", "https://dadosabertos.ccee.org.br/api/3/action")
+        self.page_delay = float(os.getenv("CCEE_PAGE_DELAY", "0.3"))
+        
+        # Resource de cada ano descoberto via package_show (cache em Mongo)
+        self.descoberta = DescobertaCKAN(self.db, self.api_url)
     
     def get_resource_id(self, ano):
-        """Tenta encontrar o resource ID para o ano"""
-        if ano in self.resource_ids:
-            return self.resource_ids[ano]
-        
-        print(f"🔍 Resource ID não conhecido para {ano}, tentando descobrir...")
-        latest_known = max(self.resource_ids.keys())
-        print(f"💡 Usando resource ID do ano mais recente conhecido: {latest_known}")
-        return self.resource_ids[latest_known]
+        """Resource ID do ano pelo catálogo CKAN (None se o ano não existir no dataset)"""
+        resource_id = self.descoberta.resource_id(ano)
+        if not resource_id:
+            print(f"❌ Nenhum resource da CCEE para {ano}")
+        return resource_id
     
+    @perfil_memoria.medir("loader.download_mes")
     def fetch_data_for_month(self, ano, mes):
         """Busca dados de um mês específico da API CCEE com paginação completa"""
         resource_id = self.get_resource_id(ano)
@@ -74,10 +88,11 @@ class CCEEDataLoader:
         max_records = 50000
         total_records = None
         page = 1
+        progresso = ProgressoPaginas(mes_referencia)
         
         try:
             while len(all_records) < max_records:
-                url = f"https://dadosabertos.ccee.org.br/api/3/action/datastore_search?resource_id={resource_id}&filters={filters_json}&limit={limit}&offset={offset}"
+                url = f"{self.api_url}/datastore_search?resource_id={resource_id}&filters={filters_json}&limit={limit}&offset={offset}"
                 
                 print(f"   📄 Página {page}...")
                 
@@ -99,13 +114,21 @@ class CCEEDataLoader:
                     if records:
                         all_records.extend(records)
                         print(f"   ✅ Página {page}: +{len(records):,} registros (Total: {len(all_records):,})")
+                        barramento.publicar("pagina", **progresso.pagina(len(records), total_records))
                         
                         if len(records) < limit or len(all_records) >= total_records:
                             break
                         
                         offset += limit
                         page += 1
-                        time.sleep(0.3)
+                        time.sleep(self.page_delay)
+                    elif page == 1:
+                        # Mês não está no resource atual: recarrega o catálogo e tenta o novo, se houver
+                        novo_resource = self.descoberta.apos_falha(ano)
+                        if not novo_resource:
+                            break
+                        resource_id = novo_resource
+                        total_records = None
                     else:
                         break
                 else:
@@ -129,44 +152,13 @@ class CCEEDataLoader:
             print(f"❌ Erro ao buscar {mes_referencia}: {e}")
             return None
     
-    def save_data_fast_insert(self, data):
-        """
-        SALVAMENTO RÁPIDO - apenas INSERT para carga inicial
-        """
-        if not data:
-            print("❌ Nenhum dado para salvar")
-            return 0
-        
-        print("💾 Salvando dados (INSERT RÁPIDO)...")
-        
-        # Remove _ids para evitar conflitos
-        for record in data:
-            if '_id' in record:
-                del record['_id']
-            record['DATA_CARREGAMENTO'] = datetime.now()
-        
-        try:
-            # INSERÇÃO EM LOTE - MUITO MAIS RÁPIDO
-            result = self.collection.insert_many(data, ordered=False)
-            print(f"✅ INSERT concluído: {len(result.inserted_ids):,} registros")
-            return len(result.inserted_ids)
-            
-        except Exception as e:
-            print(f"❌ Erro no INSERT: {e}")
-            # Fallback: inserção um por um
-            successful_inserts = 0
-            for record in data:
-                try:
-                    self.collection.insert_one(record)
-                    successful_inserts += 1
-                except Exception as single_error:
-                    continue
-            print(f"✅ Fallback: {successful_inserts:,} registros inseridos")
-            return successful_inserts
+    def lease_atualizacao(self):
+        """Mesmo lease da API/agendador e do data_updater: um único escritor em energy_contracts por vez"""
+        return LeaseMongo(self.db, LEASE_ATUALIZACAO)
     
     def check_existing_data(self, mes_referencia):
         """Verifica se já existem dados para o mês"""
-        count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia})
+        count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.db)})
         return count > 0
     
     def delete_month_data(self, ano, mes):
@@ -174,7 +166,7 @@ class CCEEDataLoader:
         mes_referencia = f"{ano}{mes:02d}"
         
         # Verifica se existe
-        existing_count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia})
+        existing_count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.db)})
         if existing_count == 0:
             print(f"ℹ️  {mes_referencia} não existe no banco")
             return 0
@@ -187,37 +179,60 @@ class CCEEDataLoader:
         
         # Apaga os dados
         try:
-            result = self.collection.delete_many({"MES_REFERENCIA": mes_referencia})
+            with self.lease_atualizacao():
+                result = self.collection.delete_many({"MES_REFERENCIA": mes_referencia})
+                self.rollup.collection.delete_many({"MES_REFERENCIA": mes_referencia})
+                materializar_dashboard(self.db)
             print(f"🗑️  {result.deleted_count:,} registros de {mes_referencia} removidos")
             return result.deleted_count
+        except LeaseOcupado as e:
+            print(f"⏭️  Atualização em andamento em outro processo: {e}")
+            return 0
         except Exception as e:
             print(f"❌ Erro ao apagar {mes_referencia}: {e}")
             return 0
     
-    def reload_month_data(self, ano, mes):
+    def reload_month_data(self, ano, mes, forcar=False):
         """
-        RECARREGA um mês específico: apaga e baixa novamente
-        Útil quando faltam dados ou há problemas
+        RECARREGA um mês específico: baixa novamente e troca o mês de uma vez
+        Útil quando faltam dados ou há problemas. Os dados atuais continuam
+        publicados até o mês novo estar completo e validado
         """
         mes_referencia = f"{ano}{mes:02d}"
         
-        print(f"🔄 RECARREGANDO {mes_referencia}...")
-        
-        # Primeiro apaga os dados existentes
-        deleted_count = self.delete_month_data(ano, mes)
-        if deleted_count == 0:
+        existing_count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.db)})
+        if existing_count == 0:
+            print(f"ℹ️  {mes_referencia} não existe no banco")
             return 0
         
-        # Depois busca e salva novos dados
-        print(f"📥 Buscando {mes_referencia}...")
-        records = self.fetch_data_for_month(ano, mes)
+        # Confirmação
+        confirm = input(f"⚠️  Recarregar {mes_referencia} ({existing_count:,} registros atuais)? (s/N): ")
+        if confirm.lower() != 's':
+            print("❌ Operação cancelada")
+            return 0
         
-        if records:
-            saved_count = self.save_data_fast_insert(records)
-            print(f"✅ {mes_referencia}: {saved_count:,} registros recarregados")
-            return saved_count
-        else:
-            print(f"❌ Não foi possível carregar dados para {mes_referencia}")
+        # Os dados atuais seguem publicados; o lease só impede outra carga simultânea
+        try:
+            with self.lease_atualizacao():
+                print(f"🔄 RECARREGANDO {mes_referencia}...")
+                print(f"📥 Buscando {mes_referencia}...")
+                records = self.fetch_data_for_month(ano, mes)
+                
+                if not records:
+                    print(f"❌ Não foi possível carregar dados para {mes_referencia} (dados atuais mantidos)")
+                    return 0
+                
+                try:
+                    resultado = self.publicador.publicar(mes_referencia, records, forcar=forcar)
+                except PublicacaoInvalida as e:
+                    print(f"❌ Recarga recusada: {e}")
+                    print(f"💡 Os dados publicados de {mes_referencia} não foram alterados")
+                    return 0
+                
+                print(f"✅ {mes_referencia}: {resultado['registros']:,} registros recarregados")
+                return resultado["registros"]
+        except LeaseOcupado as e:
+            print(f"⏭️  Atualização em andamento em outro processo: {e}")
             return 0
     
     def remove_duplicate_ids(self, records):
@@ -257,30 +272,42 @@ class CCEEDataLoader:
         
         total_records = 0
         months_processed = 0
+        encenados = []
         
-        for mes in meses:
-            mes_referencia = f"{ano}{mes:02d}"
-            
-            # VERIFICA se o mês já existe - se existir, PULA
-            if self.check_existing_data(mes_referencia):
-                existing_count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia})
-                print(f"⏭️  {mes_referencia} já existe ({existing_count:,} registros), pulando...")
-                continue
-            
-            print(f"📥 Buscando {mes_referencia}...")
-            records = self.fetch_data_for_month(ano, mes)
-            
-            if records:
-                saved_count = self.save_data_fast_insert(records)
-                total_records += saved_count
-                months_processed += 1
-                print(f"✅ {mes_referencia}: {saved_count:,} registros")
-            else:
-                print(f"⚠️  Sem dados para {mes_referencia}")
-        
-        # Cria índices apenas se adicionou dados novos
-        if total_records > 0:
-            self.create_indexes()
+        # Verificação dos meses e publicação sob o mesmo lease do agendador/data_updater
+        try:
+            with self.lease_atualizacao():
+                for mes in meses:
+                    mes_referencia = f"{ano}{mes:02d}"
+                    
+                    # VERIFICA se o mês já existe - se existir, PULA
+                    if self.check_existing_data(mes_referencia):
+                        existing_count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.db)})
+                        print(f"⏭️  {mes_referencia} já existe ({existing_count:,} registros), pulando...")
+                        continue
+                    
+                    print(f"📥 Buscando {mes_referencia}...")
+                    records = self.fetch_data_for_month(ano, mes)
+                    
+                    if records:
+                        try:
+                            encenado = self.publicador.encenar(mes_referencia, records)
+                        except PublicacaoInvalida as e:
+                            print(f"❌ {mes_referencia} recusado: {e}")
+                            continue
+                        encenados.append(encenado)
+                        total_records += encenado["registros"]
+                        months_processed += 1
+                        print(f"✅ {mes_referencia}: {encenado['registros']:,} registros no staging")
+                    else:
+                        print(f"⚠️  Sem dados para {mes_referencia}")
+                
+                # Publica os meses validados (cada troca custa o mês) e rematerializa o dashboard uma vez
+                if encenados:
+                    self.publicador.trocar(encenados)
+        except LeaseOcupado as e:
+            print(f"⏭️  Atualização em andamento em outro processo: {e}")
+            return 0
         
         print(f"📈 {ano}: {total_records:,} registros em {months_processed} meses")
         return total_records
@@ -288,10 +315,7 @@ class CCEEDataLoader:
     def create_indexes(self):
         """Cria índices para performance"""
         try:
-            self.collection.create_index("NOME_EMPRESARIAL")
-            self.collection.create_index("MES_REFERENCIA")
-            self.collection.create_index("CODIGO_PERFIL_AGENTE")
-            self.collection.create_index([("MES_REFERENCIA", 1), ("CODIGO_PERFIL_AGENTE", 1)])
+            garantir_indices(self.db)
             print("📊 Índices criados/atualizados")
         except Exception as e:
             print(f"⚠️  Erro nos índices: {e}")
@@ -321,7 +345,14 @@ class CCEEDataLoader:
         """Limpa todo o banco de dados"""
         confirm = input("⚠️  TEM CERTEZA que quer limpar TODOS os dados? (s/N): ")
         if confirm.lower() == 's':
-            result = self.collection.delete_many({})
+            try:
+                with self.lease_atualizacao():
+                    result = self.collection.delete_many({})
+                    self.rollup.clear()
+                    materializar_dashboard(self.db)
+            except LeaseOcupado as e:
+                print(f"⏭️  Atualização em andamento em outro processo: {e}")
+                return False
             print(f"🗑️  {result.deleted_count:,} registros removidos")
             return True
         else:
@@ -356,12 +387,63 @@ class CCEEDataLoader:
             self.client.close()
             print("🔌 Conexão com MongoDB fechada")
 
+def importar_dumps(argumentos):
+    """Modo não interativo: carga offline a partir de dumps JSON/CSV"""
+    parser = argparse.ArgumentParser(
+        prog="data_loader.py importar",
+        description="Carga offline de energy_contracts a partir de dumps JSON/CSV (sem acessar a API)"
+    )
+    parser.add_argument("arquivos", nargs="+", help="Arquivos .json, .csv (ou .gz) exportados")
+    parser.add_argument("--workers", type=int, default=4, help="Threads de inserção no MongoDB")
+    parser.add_argument("--lote", type=int, default=20000, help="Documentos por insert_many")
+    parser.add_argument("--substituir", action="store_true", help="Substitui meses que já existem (troca no final, sem janela vazia)")
+    parser.add_argument("--database", default=None, help="Database de destino (padrão: MONGODB_DB)")
+    args = parser.parse_args(argumentos)
+    
+    faltando = [arquivo for arquivo in args.arquivos if not os.path.exists(arquivo)]
+    if faltando:
+        parser.error(f"arquivos não encontrados: {', '.join(faltando)}")
+    if args.database:
+        os.environ["MONGODB_DB"] = args.database
+    
+    loader = CCEEDataLoader()
+    try:
+        importador = ImportadorOffline(loader, args.workers, args.lote, args.substituir)
+        # Mesmo lease da API/agendador: a importação não concorre com outra carga
+        with loader.lease_atualizacao():
+            resultado = importador.importar(args.arquivos)
+        print(f"📅 Meses carregados: {', '.join(resultado['meses_carregados']) or 'nenhum'}")
+        if resultado["meses_pulados"]:
+            print(f"⏭️  Meses pulados (já existiam): {', '.join(resultado['meses_pulados'])}")
+        if resultado["meses_recusados"]:
+            print(f"❌ Meses recusados na validação: {', '.join(resultado['meses_recusados'])}")
+    except LeaseOcupado as e:
+        print(f"⏭️  Atualização em andamento em outro processo: {e}")
+    finally:
+        loader.close_connection()
+
 def main():
+    argumentos = sys.argv[1:]
+    # --perfil-memoria: tracemalloc em cada etapa (download, insert, publicação) e relatório no final
+    if "--perfil-memoria" in argumentos:
+        argumentos.remove("--perfil-memoria")
+        perfil_memoria.iniciar(int(os.getenv("MEMORY_PROFILING_FRAMES", "10")))
+    
+    try:
+        if argumentos and argumentos[0] == "importar":
+            importar_dumps(argumentos[1:])
+        else:
+            menu_interativo()
+    finally:
+        if perfil_memoria.ativo:
+            perfil_memoria.imprimir_relatorio()
+
+def menu_interativo():
     loader = CCEEDataLoader()
     
     print("🚀 CARREGADOR DE DADOS CCEE - CARGA INICIAL")
     print("💡 Apenas meses NOVOS (não sobrescreve existentes)")
-    print(f"📚 Resource IDs conhecidos: {list(loader.resource_ids.keys())}")
+    print(f"📚 Anos no catálogo CKAN: {sorted(loader.descoberta.anos())}")
     
     try:
         while True:
@@ -403,17 +485,24 @@ def main():
                 if loader.is_valid_year(ano) and loader.is_valid_month(mes):
                     mes_referencia = f"{ano}{int(mes):02d}"
                     
-                    if loader.check_existing_data(mes_referencia):
-                        existing_count = loader.collection.count_documents({"MES_REFERENCIA": mes_referencia})
-                        print(f"❌ {mes_referencia} já existe ({existing_count:,} registros)")
-                        continue
-                    
-                    records = loader.fetch_data_for_month(ano, int(mes))
-                    if records:
-                        saved_count = loader.save_data_fast_insert(records)
-                        print(f"✅ {mes_referencia}: {saved_count:,} registros carregados")
-                    else:
-                        print(f"❌ Não foi possível carregar dados para {mes_referencia}")
+                    try:
+                        with loader.lease_atualizacao():
+                            if loader.check_existing_data(mes_referencia):
+                                existing_count = loader.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(loader.db)})
+                                print(f"❌ {mes_referencia} já existe ({existing_count:,} registros)")
+                                continue
+                            
+                            records = loader.fetch_data_for_month(ano, int(mes))
+                            if records:
+                                try:
+                                    resultado = loader.publicador.publicar(mes_referencia, records)
+                                    print(f"✅ {mes_referencia}: {resultado['registros']:,} registros carregados")
+                                except PublicacaoInvalida as e:
+                                    print(f"❌ Carga recusada: {e}")
+                            else:
+                                print(f"❌ Não foi possível carregar dados para {mes_referencia}")
+                    except LeaseOcupado as e:
+                        print(f"⏭️  Atualização em andamento em outro processo: {e}")
                 else:
                     print("❌ Ano deve estar entre 2000-2100, mês deve ser 01-12")
             
@@ -5,6 +5,8 @@ from datetime import datetime
 import sys
 import os
 import time
+from lease import LeaseMongo, LeaseOcupado, LEASE_ATUALIZACAO
+from descoberta import DescobertaCKAN
 
 class CCEEDataUpdater:
     def __init__(self):
@@ -27,10 +29,9 @@ class CCEEDataUpdater:
             print(f"❌ Erro de conexão: {e}")
             sys.exit(1)
         
-        self.resource_ids = {
-            "2024": "f6b478a0-bf4d-4d18-8f7f-067d01fefbd0",
-            "2025": "e14c30bf-e02e-40a5-afd2-0491e41e03c7"
-        }
+        self.api_url = os.getenv("CCEE_API_URL", "https://dadosabertos.ccee.org.br/api/3/action")
+        
+        self.descoberta = DescobertaCKAN(self.db, self.api_url)
     
     def get_latest_stored_month(self):
         """Pega o último MES_REFERENCIA do nosso banco"""
@@ -59,23 +60,26 @@ class CCEEDataUpdater:
         else:
             return ano, mes + 1
     
+    def probe_month(self, resource_id, mes_referencia):
+        """Sonda com limit=1: True se o resource tem registros do mês"""
+        filters_json = json.dumps({"MES_REFERENCIA": mes_referencia})
+        url = f"{self.api_url}/datastore_search?resource_id={resource_id}&filters={filters_json}&limit=1"
+        data = requests.get(url, timeout=10).json()
+        return bool(data.get("success") and data["result"]["records"])
+    
     def check_month_exists_in_api(self, ano, mes):
         """Verifica se um mês existe na API CCEE"""
         try:
-            from data_loader import CCEEDataLoader
-            loader = CCEEDataLoader()
-            resource_id = loader.get_resource_id(str(ano))
-            
             mes_referencia = f"{ano}{mes:02d}"
-            filters = {"MES_REFERENCIA": mes_referencia}
-            filters_json = json.dumps(filters)
-            
-            url = f"https://dadosabertos.ccee.org.br/api/3/action/datastore_search?resource_id={resource_id}&filters={filters_json}&limit=1"
+            resource_id = self.descoberta.resource_id(ano)
+            exists = bool(resource_id) and self.probe_month(resource_id, mes_referencia)
             
-            response = requests.get(url, timeout=10)
-            data = response.json()
+            if not exists:
+                # Sonda falhou: o catálogo pode estar desatualizado (ano novo ou resource trocado)
+                novo_resource = self.descoberta.apos_falha(ano)
+                if novo_resource:
+                    exists = self.probe_month(novo_resource, mes_referencia)
             
-            exists = data.get("success") and data["result"]["records"]
             print(f"🔍 {ano}-{mes:02d} na API: {'✅' if exists else '❌'}")
             return exists
             
@@ -93,7 +97,8 @@ class CCEEDataUpdater:
             records = loader.fetch_data_for_month(ano, mes)
             
             if records:
-                saved_count = loader.save_data_fast_insert(records)
+                # Staging + troca atômica: o mês só aparece quando estiver completo
+                saved_count = loader.publicador.publicar(f"{ano}{mes:02d}", records)["registros"]
                 print(f"✅ {ano}-{mes:02d}: {saved_count:,} registros")
                 return saved_count
             else:
@@ -142,8 +147,12 @@ def main():
     print("💡 Busca apenas o mês SEGUINTE ao último no banco")
     
     try:
-        total = updater.update_new_data()
+        # Mesmo lease da API/agendador: nunca dois processos baixando o mesmo mês
+        with LeaseMongo(updater.db, LEASE_ATUALIZACAO):
+            total = updater.update_new_data()
         print(f"\n🎯 ATUALIZAÇÃO CONCLUÍDA: {total} registros")
+    except LeaseOcupado as e:
+        print(f"⏭️  Atualização já em andamento em outro processo: {e}")
     except Exception as e:
         print(f"❌ Erro: {e}")
     finally:
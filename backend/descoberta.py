@@ -0,0 +1,206 @@
+"""
+Descoberta dos resources CKAN da CCEE por ano
+
+Em vez de resource IDs fixos no código, o catálogo ano -> resource é montado a
+partir do package_show do dataset (o pacote vem de CCEE_CKAN_PACKAGE ou do
+resource_show de um resource conhecido) e guardado em Mongo com validade
+(CCEE_CATALOG_TTL_HOURS), compartilhado entre API, loader e updater.
+
+Uma consulta normal não faz chamada nenhuma à CCEE: o catálogo fica em memória e
+em Mongo. Ele só é recarregado quando expira ou quando a sonda de um mês não acha
+registros (ano novo ou resource trocado), no máximo uma vez a cada
+CCEE_CATALOG_MIN_REFRESH_SECONDS entre todos os processos, com ou sem sucesso: com o
+CKAN fora do ar o catálogo vencido continua valendo até a próxima tentativa.
+
+Prioridade: CCEE_RESOURCE_<ANO> no ambiente > catálogo descoberto > IDs conhecidos
+do próprio ano. Um ano sem resource retorna None: nunca se usa o de outro ano.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import requests
+
+CATALOGO_COLLECTION = "catalogo_ckan"
+ID_CATALOGO = "ccee"
+ID_TENTATIVA = "tentativa"
+
+# Último recurso se a API de metadados estiver fora, e semente para o resource_show
+RESOURCES_CONHECIDOS = {
+    "2024": "f6b478a0-bf4d-4d18-8f7f-067d01fefbd0",
+    "2025": "e14c30bf-e02e-40a5-afd2-0491e41e03c7"
+}
+
+PADRAO_ANO = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+
+
+def resources_fixos():
+    """Resources fixados por ano no ambiente (CCEE_RESOURCE_2025=...)"""
+    fixos = {}
+    for chave, valor in os.environ.items():
+        encontrado = re.fullmatch(r"CCEE_RESOURCE_(\d{4})", chave)
+        if encontrado and valor:
+            fixos[encontrado.group(1)] = valor
+    return fixos
+
+
+def ano_do_resource(resource):
+    """Ano de um resource pelo nome, descrição ou URL (None se não houver)"""
+    for campo in ("name", "description", "url"):
+        encontrado = PADRAO_ANO.search(resource.get(campo) or "")
+        if encontrado:
+            return encontrado.group(1)
+    return None
+
+
+def mapear_resources(resources):
+    """Ano -> resource ID; com vários resources no mesmo ano vence o modificado por último"""
+    escolhidos = {}
+    for resource in resources:
+        if resource.get("datastore_active") is False:
+            continue
+        ano = ano_do_resource(resource)
+        if not ano:
+            continue
+        modificado = resource.get("last_modified") or resource.get("metadata_modified") or resource.get("created") or ""
+        if ano not in escolhidos or modificado > escolhidos[ano][0]:
+            escolhidos[ano] = (modificado, resource["id"])
+    return {ano: resource_id for ano, (_, resource_id) in escolhidos.items()}
+
+
+class DescobertaCKAN:
+    """Catálogo ano -> resource do dataset da CCEE, com cache em memória e em Mongo"""
+
+    def __init__(self, db, api_url, get=None, pacote=None, ttl_horas=None, intervalo_minimo=None):
+        self.colecao = db[CATALOGO_COLLECTION]
+        self.api_url = api_url
+        self.get = get or requests.get
+        self.pacote = pacote or os.getenv("CCEE_CKAN_PACKAGE")
+        self.ttl = timedelta(hours=ttl_horas if ttl_horas is not None else float(os.getenv("CCEE_CATALOG_TTL_HOURS", "24")))
+        self.intervalo_minimo = (
+            intervalo_minimo if intervalo_minimo is not None
+            else float(os.getenv("CCEE_CATALOG_MIN_REFRESH_SECONDS", "300"))
+        )
+        self.fixos = resources_fixos()
+        self._catalogo = None
+        self._ultima_atualizacao = None
+        self._lock = threading.Lock()
+
+    def _chamar(self, acao, **params):
+        url = f"{self.api_url}/{acao}?{urlencode(params)}"
+        response = self.get(url, timeout=30)
+        response.raise_for_status()
+        dados = response.json()
+        if not dados.get("success"):
+            raise RuntimeError(f"{acao} falhou: {dados.get('error')}")
+        return dados["result"]
+
+    def _descobrir_pacote(self):
+        if self.pacote:
+            return self.pacote
+        sementes = list(dict.fromkeys([*self.fixos.values(), *RESOURCES_CONHECIDOS.values()]))
+        for resource_id in sementes:
+            try:
+                self.pacote = self._chamar("resource_show", id=resource_id)["package_id"]
+                return self.pacote
+            except Exception as e:
+                print(f"⚠️  resource_show {resource_id[:8]} falhou: {e}")
+        raise RuntimeError("nenhum resource conhecido para descobrir o pacote CKAN")
+
+    def _tentou_ha_pouco(self):
+        """Releitura do CKAN (com ou sem sucesso) dentro do intervalo mínimo, neste ou em outro processo"""
+        if self._ultima_atualizacao is not None and time.monotonic() - self._ultima_atualizacao < self.intervalo_minimo:
+            return True
+        tentativa = self.colecao.find_one({"_id": ID_TENTATIVA})
+        return bool(tentativa) and datetime.utcnow() - tentativa["em"] < timedelta(seconds=self.intervalo_minimo)
+
+    def atualizar(self):
+        """Relê o package_show e grava o catálogo em Mongo; mantém o anterior se falhar"""
+        self._ultima_atualizacao = time.monotonic()
+        self.colecao.replace_one({"_id": ID_TENTATIVA}, {"_id": ID_TENTATIVA, "em": datetime.utcnow()}, upsert=True)
+        try:
+            pacote = self._descobrir_pacote()
+            resultado = self._chamar("package_show", id=pacote)
+        except Exception as e:
+            print(f"⚠️  Descoberta CKAN indisponível: {e}")
+            return None
+
+        agora = datetime.utcnow()
+        catalogo = {
+            "_id": ID_CATALOGO,
+            "pacote": resultado.get("name") or pacote,
+            "anos": mapear_resources(resultado.get("resources", [])),
+            "atualizado_em": agora,
+            "expira_em": agora + self.ttl
+        }
+        self.colecao.replace_one({"_id": ID_CATALOGO}, catalogo, upsert=True)
+        self._catalogo = catalogo
+        print(f"📚 Catálogo CKAN atualizado ({catalogo['pacote']}): anos {sorted(catalogo['anos'])}")
+        return catalogo
+
+    def _carregar(self):
+        """
+        Catálogo válido da memória, de Mongo ou, se expirado, do CKAN; até o intervalo
+        mínimo passar desde a última tentativa, o último conhecido (mesmo vencido)
+        """
+        agora = datetime.utcnow()
+        if self._catalogo and self._catalogo["expira_em"] > agora:
+            return self._catalogo
+        with self._lock:
+            if self._catalogo and self._catalogo["expira_em"] > agora:
+                return self._catalogo
+            salvo = self.colecao.find_one({"_id": ID_CATALOGO})
+            if salvo and salvo["expira_em"] > agora:
+                self._catalogo = salvo
+                return salvo
+            self._catalogo = self._catalogo or salvo
+            if self._tentou_ha_pouco():
+                return self._catalogo
+            return self.atualizar() or self._catalogo
+
+    def anos(self):
+        """Mapa efetivo ano -> resource (fixos no ambiente têm prioridade)"""
+        catalogo = self._carregar()
+        return {**RESOURCES_CONHECIDOS, **(catalogo["anos"] if catalogo else {}), **self.fixos}
+
+    def resource_id(self, ano):
+        """Resource do ano, ou None se o ano não existir no dataset"""
+        ano = str(ano)
+        resource_id = self.anos().get(ano)
+        if resource_id is None:
+            resource_id = self.apos_falha(ano)
+        return resource_id
+
+    def apos_falha(self, ano):
+        """
+        Chamado quando a sonda de um mês não encontra registros: recarrega o catálogo
+        (respeitando o intervalo mínimo) e retorna o resource do ano se ele mudou
+        """
+        ano = str(ano)
+        if ano in self.fixos:
+            return None
+        with self._lock:
+            if self._tentou_ha_pouco():
+                return None
+            salvo = self._catalogo or self.colecao.find_one({"_id": ID_CATALOGO}) or {}
+            anterior = salvo.get("anos", {}).get(ano)
+            catalogo = self.atualizar()
+        novo = catalogo["anos"].get(ano) if catalogo else None
+        if novo and novo != anterior:
+            print(f"🔎 Resource de {ano} descoberto: {novo}")
+            return novo
+        return None
+
+    def estado(self):
+        """Catálogo em cache, sem chamar o CKAN (para /api/config)"""
+        catalogo = self._catalogo or self.colecao.find_one({"_id": ID_CATALOGO}) or {}
+        return {
+            "pacote": catalogo.get("pacote") or self.pacote,
+            "anos": {**RESOURCES_CONHECIDOS, **catalogo.get("anos", {}), **self.fixos},
+            "fixos": sorted(self.fixos),
+            "atualizado_em": catalogo.get("atualizado_em"),
+            "expira_em": catalogo.get("expira_em")
+        }
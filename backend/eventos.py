@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class Assinatura:
+    """Fila limitada de um assinante; se encher, descarta os eventos mais antigos"""
+
+    def __init__(self, loop, tamanho_fila):
+        self.loop = loop
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.descartados = 0
+
+    def _entregar(self, evento):
+        # Roda no event loop do assinante
+        if self.fila.full():
+            self.fila.get_nowait()
+            self.descartados += 1
+        self.fila.put_nowait(evento)
+
+    async def proximo(self, timeout=None):
+        return await asyncio.wait_for(self.fila.get(), timeout)
+
+
+class BarramentoEventos:
+    """
+    Barramento em processo para eventos de ingestão
+
+    publicar() pode ser chamado de qualquer thread e nunca bloqueia: cada assinante
+    recebe o evento via call_soon_threadsafe na própria fila limitada, então um
+    cliente lento só perde eventos antigos, sem atrasar a ingestão.
+
+    Os assinantes são do mesmo processo: com vários workers da API cada um tem o seu
+    barramento, e o SSE só mostra a ingestão do worker em que o cliente conectou.
+    """
+
+    def __init__(self, tamanho_fila=100, historico=50):
+        self.tamanho_fila = tamanho_fila
+        self.historico = deque(maxlen=historico)
+        self.publicados = 0
+        self._assinaturas = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publicar(self, tipo, **dados):
+        evento = {"id": next(self._ids), "tipo": tipo, "timestamp": datetime.now().isoformat(), **dados}
+        with self._lock:
+            self.historico.append(evento)
+            self.publicados += 1
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura._entregar, evento)
+            except RuntimeError:
+                # Loop já encerrado: assinatura órfã
+                self.cancelar(assinatura)
+        return evento
+
+    def assinar(self):
+        """Cria uma assinatura no event loop corrente"""
+        assinatura = Assinatura(asyncio.get_running_loop(), self.tamanho_fila)
+        with self._lock:
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def recentes(self, desde_id=0):
+        with self._lock:
+            return [evento for evento in self.historico if evento["id"] > desde_id]
+
+    def assinantes(self):
+        with self._lock:
+            return len(self._assinaturas)
+
+
+class ProgressoPaginas:
+    """Calcula vazão e ETA do download paginado de um mês"""
+
+    def __init__(self, mes_referencia, total=None):
+        self.mes_referencia = mes_referencia
+        self.total = total
+        self.paginas = 0
+        self.registros = 0
+        self.inicio = time.perf_counter()
+
+    def pagina(self, registros_pagina, total=None):
+        """Registra uma página e retorna os campos do evento 'pagina'"""
+        if total:
+            self.total = total
+        self.paginas += 1
+        self.registros += registros_pagina
+        segundos = max(time.perf_counter() - self.inicio, 1e-9)
+        vazao = self.registros / segundos
+        eta = None
+        if self.total and vazao > 0:
+            eta = round(max(self.total - self.registros, 0) / vazao, 1)
+        return {
+            "mes": self.mes_referencia,
+            "pagina": self.paginas,
+            "registros_pagina": registros_pagina,
+            "baixados": self.registros,
+            "total": self.total,
+            "registros_por_s": round(vazao, 1),
+            "paginas_por_s": round(self.paginas / segundos, 2),
+            "eta_s": eta
+        }
+
+
+barramento = BarramentoEventos()
@@ -0,0 +1,293 @@
+"""
+Gerador de dados sintéticos da CCEE para testes de escala
+
+Produz documentos no formato de energy_contracts a partir de uma semente e de um
+fator de escala: cardinalidade de empresas, perfis por empresa, meses, volumes
+com distribuição assimétrica (poucos agentes concentram a maior parte da energia)
+e revisões (o mesmo perfil/mês recarregado com valores corrigidos).
+
+A escala 1x tem a ordem de grandeza da base atual (~2.500 empresas, ~5.000 perfis
+por mês); 10x e 100x multiplicam empresas e perfis.
+
+Uso:
+    python gerador_dados.py mongo --escala 10 --database ccee_escala
+    python gerador_dados.py json --escala 1 --saida sintetico.json
+    python gerador_dados.py parquet --escala 100 --saida sintetico.parquet
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+EMPRESAS_POR_ESCALA = 2500
+
+CAMPOS = [
+    "MES_REFERENCIA", "NOME_EMPRESARIAL", "CNPJ", "CODIGO_PERFIL_AGENTE",
+    "SIGLA_PERFIL_AGENTE", "CONTRATACAO_VENDA", "CONTRATACAO_COMPRA", "DATA_CARREGAMENTO"
+]
+
+PREFIXOS = [
+    "ENERGISA", "EQUATORIAL", "COMERCIALIZADORA", "GERADORA", "CENTRAL EOLICA", "SOLAR",
+    "HIDRELETRICA", "TERMELETRICA", "INDUSTRIA", "SIDERURGICA", "MINERACAO", "SHOPPING",
+    "FRIGORIFICO", "TEXTIL", "QUIMICA", "PAPEL E CELULOSE", "CIMENTO", "AGROINDUSTRIAL"
+]
+REGIOES = [
+    "SUL", "NORTE", "NORDESTE", "SUDESTE", "CENTRO OESTE", "PAULISTA", "MINEIRA",
+    "BAIANA", "GAUCHA", "CAPIXABA", "PARANAENSE", "GOIANA", "PARAENSE", "POTIGUAR"
+]
+SUFIXOS = ["S.A.", "LTDA", "S/A", "EIRELI", "LTDA.", "SPE S.A."]
+
+
+def lista_meses(ano_inicio, quantidade):
+    """MES_REFERENCIA consecutivos a partir de janeiro de ano_inicio"""
+    meses = []
+    for i in range(quantidade):
+        ano, mes = divmod(i, 12)
+        meses.append(f"{ano_inicio + ano}{mes + 1:02d}")
+    return meses
+
+
+class GeradorCCEE:
+    """Gera documentos sintéticos determinísticos para uma semente e escala"""
+
+    def __init__(self, escala=1.0, meses=12, ano_inicio=2024, semente=42, taxa_revisao=0.01):
+        self.escala = escala
+        self.meses = lista_meses(ano_inicio, meses)
+        self.semente = semente
+        self.taxa_revisao = taxa_revisao
+        self.empresas = self._gerar_catalogo()
+
+    def _gerar_catalogo(self):
+        """Empresas com seus perfis, porte (escala do volume) e mês de entrada/saída"""
+        rnd = random.Random(self.semente)
+        quantidade = max(1, int(EMPRESAS_POR_ESCALA * self.escala))
+        empresas = []
+        codigo_perfil = 1
+        for i in range(quantidade):
+            nome = f"{rnd.choice(PREFIXOS)} {rnd.choice(REGIOES)} {i + 1:06d} {rnd.choice(SUFIXOS)}"
+            cnpj = f"{rnd.randrange(10 ** 8):08d}0001{rnd.randrange(100):02d}"
+            # Maioria com 1 perfil, cauda longa de grupos com dezenas
+            quantidade_perfis = min(60, int(rnd.paretovariate(1.6)))
+            perfis = []
+            for _ in range(quantidade_perfis):
+                perfis.append((str(codigo_perfil), f"{nome.split()[0][:6]}{codigo_perfil}"))
+                codigo_perfil += 1
+            # Porte assimétrico: poucos agentes concentram o volume
+            porte = rnd.lognormvariate(4, 2)
+            papel = rnd.choices(["vende", "compra", "ambos"], weights=[2, 5, 3])[0]
+            entrada = rnd.randrange(len(self.meses)) if rnd.random() < 0.1 else 0
+            saida = rnd.randrange(entrada, len(self.meses)) + 1 if rnd.random() < 0.05 else len(self.meses)
+            empresas.append({
+                "nome": nome, "cnpj": cnpj, "perfis": perfis, "porte": porte,
+                "papel": papel, "entrada": entrada, "saida": saida
+            })
+        return empresas
+
+    @property
+    def total_perfis(self):
+        return sum(len(empresa["perfis"]) for empresa in self.empresas)
+
+    def _volumes(self, rnd, empresa):
+        venda = compra = 0.0
+        if empresa["papel"] in ("vende", "ambos"):
+            venda = round(empresa["porte"] * rnd.lognormvariate(0, 0.5), 3)
+        if empresa["papel"] in ("compra", "ambos"):
+            compra = round(empresa["porte"] * rnd.lognormvariate(0, 0.5), 3)
+        return venda, compra
+
+    def documentos_mes(self, indice_mes):
+        """Gera os documentos de um mês (inclui revisões com carga posterior)"""
+        mes_referencia = self.meses[indice_mes]
+        rnd = random.Random(f"{self.semente}-{mes_referencia}")
+        data_carga = datetime(int(mes_referencia[:4]), int(mes_referencia[4:6]), 1) + timedelta(days=40)
+
+        for empresa in self.empresas:
+            if not (empresa["entrada"] <= indice_mes < empresa["saida"]):
+                continue
+            for codigo, sigla in empresa["perfis"]:
+                # Perfis sem contratação no mês não aparecem
+                if rnd.random() < 0.08:
+                    continue
+                venda, compra = self._volumes(rnd, empresa)
+                documento = {
+                    "MES_REFERENCIA": mes_referencia,
+                    "NOME_EMPRESARIAL": empresa["nome"],
+                    "CNPJ": empresa["cnpj"],
+                    "CODIGO_PERFIL_AGENTE": codigo,
+                    "SIGLA_PERFIL_AGENTE": sigla,
+                    "CONTRATACAO_VENDA": venda,
+                    "CONTRATACAO_COMPRA": compra,
+                    "DATA_CARREGAMENTO": data_carga
+                }
+                yield documento
+                if rnd.random() < self.taxa_revisao:
+                    revisao = dict(documento)
+                    revisao["CONTRATACAO_VENDA"] = round(venda * rnd.uniform(0.9, 1.1), 3)
+                    revisao["CONTRATACAO_COMPRA"] = round(compra * rnd.uniform(0.9, 1.1), 3)
+                    revisao["DATA_CARREGAMENTO"] = data_carga + timedelta(days=rnd.randint(30, 90))
+                    yield revisao
+
+    def documentos(self):
+        for indice_mes in range(len(self.meses)):
+            yield from self.documentos_mes(indice_mes)
+
+    def lotes(self, tamanho_lote=10000):
+        lote = []
+        for documento in self.documentos():
+            lote.append(documento)
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+
+def _serializar(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+def gravar_json(gerador, arquivo):
+    """Array JSON no mesmo formato do dump de exemplo (gravado em streaming)"""
+    total = 0
+    with open(arquivo, "w", encoding="utf-8", buffering=1024 * 1024) as saida:
+        saida.write("[")
+        for documento in gerador.documentos():
+            saida.write(",\n" if total else "\n")
+            saida.write(json.dumps({chave: _serializar(valor) for chave, valor in documento.items()}, ensure_ascii=False))
+            total += 1
+        saida.write("\n]\n")
+    return total
+
+
+def gravar_csv(gerador, arquivo, tamanho_lote=10000):
+    total = 0
+    with open(arquivo, "w", newline="", encoding="utf-8", buffering=1024 * 1024) as saida:
+        writer = csv.DictWriter(saida, fieldnames=CAMPOS)
+        writer.writeheader()
+        for lote in gerador.lotes(tamanho_lote):
+            writer.writerows(lote)
+            total += len(lote)
+    return total
+
+
+def gravar_parquet(gerador, arquivo, tamanho_lote=50000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("MES_REFERENCIA", pa.string()),
+        ("NOME_EMPRESARIAL", pa.string()),
+        ("CNPJ", pa.string()),
+        ("CODIGO_PERFIL_AGENTE", pa.string()),
+        ("SIGLA_PERFIL_AGENTE", pa.string()),
+        ("CONTRATACAO_VENDA", pa.float64()),
+        ("CONTRATACAO_COMPRA", pa.float64()),
+        ("DATA_CARREGAMENTO", pa.timestamp("us"))
+    ])
+    total = 0
+    with pq.ParquetWriter(arquivo, schema) as writer:
+        for lote in gerador.lotes(tamanho_lote):
+            colunas = {campo: [documento[campo] for documento in lote] for campo in CAMPOS}
+            writer.write_table(pa.table(colunas, schema=schema))
+            total += len(lote)
+    return total
+
+
+def carregar_mongo(gerador, database, tamanho_lote=10000, threads=4, manter=False):
+    """Insere em lotes paralelos e cria índices, rollup e dashboard só no final"""
+    os.environ["MONGODB_DB"] = database
+    from data_loader import CCEEDataLoader
+    from dashboard import materializar_dashboard
+
+    loader = CCEEDataLoader()
+    total = 0
+    pendentes = threading.Semaphore(threads * 2)
+
+    def inserir(lote):
+        try:
+            return len(loader.collection.insert_many(lote, ordered=False).inserted_ids)
+        finally:
+            pendentes.release()
+
+    try:
+        # Mesmo lease da API/agendador: com --manter o database pode ser o da aplicação
+        with loader.lease_atualizacao():
+            if not manter:
+                loader.collection.drop()
+                loader.rollup.clear()
+
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                futuros = []
+                for lote in gerador.lotes(tamanho_lote):
+                    pendentes.acquire()
+                    futuros.append(executor.submit(inserir, lote))
+                for futuro in futuros:
+                    total += futuro.result()
+
+            print(f"💾 {total:,} documentos inseridos, criando índices, rollup e dashboard...")
+            loader.create_indexes()
+            loader.rollup.refresh(gerador.meses)
+            # Mesmos passos pós-carga do loader e da importação: o dashboard não fica velho
+            materializar_dashboard(loader.db)
+    finally:
+        loader.close_connection()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de dados sintéticos CCEE")
+    parser.add_argument("destino", choices=["mongo", "json", "csv", "parquet"])
+    parser.add_argument("--escala", type=float, default=1.0, help="Fator de escala (1 ≈ base atual)")
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--ano-inicio", type=int, default=2024)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--taxa-revisao", type=float, default=0.01, help="Fração de perfis/mês com revisão")
+    parser.add_argument("--saida", default=None, help="Arquivo de saída (json/csv/parquet)")
+    parser.add_argument("--database", default="ccee_sintetico", help="Database MongoDB de destino")
+    parser.add_argument("--manter", action="store_true", help="Não apaga a collection antes de carregar")
+    parser.add_argument("--threads", type=int, default=4, help="Threads de inserção no MongoDB")
+    parser.add_argument("--lote", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.destino == "mongo" and args.database == os.getenv("DATABASE_NAME", "ccee_data") and not args.manter:
+        parser.error("use --manter para gerar dados no database da aplicação")
+    if args.destino == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("❌ pyarrow não instalado (pip install pyarrow)")
+            return
+
+    inicio = time.perf_counter()
+    gerador = GeradorCCEE(args.escala, args.meses, args.ano_inicio, args.semente, args.taxa_revisao)
+    print(f"🏭 Escala {args.escala}x: {len(gerador.empresas):,} empresas, {gerador.total_perfis:,} perfis, "
+          f"{len(gerador.meses)} meses ({gerador.meses[0]} a {gerador.meses[-1]})")
+
+    if args.destino == "mongo":
+        from lease import LeaseOcupado
+        try:
+            total = carregar_mongo(gerador, args.database, args.lote, args.threads, args.manter)
+        except LeaseOcupado as e:
+            print(f"⏭️  Atualização em andamento em outro processo: {e}")
+            return
+    else:
+        arquivo = args.saida or f"ccee_sintetico_{args.escala:g}x.{args.destino}"
+        if args.destino == "json":
+            total = gravar_json(gerador, arquivo)
+        elif args.destino == "csv":
+            total = gravar_csv(gerador, arquivo, args.lote)
+        else:
+            total = gravar_parquet(gerador, arquivo, args.lote)
+        print(f"📁 Arquivo gerado: {arquivo}")
+
+    segundos = time.perf_counter() - inicio
+    print(f"✅ {total:,} documentos em {segundos:.1f}s ({total / segundos:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Carga offline de energy_contracts a partir de dumps locais (JSON ou CSV)
+
+Restaura um database sem acesso à API da CCEE: lê os arquivos em streaming
+(array JSON, um JSON por linha/mongoexport ou CSV, opcionalmente .gz), normaliza os
+tipos e insere no staging em lotes grandes não ordenados a partir de várias threads,
+com um LOTE_CARGA por mês. No final cada mês é validado e publicado pelo
+PublicadorMes (cópia oculta e troca do ponteiro em versoes_mes), que também
+recalcula o rollup e o dashboard.
+
+Meses que já existem no banco são pulados (como em load_year_data), a menos que
+substituir=True: o mês atual continua publicado durante a carga e só é trocado
+pelo do dump no final; se a importação falhar, ele fica como estava.
+
+Uso:
+    python data_loader.py importar ../ccee_data.energy_contracts.json
+    python data_loader.py importar dump_2024.csv dump_2025.json.gz --workers 8 --substituir
+    python data_loader.py --perfil-memoria importar dump.json   (picos de memória por etapa)
+"""
+import csv
+import gzip
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from leitura_json import iterar_json
+from memoria import perfil_memoria
+from publicacao import PublicacaoInvalida, VERSOES_COLLECTION
+from versoes import filtro_visivel
+
+CAMPOS_TEXTO = ("NOME_EMPRESARIAL", "SIGLA_PERFIL_AGENTE")
+CAMPOS_NUMERICOS = ("CONTRATACAO_VENDA", "CONTRATACAO_COMPRA")
+
+
+class ContadorBytes(io.RawIOBase):
+    """Repassa a leitura de um arquivo binário contando os bytes lidos (para MB/s)"""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.lidos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        lidos = self.arquivo.readinto(buffer)
+        self.lidos += lidos or 0
+        return lidos
+
+    def close(self):
+        self.arquivo.close()
+        super().close()
+
+
+def abrir_texto(caminho):
+    """
+    Abre o dump como texto, descompactando .gz
+
+    Returns:
+        tuple: (arquivo texto, contador de bytes lidos do disco)
+    """
+    contador = ContadorBytes(open(caminho, "rb"))
+    bruto = io.BufferedReader(contador, buffer_size=1024 * 1024)
+    if caminho.endswith(".gz"):
+        bruto = gzip.GzipFile(fileobj=bruto)
+    return io.TextIOWrapper(bruto, encoding="utf-8-sig", newline=""), contador
+
+
+def iterar_csv(arquivo):
+    """Lê um CSV com cabeçalho; detecta ';' ou ',' pela primeira linha"""
+    cabecalho = arquivo.readline()
+    separador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    campos = next(csv.reader([cabecalho], delimiter=separador))
+    yield from csv.DictReader(arquivo, fieldnames=[campo.strip() for campo in campos], delimiter=separador)
+
+
+def numero(valor):
+    """Número da CCEE (float, int ou texto com vírgula decimal); vazio vira None"""
+    if valor is None or isinstance(valor, float):
+        return valor
+    if isinstance(valor, int):
+        return float(valor)
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+
+def codigo(valor):
+    """Códigos (perfil, CNPJ) ficam como texto, sem '.0' de planilhas"""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def normalizar_registro(registro, agora):
+    """
+    Deixa o registro com os mesmos tipos da carga pela API
+
+    Returns:
+        dict ou None se o registro não tiver um MES_REFERENCIA válido
+    """
+    mes = re.sub(r"\D", "", str(registro.get("MES_REFERENCIA") or ""))
+    if len(mes) != 6:
+        return None
+
+    documento = {chave: valor for chave, valor in registro.items() if chave and chave != "_id" and valor != ""}
+    documento["MES_REFERENCIA"] = mes
+    for campo in CAMPOS_TEXTO:
+        if documento.get(campo) is not None:
+            documento[campo] = str(documento[campo]).strip()
+    for campo in CAMPOS_NUMERICOS:
+        if campo in documento:
+            documento[campo] = numero(documento[campo])
+    for campo in ("CODIGO_PERFIL_AGENTE", "CNPJ"):
+        if campo in documento:
+            documento[campo] = codigo(documento[campo])
+
+    carga = documento.get("DATA_CARREGAMENTO")
+    if isinstance(carga, str):
+        try:
+            carga = datetime.fromisoformat(carga)
+        except ValueError:
+            carga = None
+    documento["DATA_CARREGAMENTO"] = carga if isinstance(carga, datetime) else agora
+    return documento
+
+
+class ImportadorOffline:
+    """Carrega dumps locais no staging com threads de inserção e publica por mês"""
+
+    def __init__(self, loader, workers=4, tamanho_lote=20000, substituir=False):
+        self.loader = loader
+        self.collection = loader.collection
+        self.publicador = loader.publicador
+        self.staging = loader.publicador.staging
+        self.workers = workers
+        self.tamanho_lote = tamanho_lote
+        self.substituir = substituir
+        self.lotes = {}
+        self.enviados = {}
+        self.meses_pulados = set()
+        self.descartados = 0
+        self.erros_insercao = 0
+
+    def _aceitar_mes(self, mes_referencia):
+        """Decide na primeira vez que o mês aparece se ele será carregado (e com qual lote)"""
+        if mes_referencia in self.lotes:
+            return True
+        if mes_referencia in self.meses_pulados:
+            return False
+        existente = self.collection.find_one(
+            {"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.loader.db)}, {"_id": 1})
+        if existente and not self.substituir:
+            print(f"⏭️  {mes_referencia} já existe no banco, pulando (use --substituir)")
+            self.meses_pulados.add(mes_referencia)
+            return False
+        # Restos de cargas anteriores do mês no staging; o mês publicado não é tocado
+        self.staging.delete_many({"MES_REFERENCIA": mes_referencia})
+        self.lotes[mes_referencia] = uuid.uuid4().hex
+        self.enviados[mes_referencia] = 0
+        return True
+
+    def _lotes(self, arquivo, caminho):
+        agora = datetime.now()
+        with arquivo:
+            extensao = caminho[:-3] if caminho.endswith(".gz") else caminho
+            if extensao.lower().endswith(".csv"):
+                registros = iterar_csv(arquivo)
+            else:
+                # Tipos estendidos do mongoexport ($date, $oid, $numberLong...) pelo json_util
+                registros = iterar_json(arquivo, object_hook=json_util.object_hook)
+            lote = []
+            for registro in registros:
+                documento = normalizar_registro(registro, agora)
+                if documento is None:
+                    self.descartados += 1
+                    continue
+                mes = documento["MES_REFERENCIA"]
+                if not self._aceitar_mes(mes):
+                    continue
+                documento["LOTE_CARGA"] = self.lotes[mes]
+                self.enviados[mes] += 1
+                lote.append(documento)
+                if len(lote) >= self.tamanho_lote:
+                    yield lote
+                    lote = []
+            if lote:
+                yield lote
+
+    def _inserir(self, documentos):
+        """
+        Roda nas threads de inserção: não toca nos contadores do importador
+
+        Returns:
+            tuple: (inseridos, erros de escrita)
+        """
+        try:
+            return len(self.staging.insert_many(documentos, ordered=False).inserted_ids), 0
+        except BulkWriteError as e:
+            return e.details.get("nInserted", 0), len(e.details.get("writeErrors", []))
+
+    @perfil_memoria.medir("importacao.importar")
+    def importar(self, arquivos):
+        """
+        Importa os arquivos em sequência para o staging e publica os meses válidos
+
+        Returns:
+            dict: registros publicados, meses carregados/pulados/recusados, descartados e tempos
+        """
+        inicio = time.perf_counter()
+        total = 0
+        bytes_lidos = 0
+        pendentes = threading.Semaphore(self.workers * 2)
+
+        def inserir(documentos):
+            try:
+                return self._inserir(documentos)
+            finally:
+                pendentes.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for caminho in arquivos:
+                    print(f"📂 Lendo {caminho} ({os.path.getsize(caminho) / 1024 / 1024:,.1f} MB)...")
+                    arquivo, contador = abrir_texto(caminho)
+                    futuros = []
+                    # _lotes roda nesta thread (descartados, meses); as threads só inserem
+                    for documentos in self._lotes(arquivo, caminho):
+                        pendentes.acquire()
+                        futuros.append(executor.submit(inserir, documentos))
+                    inseridos = 0
+                    for futuro in futuros:
+                        inseridos_lote, erros = futuro.result()
+                        inseridos += inseridos_lote
+                        self.erros_insercao += erros
+                    total += inseridos
+                    bytes_lidos += contador.lidos
+                    segundos = max(time.perf_counter() - inicio, 1e-9)
+                    print(f"   ✅ {inseridos:,} registros no staging ({total / segundos:,.0f} docs/s, "
+                          f"{bytes_lidos / 1024 / 1024 / segundos:,.1f} MB/s)")
+        except Exception:
+            self.staging.delete_many({"LOTE_CARGA": {"$in": list(self.lotes.values())}})
+            raise
+        tempo_insercao = time.perf_counter() - inicio
+
+        print(f"💾 {total:,} registros no staging em {tempo_insercao:.1f}s, validando e publicando...")
+        encenados = []
+        recusados = []
+        for mes in sorted(self.lotes):
+            lote = self.lotes[mes]
+            try:
+                # Com inserções que falharam a contagem não bate e o mês publicado fica como está
+                registros = self.publicador.validar(mes, lote, self.enviados[mes])
+            except PublicacaoInvalida as e:
+                print(f"❌ {mes} recusado: {e}")
+                self.staging.delete_many({"LOTE_CARGA": lote})
+                recusados.append(mes)
+                continue
+            encenados.append({"mes": mes, "lote": lote, "registros": registros})
+        publicados = self.publicador.trocar(encenados)
+        meses = [publicado["mes"] for publicado in publicados]
+        self.registrar_origem(meses, arquivos)
+
+        resultado = {
+            "registros": sum(publicado["registros"] for publicado in publicados),
+            "meses_carregados": meses,
+            "meses_pulados": sorted(self.meses_pulados),
+            "meses_recusados": recusados,
+            "descartados": self.descartados,
+            "erros_insercao": self.erros_insercao,
+            "segundos_insercao": round(tempo_insercao, 2),
+            "segundos_total": round(time.perf_counter() - inicio, 2)
+        }
+        print(f"✅ Importação concluída: {resultado['registros']:,} registros, {len(meses)} meses "
+              f"em {resultado['segundos_total']:.1f}s")
+        if self.descartados:
+            print(f"⚠️  {self.descartados:,} registros sem MES_REFERENCIA válido descartados")
+        return resultado
+
+    def registrar_origem(self, meses, arquivos):
+        """Anota em versoes_mes que os meses publicados vieram destes arquivos"""
+        self.loader.db[VERSOES_COLLECTION].update_many(
+            {"_id": {"$in": meses}},
+            {"$set": {"origem": "importacao", "arquivos": [os.path.basename(arquivo) for arquivo in arquivos]}}
+        )
@@ -0,0 +1,187 @@
+"""
+Especificação declarativa dos índices MongoDB, compartilhada pelo loader e pela API
+
+Cada índice lista as chaves, as opções e quais consultas ele atende. Os nomes são
+os padrão do MongoDB (ex.: MES_REFERENCIA_1_NOME_EMPRESARIAL_1), então recriar um
+índice já existente é uma operação nula.
+"""
+from pymongo import ASCENDING
+
+INDICES = {
+    "energy_contracts": [
+        {
+            "chaves": [("MES_REFERENCIA", ASCENDING), ("NOME_EMPRESARIAL", ASCENDING)],
+            "uso": "filtro por mês/ano (/api/dados, agregados, stats) e distinct de empresas por ano"
+        },
+        {
+            "chaves": [("NOME_EMPRESARIAL", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "distinct de empresas e agrupamentos por empresa"
+        },
+        {
+            "chaves": [("MES_REFERENCIA", ASCENDING), ("CODIGO_PERFIL_AGENTE", ASCENDING)],
+            "uso": "recarga e conferência de um mês por perfil"
+        },
+        {
+            "chaves": [("CODIGO_PERFIL_AGENTE", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "drilldown por lista de perfis ($in) com intervalo de meses (/api/drilldown/perfis)"
+        },
+        {
+            "chaves": [("CNPJ", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "drilldown por lista de CNPJs com intervalo de meses"
+        },
+        {
+            "chaves": [("SIGLA_PERFIL_AGENTE", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "drilldown por lista de siglas de perfil com intervalo de meses"
+        }
+    ],
+    "energy_contracts_mensal": [
+        {
+            "chaves": [("MES_REFERENCIA", ASCENDING), ("NOME_EMPRESARIAL", ASCENDING)],
+            "opcoes": {"unique": True},
+            "uso": "chave do $merge do rollup e /api/comparacao"
+        },
+        {
+            "chaves": [("NOME_EMPRESARIAL", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "ordenação empresa/mês de /api/pivot e /api/janelas"
+        },
+        {
+            "chaves": [("ANO", ASCENDING), ("NOME_EMPRESARIAL", ASCENDING)],
+            "uso": "filtro por ano de /api/pivot e /api/distribuicao"
+        },
+        {
+            "chaves": [("MES_INDICE", ASCENDING)],
+            "uso": "intervalo de meses de /api/janelas"
+        }
+    ],
+    "energy_contracts_staging": [
+        {
+            "chaves": [("LOTE_CARGA", ASCENDING), ("MES_REFERENCIA", ASCENDING)],
+            "uso": "validação e publicação de um lote de recarga"
+        },
+        {
+            "chaves": [("MES_REFERENCIA", ASCENDING)],
+            "uso": "descarte de restos de cargas anteriores do mês"
+        }
+    ],
+    "locks": [
+        {
+            "chaves": [("expira_em", ASCENDING)],
+            "opcoes": {"expireAfterSeconds": 0},
+            "uso": "TTL: remove leases abandonados por processos que morreram"
+        }
+    ]
+}
+
+
+def nome_indice(chaves):
+    """Nome padrão que o MongoDB dá ao índice"""
+    return "_".join(f"{campo}_{direcao}" for campo, direcao in chaves)
+
+
+def _normalizar(chaves):
+    """Chaves como tupla de (campo, direção), com direção numérica inteira (1.0 vira 1)"""
+    return tuple(
+        (campo, int(direcao) if isinstance(direcao, (int, float)) else direcao)
+        for campo, direcao in chaves
+    )
+
+
+def garantir_indices(db, colecoes=None):
+    """
+    Cria os índices da especificação que ainda não existem (idempotente)
+
+    Returns:
+        list: nomes "colecao.indice" criados nesta chamada
+    """
+    criados = []
+    for nome_colecao, especificacoes in INDICES.items():
+        if colecoes and nome_colecao not in colecoes:
+            continue
+        colecao = db[nome_colecao]
+        existentes = {_normalizar(info["key"]) for info in colecao.index_information().values()}
+        for especificacao in especificacoes:
+            chaves = list(_normalizar(especificacao["chaves"]))
+            if tuple(chaves) in existentes:
+                continue
+            try:
+                nome = colecao.create_index(chaves, **especificacao.get("opcoes", {}))
+                criados.append(f"{nome_colecao}.{nome}")
+            except Exception as e:
+                print(f"⚠️  Erro ao criar índice {nome_colecao}.{nome_indice(chaves)}: {e}")
+    if criados:
+        print(f"📊 Índices criados: {', '.join(criados)}")
+    return criados
+
+
+def _estatisticas_uso(colecao):
+    """Acessos por índice desde o último restart do mongod ($indexStats)"""
+    try:
+        return {
+            item["name"]: {
+                "acessos": item["accesses"]["ops"],
+                "desde": item["accesses"]["since"].isoformat()
+            }
+            for item in colecao.aggregate([{"$indexStats": {}}])
+        }
+    except Exception as e:
+        print(f"⚠️  $indexStats indisponível para {colecao.name}: {e}")
+        return None
+
+
+def relatorio_indices(db):
+    """
+    Compara os índices existentes com a especificação
+
+    - faltando: previstos na especificação e ausentes no banco
+    - sem_uso: existentes sem nenhum acesso segundo o $indexStats
+    - redundantes: chaves são prefixo de outro índice (o maior já atende as consultas)
+    - fora_da_especificacao: existentes que a especificação não prevê
+    """
+    relatorio = {}
+    for nome_colecao, especificacoes in INDICES.items():
+        colecao = db[nome_colecao]
+        informacoes = colecao.index_information()
+        existentes = {nome: _normalizar(info["key"]) for nome, info in informacoes.items()}
+        previstos = {_normalizar(especificacao["chaves"]): especificacao for especificacao in especificacoes}
+        uso = _estatisticas_uso(colecao)
+
+        faltando = [
+            {"indice": nome_indice(chaves), "uso": especificacao["uso"]}
+            for chaves, especificacao in previstos.items()
+            if chaves not in set(existentes.values())
+        ]
+
+        redundantes = []
+        for nome, chaves in existentes.items():
+            if nome == "_id_" or informacoes[nome].get("unique"):
+                continue
+            for outro, chaves_outro in existentes.items():
+                if outro != nome and len(chaves_outro) > len(chaves) and chaves_outro[:len(chaves)] == chaves:
+                    redundantes.append({"indice": nome, "coberto_por": outro})
+                    break
+
+        sem_uso = None  # desconhecido sem $indexStats
+        if uso is not None:
+            sem_uso = [
+                {"indice": nome, "desde": uso[nome]["desde"]}
+                for nome in existentes
+                if nome != "_id_" and nome in uso and uso[nome]["acessos"] == 0
+            ]
+
+        relatorio[nome_colecao] = {
+            "existentes": {
+                nome: {
+                    "chaves": [list(chave) for chave in chaves],
+                    "acessos": uso.get(nome, {}).get("acessos") if uso is not None else None
+                }
+                for nome, chaves in existentes.items()
+            },
+            "faltando": faltando,
+            "sem_uso": sem_uso,
+            "redundantes": redundantes,
+            "fora_da_especificacao": [
+                nome for nome, chaves in existentes.items()
+                if nome != "_id_" and chaves not in previstos
+            ]
+        }
+    return relatorio
@@ -0,0 +1,109 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+LOCKS_COLLECTION = "locks"
+
+# Lease da ingestão de novos meses (API, agendador e data_updater.py)
+LEASE_ATUALIZACAO = "atualizacao_ccee"
+
+# Lease da sincronização do rollup na subida da API (um worker sincroniza por vez)
+LEASE_ROLLUP = "sincronizacao_rollup"
+
+
+def identidade_processo():
+    """Identifica o dono do lease: host, pid e um sufixo aleatório"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseOcupado(Exception):
+    """O lease pertence a outro processo e ainda não expirou"""
+
+    def __init__(self, nome, dono=None, expira_em=None):
+        super().__init__(f"Lease '{nome}' em uso por {dono} até {expira_em}")
+        self.nome = nome
+        self.dono = dono
+        self.expira_em = expira_em
+
+
+class LeaseMongo:
+    """
+    Exclusão mútua entre processos com um documento em Mongo que expira
+
+    O documento {_id: nome, dono, expira_em} só pode ser tomado se estiver expirado
+    ou já for do mesmo dono; enquanto o trabalho roda, uma thread renova o prazo.
+    Se o processo morrer, o lease expira sozinho depois de ttl_segundos.
+    """
+
+    def __init__(self, db, nome, ttl_segundos=300, dono=None):
+        self.collection = db[LOCKS_COLLECTION]
+        self.nome = nome
+        self.ttl_segundos = ttl_segundos
+        self.dono = dono or identidade_processo()
+        self.perdido = False
+        self._parar = threading.Event()
+        self._renovador = None
+
+    def adquirir(self):
+        """Tenta tomar o lease; retorna True se conseguiu"""
+        agora = datetime.utcnow()
+        try:
+            self.collection.find_one_and_update(
+                {"_id": self.nome, "$or": [{"expira_em": {"$lt": agora}}, {"dono": self.dono}]},
+                {"$set": {
+                    "dono": self.dono,
+                    "adquirido_em": agora,
+                    "expira_em": agora + timedelta(seconds=self.ttl_segundos)
+                }},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # O upsert colidiu com o documento de outro dono ainda válido
+            return False
+
+    def renovar(self):
+        resultado = self.collection.update_one(
+            {"_id": self.nome, "dono": self.dono},
+            {"$set": {"expira_em": datetime.utcnow() + timedelta(seconds=self.ttl_segundos)}}
+        )
+        return resultado.matched_count == 1
+
+    def liberar(self):
+        self.collection.delete_one({"_id": self.nome, "dono": self.dono})
+
+    def estado(self):
+        return self.collection.find_one({"_id": self.nome})
+
+    def _renovar_periodicamente(self):
+        while not self._parar.wait(self.ttl_segundos / 3):
+            try:
+                if not self.renovar():
+                    self.perdido = True
+                    print(f"⚠️  Lease '{self.nome}' perdido (expirou ou foi tomado por outro processo)")
+                    return
+            except Exception as e:
+                print(f"⚠️  Erro ao renovar lease '{self.nome}': {e}")
+
+    def __enter__(self):
+        if not self.adquirir():
+            atual = self.estado() or {}
+            raise LeaseOcupado(self.nome, atual.get("dono"), atual.get("expira_em"))
+        self.perdido = False
+        self._parar.clear()
+        self._renovador = threading.Thread(target=self._renovar_periodicamente, name=f"lease-{self.nome}", daemon=True)
+        self._renovador.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._renovador.join()
+        try:
+            self.liberar()
+        except Exception as e:
+            print(f"⚠️  Erro ao liberar lease '{self.nome}': {e}")
+        return False
@@ -0,0 +1,60 @@
+"""
+Leitura incremental de arrays JSON e de um JSON por linha (mongoexport)
+
+Usado pela importação offline (importacao.py); o tipo estendido do mongoexport
+entra pelo object_hook. O conversor_csv.py da raiz tem o seu próprio parser, para
+rodar fora do backend.
+"""
+import json
+
+
+def iterar_json(arquivo, tamanho_bloco=1024 * 1024, object_hook=None, progresso=None):
+    """
+    Lê um arquivo texto aberto elemento a elemento, sem carregá-lo inteiro
+
+    Args:
+        arquivo: Arquivo texto (open, gzip, TextIOWrapper...)
+        tamanho_bloco: Caracteres lidos por vez
+        object_hook: Repassado ao json.JSONDecoder (ex.: json_util.object_hook)
+        progresso: Dict opcional atualizado com 'bytes' e 'registros' lidos
+
+    Yields:
+        dict: Um registro por vez
+    """
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    if progresso is not None:
+        progresso.setdefault("bytes", 0)
+        progresso.setdefault("registros", 0)
+
+    def ler_bloco():
+        bloco = arquivo.read(tamanho_bloco)
+        if progresso is not None:
+            progresso["bytes"] += len(bloco.encode("utf-8"))
+        return bloco
+
+    buffer = ""
+    pos = 0
+    fim_arquivo = False
+    while True:
+        # Pula espaços, '[' inicial, ',' entre elementos e ']' final
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos >= len(buffer):
+            if fim_arquivo:
+                return
+            bloco = ler_bloco()
+            buffer, pos, fim_arquivo = buffer[pos:] + bloco, 0, not bloco
+            continue
+        try:
+            item, fim = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if fim_arquivo:
+                raise
+            # Elemento incompleto: lê mais um bloco e tenta de novo
+            bloco = ler_bloco()
+            buffer, pos, fim_arquivo = buffer[pos:] + bloco, 0, not bloco
+            continue
+        pos = fim
+        if progresso is not None:
+            progresso["registros"] += 1
+        yield item
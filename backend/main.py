@@ -1,8 +1,10 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from starlette.routing import Match
 from pymongo import MongoClient
 from bson import json_util
+from pydantic import BaseModel
 from typing import List, Dict, Optional
 import requests
 import json
@@ -11,19 +13,62 @@ from datetime import datetime
 import os
 from dotenv import load_dotenv
 import time
+import asyncio
+import random
+import re
+import threading
+from contextlib import asynccontextmanager
+from cache import TTLCache
+from metricas import (
+    registro, http_requisicoes, ccee_paginas, ccee_retentativas,
+    ingestao_registros, ingestao_vazao, endpoint_atual, tempos_requisicao, somar_tempo,
+    MonitorComandosMongo
+)
+from consultas_lentas import RegistroConsultasLentas
+from singleflight import SingleFlight, PortaoConsultas, Sobrecarga
+from lease import LeaseMongo, LeaseOcupado, LEASE_ATUALIZACAO, LEASE_ROLLUP
+from publicacao import PublicadorMes
+from versoes import filtro_visivel
+from eventos import barramento, ProgressoPaginas
+from indices import garantir_indices, relatorio_indices
+from descoberta import DescobertaCKAN
+from dashboard import DashboardMaterializado, materializar_dashboard
+from memoria import perfil_memoria
+from rollup import MonthlyRollup, METRICAS_ROLLUP, indice_mes, pipeline_janelas, calcular_janelas
+from pymongo.errors import OperationFailure
 
 # ✅ Carregar variáveis de ambiente
 load_dotenv()
 
-app = FastAPI(title="CCEE Energy Data API", version="1.0.0")
-
 # ✅ Configurações do .env com autenticação
 MONGODB_USER = os.getenv("MONGODB_USER", "belpit")
 MONGODB_PASS = os.getenv("MONGODB_PASS", "Belpit364!")
 MONGODB_HOST = os.getenv("MONGODB_HOST", "localhost")
 MONGODB_PORT = os.getenv("MONGODB_PORT", "27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "ccee_data")
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+CCEE_HTTP_RETRIES = int(os.getenv("CCEE_HTTP_RETRIES", "3"))
+CCEE_API_URL = os.getenv("CCEE_API_URL", "https://dadosabertos.ccee.org.br/api/3/action")
+CCEE_PAGE_DELAY = float(os.getenv("CCEE_PAGE_DELAY", "0.1"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+CCEE_POLL_INTERVAL_MINUTES = float(os.getenv("CCEE_POLL_INTERVAL_MINUTES", "0"))
+CCEE_POLL_JITTER = float(os.getenv("CCEE_POLL_JITTER", "0.1"))
+CCEE_LOCK_TTL_SECONDS = int(os.getenv("CCEE_LOCK_TTL_SECONDS", "300"))
+HEAVY_QUERY_CONCURRENCY = int(os.getenv("HEAVY_QUERY_CONCURRENCY", "4"))
+HEAVY_QUERY_WAIT_SECONDS = float(os.getenv("HEAVY_QUERY_WAIT_SECONDS", "2"))
+HEAVY_QUERY_RETRY_AFTER = int(os.getenv("HEAVY_QUERY_RETRY_AFTER", "5"))
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_MS = int(os.getenv("MONGODB_MAX_IDLE_MS", "300000"))
+MONGODB_TIMEOUT_MS = int(os.getenv("MONGODB_TIMEOUT_MS", "5000"))
+MONGODB_PING_INTERVAL = float(os.getenv("MONGODB_PING_INTERVAL", "15"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "0").lower() in ("1", "true", "sim")
+MEMORY_PROFILING_FRAMES = int(os.getenv("MEMORY_PROFILING_FRAMES", "10"))
 
 # ✅ URI de conexão com autenticação
 MONGODB_URI = f"mongodb://{MONGODB_USER}:{MONGODB_PASS}@{MONGODB_HOST}:{MONGODB_PORT}/{DATABASE_NAME}?authSource=admin"
@@ -32,23 +77,85 @@ MONGODB_URI = f"mongodb://{MONGODB_USER}:{MONGODB_PASS}@{MONGODB_HOST}:{MONGODB_
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173,http://localhost:3000")
 allowed_origins = [origin.strip() for origin in CORS_ORIGINS.split(",")]
 
-# ✅ Conexão com MongoDB LOCAL COM autenticação
-try:
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    client.server_info()
+# ✅ Log de consultas lentas (com explain capturado em segundo plano)
+consultas_lentas = RegistroConsultasLentas(
+    limite_ms=SLOW_QUERY_MS, arquivo=SLOW_QUERY_LOG or None, intervalo_explain=SLOW_QUERY_EXPLAIN_INTERVAL
+)
+
+# ✅ Conexão com MongoDB criada no lifespan: um cliente por worker, depois do fork
+client = None
+db = None
+collection = None
+estado_mongodb = {"pronto": False, "erro": None, "ultimo_ping": None}
+
+def conectar_mongodb():
+    """Cria o cliente MongoDB (não abre conexão: o pymongo conecta sob demanda)"""
+    global client, db, collection
+    client = MongoClient(
+        MONGODB_URI,
+        serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_MS,
+        event_listeners=[MonitorComandosMongo(), consultas_lentas]
+    )
+    consultas_lentas.client = client
     db = client[DATABASE_NAME]
     collection = db["energy_contracts"]
-    print("✅ Conectado ao MongoDB LOCAL com sucesso! (com autenticação)")
-    print(f"💾 Database: {DATABASE_NAME}")
-    print(f"👤 Usuário: {MONGODB_USER}")
+    print(f"💾 Database: {DATABASE_NAME} (pool {MONGODB_MIN_POOL_SIZE}-{MONGODB_MAX_POOL_SIZE}, pid {os.getpid()})")
     print(f"🔗 MongoDB URI: mongodb://{MONGODB_USER}:******@{MONGODB_HOST}:{MONGODB_PORT}/{DATABASE_NAME}")
-except Exception as e:
-    print(f"❌ Erro ao conectar com MongoDB: {e}")
-    print("💡 Verifique se:")
-    print("   - MongoDB está rodando")
-    print("   - Usuário e senha estão corretos")
-    print("   - O usuário tem permissões no database")
-    raise Exception("Falha na conexão com MongoDB")
+
+def ping_mongodb():
+    """Atualiza o estado de prontidão com um ping (bloqueante)"""
+    try:
+        client.admin.command('ping')
+        if not estado_mongodb["pronto"]:
+            print("✅ Conectado ao MongoDB LOCAL com sucesso! (com autenticação)")
+        estado_mongodb.update(pronto=True, erro=None)
+    except Exception as e:
+        if estado_mongodb["pronto"] or estado_mongodb["erro"] is None:
+            print(f"❌ Erro ao conectar com MongoDB: {e}")
+            print("💡 Verifique se o MongoDB está rodando e se usuário/senha/permissões estão corretos")
+        estado_mongodb.update(pronto=False, erro=str(e))
+    estado_mongodb["ultimo_ping"] = datetime.now().isoformat()
+    return estado_mongodb["pronto"]
+
+async def monitorar_mongodb():
+    """Verifica o MongoDB em segundo plano: a API sobe mesmo com o banco fora (modo degradado)"""
+    indices_verificados = False
+    while True:
+        pronto = await asyncio.to_thread(ping_mongodb)
+        if pronto and not indices_verificados:
+            # Banco populado por outro caminho (updater, restore, mongoimport) também ganha os índices
+            try:
+                await asyncio.to_thread(garantir_indices, db)
+                indices_verificados = True
+            except Exception as e:
+                print(f"⚠️  Erro ao verificar índices: {e}")
+        if pronto and indices_verificados and not estado_rollup["sincronizado"]:
+            try:
+                await asyncio.to_thread(sincronizar_rollup)
+            except Exception as e:
+                print(f"⚠️  Erro ao sincronizar rollup: {e}")
+        await asyncio.sleep(MONGODB_PING_INTERVAL if pronto else 2)
+
+@asynccontextmanager
+async def lifespan(app):
+    conectar_mongodb()
+    if MEMORY_PROFILING:
+        perfil_memoria.iniciar(MEMORY_PROFILING_FRAMES)
+    tarefas = [asyncio.create_task(monitorar_mongodb())]
+    if CCEE_POLL_INTERVAL_MINUTES > 0:
+        tarefas.append(asyncio.create_task(agendar_atualizacoes()))
+    try:
+        yield
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        client.close()
+        print("🔌 Conexão com MongoDB fechada")
+
+app = FastAPI(title="CCEE Energy Data API", version="1.0.0", lifespan=lifespan)
 
 # ✅ CORS configuration a partir do .env
 app.add_middleware(
@@ -57,10 +164,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+def rota_da_requisicao(request):
+    """Retorna o template da rota (ex.: /api/dados) para não explodir a cardinalidade das métricas"""
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "nao_encontrada"
+
+@app.middleware("http")
+async def medir_requisicoes(request: Request, call_next):
+    """Registra a latência de cada requisição por rota e status e devolve o Server-Timing"""
+    rota = rota_da_requisicao(request)
+    token = endpoint_atual.set(rota)
+    tempos = {"db": 0.0, "serialize": 0.0}
+    token_tempos = tempos_requisicao.set(tempos)
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        # Com o perfil de memória ligado, cada requisição vira uma etapa (rota + query)
+        with perfil_memoria.etapa(rota, tipo="requisicao", detalhe=request.url.query or None):
+            response = await call_next(request)
+        status = response.status_code
+        total = time.perf_counter() - inicio
+        response.headers["Server-Timing"] = (
+            f"db;dur={tempos['db'] * 1000:.1f};desc=\"MongoDB\", "
+            f"serialize;dur={tempos['serialize'] * 1000:.1f};desc=\"parse_json\", "
+            f"total;dur={total * 1000:.1f}"
+        )
+        response.headers["Timing-Allow-Origin"] = ", ".join(allowed_origins)
+        return response
+    finally:
+        http_requisicoes.observe(
+            time.perf_counter() - inicio,
+            method=request.method,
+            route=rota,
+            status=str(status)
+        )
+        tempos_requisicao.reset(token_tempos)
+        endpoint_atual.reset(token)
+
 def parse_json(data):
-    return json.loads(json_util.dumps(data))
+    inicio = time.perf_counter()
+    resultado = json.loads(json_util.dumps(data))
+    somar_tempo("serialize", time.perf_counter() - inicio)
+    return resultado
 
 def safe_float(value):
     if value is None:
@@ -70,26 +221,187 @@ def safe_float(value):
     except (TypeError, ValueError):
         return 0.0
 
+# ✅ Cache de consultas compartilhado entre endpoints e /api/batch
+cache_consultas = TTLCache(ttl_seconds=CACHE_TTL_SECONDS)
+
+registro.calculada(
+    "ccee_cache_requests_total",
+    "Consultas ao cache por resultado",
+    lambda: [({"result": "hit"}, cache_consultas.hits), ({"result": "miss"}, cache_consultas.misses)],
+    tipo="counter",
+    labels=("result",)
+)
+registro.calculada(
+    "ccee_cache_hit_ratio",
+    "Proporção de acertos do cache de consultas",
+    lambda: [({}, cache_consultas.stats()["hit_ratio"])]
+)
+
+# ✅ Consultas idênticas concorrentes compartilham uma execução; as pesadas passam por um portão
+consultas_em_voo = SingleFlight()
+portao_pesado = PortaoConsultas(
+    limite=HEAVY_QUERY_CONCURRENCY,
+    espera_max=HEAVY_QUERY_WAIT_SECONDS,
+    retry_after=HEAVY_QUERY_RETRY_AFTER
+)
+
+registro.calculada(
+    "ccee_singleflight_calls_total",
+    "Chamadas de consulta executadas ou compartilhadas com uma idêntica em andamento",
+    lambda: [
+        ({"result": "executed"}, consultas_em_voo.executadas),
+        ({"result": "shared"}, consultas_em_voo.compartilhadas)
+    ],
+    tipo="counter",
+    labels=("result",)
+)
+registro.calculada(
+    "ccee_heavy_queries_in_flight",
+    "Consultas pesadas em execução neste worker",
+    lambda: [({}, portao_pesado.em_execucao)]
+)
+registro.calculada(
+    "ccee_heavy_queries_rejected_total",
+    "Consultas pesadas recusadas com 503 (portão cheio)",
+    lambda: [({}, portao_pesado.rejeitadas)],
+    tipo="counter"
+)
+
+registro.calculada(
+    "ccee_ingest_event_subscribers",
+    "Clientes conectados ao stream de eventos de ingestão",
+    lambda: [({}, barramento.assinantes())]
+)
+
+async def executar_consulta(tipo, funcao, pesada=False, **params):
+    """Roda a consulta em thread, coalescendo chamadas idênticas (chave: tipo + parâmetros)"""
+    params = {chave: valor for chave, valor in params.items() if valor not in (None, "")}
+    chave = (tipo, tuple(sorted(params.items())))
+    return await consultas_em_voo.executar(chave, funcao, portao=portao_pesado if pesada else None, **params)
+
+def erro_sobrecarga(e):
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+estado_rollup = {"sincronizado": False}
+_lock_rollup = threading.Lock()
+
+def sincronizar_rollup():
+    """
+    Cria no rollup os meses que existem só na coleção bruta (banco populado por outro
+    caminho). Roda uma vez por worker em monitorar_mongodb; entre workers, o lease
+    deixa só um sincronizar e os outros seguem com o rollup como está
+    """
+    with _lock_rollup:
+        if estado_rollup["sincronizado"]:
+            return
+        try:
+            with LeaseMongo(db, LEASE_ROLLUP, ttl_segundos=CCEE_LOCK_TTL_SECONDS):
+                MonthlyRollup(db).sync()
+        except LeaseOcupado:
+            print("⏭️  Rollup sendo sincronizado por outro processo")
+        estado_rollup["sincronizado"] = True
+
+def get_rollup():
+    """Rollup mensal; as requisições só leem, quem sincroniza é sincronizar_rollup"""
+    return MonthlyRollup(db)
+
+def meses_do_periodo(periodo):
+    """Expande YYYY em 12 meses; YYYYMM vira lista de um mês"""
+    if len(periodo) == 4:
+        return [f"{periodo}{mes:02d}" for mes in range(1, 13)]
+    return [periodo]
+
+def periodo_base(periodo, tipo):
+    """Calcula o período de comparação (mês anterior ou mesmo período do ano anterior)"""
+    ano = int(periodo[:4])
+    if len(periodo) == 4:
+        return str(ano - 1)
+    mes = int(periodo[4:6])
+    if tipo == "yoy":
+        return f"{ano - 1}{mes:02d}"
+    if mes == 1:
+        return f"{ano - 1}12"
+    return f"{ano}{mes - 1:02d}"
+
+def variacao_percentual(base, atual):
+    if not base:
+        return None
+    return (atual - base) / abs(base) * 100
+
+def formatar_numero_ptbr(valor):
+    """Formata número para planilhas pt-BR (vírgula decimal, sem separador de milhar)"""
+    if isinstance(valor, int):
+        return str(valor)
+    return f"{valor:.6f}".rstrip("0").rstrip(".").replace(".", ",")
+
+def quantis_de_buckets(buckets, total, quantis):
+    """Aproxima quantis a partir de buckets de contagem ~igual ($bucketAuto)"""
+    resultado = {}
+    if not total:
+        return {f"p{int(q * 100)}": None for q in quantis}
+    for q in quantis:
+        alvo = q * total
+        acumulado = 0
+        valor = None
+        for bucket in buckets:
+            acumulado += bucket["quantidade"]
+            valor = bucket["maximo"]
+            if acumulado >= alvo:
+                break
+        resultado[f"p{int(q * 100)}"] = valor
+    return resultado
+
+def indice_gini(valores):
+    """Coeficiente de Gini (0 = distribuição igual, 1 = concentração total)"""
+    valores = sorted(max(valor, 0.0) for valor in valores)
+    n = len(valores)
+    total = sum(valores)
+    if n == 0 or total == 0:
+        return None
+    soma_ponderada = sum((i + 1) * valor for i, valor in enumerate(valores))
+    return (2 * soma_ponderada) / (n * total) - (n + 1) / n
+
+def indice_hhi(valores):
+    """Índice Herfindahl-Hirschman em pontos (0 a 10.000)"""
+    valores = [max(valor, 0.0) for valor in valores]
+    total = sum(valores)
+    if total == 0:
+        return None
+    return sum((valor / total * 100) ** 2 for valor in valores)
+
 class CCEEDataUpdater:
     def __init__(self):
-        # ✅ CORRETO: Buscar diretamente do .env (única fonte)
-        self.resource_ids = {
-            "2024": os.getenv("CCEE_RESOURCE_2024"),
-            "2025": os.getenv("CCEE_RESOURCE_2025")
-        }
-        # ✅ VALIDAÇÃO: Verificar se carregou corretamente
-        if not all(self.resource_ids.values()):
-            print("❌ ERRO: Resource IDs não carregados do .env")
-            print(f"   CCEE_RESOURCE_2024: {self.resource_ids['2024']}")
-            print(f"   CCEE_RESOURCE_2025: {self.resource_ids['2025']}")
-        else:
-            print("✅ Resource IDs carregados do .env com sucesso")
+        # ✅ Resource de cada ano pelo catálogo CKAN (CCEE_RESOURCE_<ANO> no .env fixa um ano)
+        self.descoberta = DescobertaCKAN(db, CCEE_API_URL, get=self.get_com_retry)
+    
+    def get_com_retry(self, url, timeout):
+        """GET na API CCEE com retentativas (backoff exponencial) e métricas por página"""
+        for tentativa in range(CCEE_HTTP_RETRIES + 1):
+            inicio = time.perf_counter()
+            try:
+                response = requests.get(url, timeout=timeout)
+                response.raise_for_status()
+                ccee_paginas.observe(time.perf_counter() - inicio, status=str(response.status_code))
+                return response
+            except requests.RequestException as e:
+                status = getattr(e.response, "status_code", None) or "erro"
+                ccee_paginas.observe(time.perf_counter() - inicio, status=str(status))
+                if tentativa == CCEE_HTTP_RETRIES:
+                    raise
+                ccee_retentativas.inc()
+                espera = 0.5 * 2 ** tentativa
+                print(f"⚠️  Falha na API CCEE ({e}), nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
     
     def get_latest_stored_month(self):
         """Pega o último MES_REFERENCIA do nosso banco"""
         try:
             latest = collection.find_one(
-                {}, 
+                visivel(), 
                 sort=[("MES_REFERENCIA", -1)],
                 projection={"MES_REFERENCIA": 1}
             )
@@ -112,37 +424,39 @@ class CCEEDataUpdater:
         else:
             return ano, mes + 1
     
+    def probe_month(self, resource_id, mes_referencia):
+        """Sonda com limit=1: True se o resource tem registros do mês"""
+        filters_json = json.dumps({"MES_REFERENCIA": mes_referencia})
+        url = f"{CCEE_API_URL}/datastore_search?resource_id={resource_id}&filters={filters_json}&limit=1"
+        data = self.get_com_retry(url, timeout=10).json()
+        return bool(data.get("success") and data["result"]["records"])
+    
     def check_month_exists_in_api(self, ano, mes):
-        """Verifica se um mês existe na API CCEE"""
+        """Verifica se um mês existe na API CCEE (erros de rede/CKAN sobem para o agendador contar)"""
         try:
-            # ✅ CORREÇÃO: Converter ano para string
-            resource_id = self.resource_ids.get(str(ano))
-            if not resource_id:
-                print(f"❌ Resource ID não encontrado para o ano {ano} (chaves disponíveis: {list(self.resource_ids.keys())})")
-                return False
-            
             mes_referencia = f"{ano}{mes:02d}"
-            filters = {"MES_REFERENCIA": mes_referencia}
-            filters_json = json.dumps(filters)
-            
-            url = f"https://dadosabertos.ccee.org.br/api/3/action/datastore_search?resource_id={resource_id}&filters={filters_json}&limit=1"
+            resource_id = self.descoberta.resource_id(ano)
+            exists = bool(resource_id) and self.probe_month(resource_id, mes_referencia)
             
-            response = requests.get(url, timeout=10)
-            data = response.json()
+            if not exists:
+                # ✅ Sonda falhou: o catálogo pode estar desatualizado (ano novo ou resource trocado)
+                novo_resource = self.descoberta.apos_falha(ano)
+                if novo_resource:
+                    exists = self.probe_month(novo_resource, mes_referencia)
             
-            exists = data.get("success") and data["result"]["records"]
             print(f"🔍 {ano}-{mes:02d} na API: {'✅' if exists else '❌'}")
             return exists
             
         except Exception as e:
             print(f"❌ Erro ao verificar {ano}-{mes:02d}: {e}")
-            return False
+            raise
     
+    @perfil_memoria.medir("api.download_mes")
     def fetch_all_records_for_month(self, ano, mes):
         """Busca TODOS os registros de um mês com paginação CORRIGIDA"""
-        resource_id = self.resource_ids.get(str(ano))
+        resource_id = self.descoberta.resource_id(ano)
         if not resource_id:
-            print(f"❌ Resource ID não encontrado para o ano {ano}")
+            print(f"❌ Nenhum resource da CCEE para o ano {ano}")
             return None
         
         mes_referencia = f"{ano}{mes:02d}"
@@ -154,22 +468,22 @@ class CCEEDataUpdater:
         all_records = []
         offset = 0
         limit = 100  # API CCEE tem limite de 100 por página
+        progresso = ProgressoPaginas(mes_referencia)
         
         try:
             page = 1
             while True:
-                url = f"https://dadosabertos.ccee.org.br/api/3/action/datastore_search?resource_id={resource_id}&filters={filters_json}&limit={limit}&offset={offset}"
+                url = f"{CCEE_API_URL}/datastore_search?resource_id={resource_id}&filters={filters_json}&limit={limit}&offset={offset}"
                 
                 print(f"📄 Página {page} - Offset: {offset}")
                 
-                response = requests.get(url, timeout=60)
-                response.raise_for_status()
+                response = self.get_com_retry(url, timeout=60)
                 
                 data = response.json()
                 
                 if not data.get("success"):
-                    print(f"❌ Erro na API para {mes_referencia}")
-                    break
+                    # Parar aqui publicaria o mês pela metade
+                    raise RuntimeError(f"API CCEE sem sucesso na página {page} de {mes_referencia}")
                 
                 records = data["result"]["records"]
                 if not records:
@@ -178,6 +492,7 @@ class CCEEDataUpdater:
                 
                 all_records.extend(records)
                 print(f"✅ Página {page}: {len(records)} registros")
+                barramento.publicar("pagina", **progresso.pagina(len(records), data["result"].get("total")))
                 
                 # Verifica se há mais páginas
                 if len(records) < limit:
@@ -188,55 +503,52 @@ class CCEEDataUpdater:
                 page += 1
                 
                 # Pequena pausa para não sobrecarregar a API
-                time.sleep(0.1)
+                time.sleep(CCEE_PAGE_DELAY)
             
             print(f"✅ {mes_referencia}: {len(all_records)} registros baixados no total")
             return all_records
             
         except Exception as e:
             print(f"❌ Erro ao buscar {mes_referencia}: {e}")
-            return None
-    
-    def save_data_fast_insert(self, records):
-        """Salva dados no MongoDB de forma otimizada"""
-        if not records:
-            return 0
-        
-        try:
-            # Remove _ids para evitar conflitos
-            for record in records:
-                if '_id' in record:
-                    del record['_id']
-            
-            # Insere no MongoDB
-            result = collection.insert_many(records)
-            print(f"💾 Salvos {len(result.inserted_ids)} registros no MongoDB")
-            return len(result.inserted_ids)
-            
-        except Exception as e:
-            print(f"❌ Erro ao salvar dados: {e}")
-            return 0
+            barramento.publicar("erro", mes=mes_referencia, etapa="download", mensagem=str(e))
+            raise
     
+    @perfil_memoria.medir("api.atualizacao_mes")
     def fetch_and_save_month(self, ano, mes):
         """Busca e salva dados de um mês COM PAGINAÇÃO CORRIGIDA"""
         try:
             print(f"🌐 Buscando {ano}-{mes:02d}...")
+            inicio = time.perf_counter()
+            barramento.publicar("mes_inicio", mes=f"{ano}{mes:02d}")
             
             # ✅ USAR o método com paginação corrigida
             records = self.fetch_all_records_for_month(ano, mes)
             
             if records:
-                # ✅ USAR o método otimizado de salvamento
-                saved_count = self.save_data_fast_insert(records)
+                # ✅ Staging + troca atômica: o mês só aparece quando estiver completo
+                saved_count = PublicadorMes(db).publicar(f"{ano}{mes:02d}", records)["registros"]
+                ingestao_registros.inc(saved_count)
+                ingestao_vazao.set(saved_count / max(time.perf_counter() - inicio, 1e-9))
+                cache_consultas.clear()
+                segundos = time.perf_counter() - inicio
+                barramento.publicar(
+                    "mes_concluido",
+                    mes=f"{ano}{mes:02d}",
+                    registros=saved_count,
+                    segundos=round(segundos, 2),
+                    registros_por_s=round(saved_count / max(segundos, 1e-9), 1)
+                )
                 print(f"✅ {ano}-{mes:02d}: {saved_count:,} registros")
                 return saved_count
             else:
                 print(f"⚠️  Sem dados para {ano}-{mes:02d}")
+                barramento.publicar("mes_concluido", mes=f"{ano}{mes:02d}", registros=0)
                 return 0
                 
         except Exception as e:
             print(f"❌ Erro ao carregar {ano}-{mes:02d}: {e}")
-            return 0
+            barramento.publicar("erro", mes=f"{ano}{mes:02d}", etapa="carga", mensagem=str(e))
+            raise
     
     def update_new_data(self):
         """ATUALIZAÇÃO PRINCIPAL: busca o próximo mês após o último no banco"""
@@ -282,6 +594,61 @@ class CCEEDataUpdater:
             }
             return result
 
+# ✅ Atualização automática: um único processo ingere por vez (lease em Mongo)
+estado_agendador = {
+    "ativo": CCEE_POLL_INTERVAL_MINUTES > 0,
+    "intervalo_minutos": CCEE_POLL_INTERVAL_MINUTES,
+    "proxima_execucao": None,
+    "ultima_execucao": None,
+    "ultimo_resultado": None,
+    "falhas_seguidas": 0
+}
+
+def executar_atualizacao(origem):
+    """Busca o próximo mês da CCEE segurando o lease (LeaseOcupado se outro processo já está ingerindo)"""
+    with LeaseMongo(db, LEASE_ATUALIZACAO, ttl_segundos=CCEE_LOCK_TTL_SECONDS) as lease:
+        print(f"🔒 Lease '{LEASE_ATUALIZACAO}' adquirido por {lease.dono} ({origem})")
+        barramento.publicar("atualizacao_inicio", origem=origem)
+        try:
+            result = CCEEDataUpdater().update_new_data()
+        except Exception as e:
+            barramento.publicar("erro", etapa="atualizacao", mensagem=str(e))
+            raise
+        barramento.publicar("atualizacao_fim", origem=origem, resultado=result)
+    estado_agendador["ultima_execucao"] = datetime.now().isoformat()
+    estado_agendador["ultimo_resultado"] = {**result, "origem": origem}
+    return result
+
+def proxima_espera(falhas):
+    """Intervalo com jitter; após falhas, backoff exponencial a partir de 1 min (limitado ao intervalo)"""
+    intervalo = CCEE_POLL_INTERVAL_MINUTES * 60
+    if falhas:
+        intervalo = min(intervalo, 60 * 2 ** (falhas - 1))
+    return intervalo * random.uniform(1 - CCEE_POLL_JITTER, 1 + CCEE_POLL_JITTER)
+
+async def agendar_atualizacoes():
+    """Verifica a CCEE periodicamente; com vários workers/réplicas só quem tem o lease ingere"""
+    print(f"⏰ Agendador CCEE ativo: a cada {CCEE_POLL_INTERVAL_MINUTES:g} min (jitter {CCEE_POLL_JITTER:.0%})")
+    espera = proxima_espera(0)
+    while True:
+        estado_agendador["proxima_execucao"] = datetime.fromtimestamp(time.time() + espera).isoformat()
+        await asyncio.sleep(espera)
+        if not estado_mongodb["pronto"]:
+            espera = proxima_espera(estado_agendador["falhas_seguidas"])
+            continue
+        try:
+            result = await asyncio.to_thread(executar_atualizacao, "agendador")
+            estado_agendador["falhas_seguidas"] = 0
+            # Encontrou um mês novo: já verifica o seguinte (recuperar meses atrasados)
+            espera = 5 if result.get("updated") else proxima_espera(0)
+        except LeaseOcupado as e:
+            print(f"⏭️  Atualização ignorada: {e}")
+            espera = proxima_espera(0)
+        except Exception as e:
+            estado_agendador["falhas_seguidas"] += 1
+            print(f"❌ Erro na atualização agendada ({estado_agendador['falhas_seguidas']}x): {e}")
+            espera = proxima_espera(estado_agendador["falhas_seguidas"])
+
 @app.get("/")
 async def root():
     return {
@@ -300,12 +667,11 @@ async def root():
 @app.get("/api/health")
 async def health_check():
     """Endpoint para verificar saúde da API"""
-    try:
-        # Testa a conexão com o MongoDB
-        client.admin.command('ping')
+    # Testa a conexão com o MongoDB
+    if await asyncio.to_thread(ping_mongodb):
         db_status = "connected"
-    except Exception as e:
-        db_status = f"error: {str(e)}"
+    else:
+        db_status = f"error: {estado_mongodb['erro']}"
     
     return {
         "status": "healthy",
@@ -319,49 +685,435 @@ async def health_check():
         "user": MONGODB_USER
     }
 
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness: o processo está respondendo (não depende do MongoDB)"""
+    return {"status": "alive", "pid": os.getpid(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness: o worker consegue atender consultas (último ping ao MongoDB com sucesso)"""
+    conteudo = {
+        "status": "ready" if estado_mongodb["pronto"] else "not_ready",
+        "pid": os.getpid(),
+        "database": DATABASE_NAME,
+        "database_error": estado_mongodb["erro"],
+        "last_ping": estado_mongodb["ultimo_ping"]
+    }
+    return JSONResponse(content=conteudo, status_code=200 if estado_mongodb["pronto"] else 503)
+
+# Máximo de valores em um filtro de lista (perfil, cnpj, sigla)
+MAX_VALORES_FILTRO = 500
+
+def lista_parametro(valor, normalizar=str.strip):
+    """Converte 'a,b,c' em uma tupla ordenada e sem repetições (chave estável de cache)"""
+    if not valor:
+        return ()
+    itens = valor if isinstance(valor, (list, tuple)) else str(valor).split(",")
+    valores = tuple(sorted({normalizar(item) for item in itens if str(item).strip()} - {""}))
+    if len(valores) > MAX_VALORES_FILTRO:
+        raise ValueError(f"Máximo de {MAX_VALORES_FILTRO} valores por filtro ({len(valores)} informados)")
+    return valores
+
+def somente_digitos(valor):
+    """CNPJ aceito com ou sem pontuação"""
+    return re.sub(r"\D", "", str(valor))
+
+def montar_filtro(empresa=None, ano=None, mes=None, perfil=None, cnpj=None, sigla=None, mes_inicio=None, mes_fim=None):
+    """
+    Monta o filtro Mongo comum às consultas
+
+    empresa/mes/ano como antes; perfil, cnpj e sigla aceitam listas separadas por
+    vírgula ($in) e mes_inicio/mes_fim formam um intervalo de MES_REFERENCIA, para
+    usar os índices (campo, MES_REFERENCIA)
+    """
+    query = {}
+    if empresa:
+        query["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}  # Busca case-insensitive
+    if mes:
+        query["MES_REFERENCIA"] = mes
+    if ano:
+        query["MES_REFERENCIA"] = {"$regex": f"^{ano}"}
+    
+    for campo, valor, normalizar in (
+        ("CODIGO_PERFIL_AGENTE", perfil, str.strip),
+        ("CNPJ", cnpj, somente_digitos),
+        ("SIGLA_PERFIL_AGENTE", sigla, lambda item: item.strip().upper())
+    ):
+        valores = lista_parametro(valor, normalizar)
+        if valores:
+            query[campo] = {"$in": list(valores)}
+    
+    intervalo = {}
+    if mes_inicio:
+        intervalo["$gte"] = mes_inicio
+    if mes_fim:
+        intervalo["$lte"] = mes_fim
+    if intervalo:
+        atual = query.get("MES_REFERENCIA")
+        if atual is None:
+            query["MES_REFERENCIA"] = intervalo
+        elif isinstance(atual, dict):
+            atual.update(intervalo)
+    return query
+
+def visivel(query=None):
+    """Filtro da consulta + só os registros publicados (sem lotes em publicação, ver versoes.py)"""
+    return {**(query or {}), **filtro_visivel(db)}
+
+def listar_meses():
+    """Meses distintos do banco (intermediário compartilhado por anos e stats)"""
+    return cache_consultas.get_or_set(("meses",), lambda: collection.distinct("MES_REFERENCIA", visivel()))
+
+def listar_empresas(ano=None):
+    """Empresas distintas, opcionalmente filtradas por ano"""
+    def buscar():
+        empresas = collection.distinct("NOME_EMPRESARIAL", visivel(montar_filtro(ano=ano)))
+        empresas.sort()
+        return empresas
+    return cache_consultas.get_or_set(("empresas", ano), buscar)
+
+def consultar_anos():
+    anos = list(set(mes[:4] for mes in listar_meses()))
+    anos.sort(reverse=True)
+    return {
+        "anos": anos,
+        "quantidade": len(anos)
+    }
+
+def consultar_empresas(ano=None):
+    empresas = listar_empresas(ano)
+    return {
+        "empresas": empresas,
+        "quantidade": len(empresas)
+    }
+
+def consultar_agregados(empresa=None, ano=None, group_by="mes"):
+    pipeline = []
+    
+    match_stage = montar_filtro(empresa=empresa, ano=ano)
+    
+    # Define agrupamento baseado no parâmetro
+    if group_by == "empresa":
+        group_id = "$NOME_EMPRESARIAL"
+    elif group_by == "ano":
+        group_id = {"$substr": ["$MES_REFERENCIA", 0, 4]}
+    else:  # mes (default)
+        group_id = "$MES_REFERENCIA"
+    
+    pipeline.extend([
+        {
+            "$group": {
+                "_id": group_id,
+                "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
+                "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
+                "quantidade_registros": {"$sum": 1},
+                "empresas_unicas": {"$addToSet": "$NOME_EMPRESARIAL"}
+            }
+        },
+        {
+            "$project": {
+                "mes": "$_id",
+                group_by: "$_id",
+                "total_venda": 1,
+                "total_compra": 1,
+                "quantidade_registros": 1,
+                "quantidade_empresas": {"$size": "$empresas_unicas"},
+                "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
+                "_id": 0
+            }
+        },
+        {
+            "$sort": {group_by: 1}
+        }
+    ])
+    
+    return cache_consultas.get_or_set(
+        ("agregados", empresa, ano, group_by),
+        lambda: parse_json(list(collection.aggregate([{"$match": visivel(match_stage)}, *pipeline])))
+    )
+
+def consultar_stats():
+    total_records = cache_consultas.get_or_set(("total_registros",), lambda: collection.count_documents(visivel()))
+    empresas_count = len(listar_empresas())
+    meses = listar_meses()
+    anos = list(set(mes[:4] for mes in meses))
+    
+    # Estatísticas por mês
+    pipeline_mes = [
+        {
+            "$group": {
+                "_id": "$MES_REFERENCIA",
+                "registros": {"$sum": 1},
+                "empresas_distintas": {"$addToSet": "$NOME_EMPRESARIAL"},
+                "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
+                "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}}
+            }
+        },
+        {
+            "$project": {
+                "mes": "$_id",
+                "registros": 1,
+                "quantidade_empresas": {"$size": "$empresas_distintas"},
+                "total_venda": 1,
+                "total_compra": 1,
+                "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
+                "_id": 0
+            }
+        },
+        {
+            "$sort": {"mes": 1}
+        }
+    ]
+    
+    stats_mes = cache_consultas.get_or_set(
+        ("stats_mes",), lambda: list(collection.aggregate([{"$match": visivel()}, *pipeline_mes]))
+    )
+    
+    # Top empresas
+    pipeline_empresas = [
+        {
+            "$group": {
+                "_id": "$NOME_EMPRESARIAL",
+                "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
+                "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
+                "meses_ativos": {"$addToSet": "$MES_REFERENCIA"}
+            }
+        },
+        {
+            "$project": {
+                "empresa": "$_id",
+                "total_venda": 1,
+                "total_compra": 1,
+                "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
+                "meses_ativos": {"$size": "$meses_ativos"},
+                "_id": 0
+            }
+        },
+        {
+            "$sort": {"saldo_liquido": -1}
+        },
+        {
+            "$limit": 10
+        }
+    ]
+    
+    top_empresas = cache_consultas.get_or_set(
+        ("top_empresas",), lambda: list(collection.aggregate([{"$match": visivel()}, *pipeline_empresas]))
+    )
+    
+    return {
+        "total_registros": total_records,
+        "quantidade_empresas": empresas_count,
+        "anos": anos,
+        "meses": meses,
+        "estatisticas_por_mes": stats_mes,
+        "top_empresas": top_empresas,
+        "timestamp": datetime.now().isoformat(),
+        "environment": "Local Development",
+        "database": DATABASE_NAME,
+        "authentication": "enabled",
+        "user": MONGODB_USER
+    }
+
+def consultar_perfis(perfil=None, cnpj=None, sigla=None, mes_inicio=None, mes_fim=None, limit=100, skip=0):
+    """
+    Séries mensais por perfil de agente (drilldown), paginadas por perfil
+
+    Exige ao menos um filtro de perfil, CNPJ ou sigla: a consulta usa os índices
+    (campo, MES_REFERENCIA) com $in + intervalo de meses, sem varrer a coleção.
+    """
+    limit, skip = int(limit), int(skip)
+    if not (perfil or cnpj or sigla):
+        raise ValueError("Informe ao menos um filtro: perfil, cnpj ou sigla")
+    if not 1 <= limit <= 1000 or skip < 0:
+        raise ValueError("limit deve estar entre 1 e 1000 e skip >= 0")
+    query = montar_filtro(perfil=perfil, cnpj=cnpj, sigla=sigla, mes_inicio=mes_inicio, mes_fim=mes_fim)
+    
+    def calcular():
+        filtro = visivel(query)
+        codigos = sorted(collection.distinct("CODIGO_PERFIL_AGENTE", filtro), key=str)
+        pagina = codigos[skip:skip + limit]
+        pipeline = [
+            {"$match": {**filtro, "CODIGO_PERFIL_AGENTE": {"$in": pagina}}},
+            {
+                "$group": {
+                    "_id": {"perfil": "$CODIGO_PERFIL_AGENTE", "mes": "$MES_REFERENCIA"},
+                    "venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
+                    "compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
+                    "registros": {"$sum": 1},
+                    "sigla": {"$last": "$SIGLA_PERFIL_AGENTE"},
+                    "empresa": {"$last": "$NOME_EMPRESARIAL"},
+                    "cnpj": {"$last": "$CNPJ"}
+                }
+            },
+            {"$sort": {"_id.perfil": 1, "_id.mes": 1}}
+        ]
+        
+        perfis = {}
+        meses = set()
+        for linha in collection.aggregate(pipeline):
+            codigo = linha["_id"]["perfil"]
+            mes = linha["_id"]["mes"]
+            meses.add(mes)
+            # Dados cadastrais do mês mais recente do perfil
+            item = perfis.setdefault(codigo, {"codigo": codigo, "serie": [], "total_venda": 0.0, "total_compra": 0.0})
+            item.update(sigla=linha["sigla"], empresa=linha["empresa"], cnpj=linha["cnpj"])
+            item["serie"].append({
+                "mes": mes,
+                "venda": linha["venda"],
+                "compra": linha["compra"],
+                "saldo": linha["venda"] - linha["compra"],
+                "registros": linha["registros"]
+            })
+            item["total_venda"] += linha["venda"]
+            item["total_compra"] += linha["compra"]
+        
+        for item in perfis.values():
+            item["saldo"] = item["total_venda"] - item["total_compra"]
+        
+        return parse_json({
+            "perfis": [perfis[codigo] for codigo in pagina if codigo in perfis],
+            "meses": sorted(meses),
+            "pagination": {
+                "total": len(codigos),
+                "limit": limit,
+                "skip": skip,
+                "has_more": (skip + limit) < len(codigos)
+            }
+        })
+    
+    chave = ("perfis", tuple(sorted((campo, str(valor)) for campo, valor in query.items())), limit, skip)
+    return cache_consultas.get_or_set(chave, calcular)
+
+# Sub-consultas aceitas pelo /api/batch e os parâmetros de cada uma
+CONSULTAS_BATCH = {
+    "anos": (consultar_anos, set()),
+    "empresas": (consultar_empresas, {"ano"}),
+    "agregados": (consultar_agregados, {"empresa", "ano", "group_by"}),
+    "stats": (consultar_stats, set()),
+    "perfis": (consultar_perfis, {"perfil", "cnpj", "sigla", "mes_inicio", "mes_fim", "limit", "skip"})
+}
+
+# Agregações sobre a coleção inteira, sujeitas ao portão de concorrência
+CONSULTAS_PESADAS = {"agregados", "stats"}
+
+class ConsultaBatch(BaseModel):
+    nome: str
+    tipo: str
+    params: Dict[str, Optional[str]] = {}
+
+class RequisicaoBatch(BaseModel):
+    filtros: Dict[str, Optional[str]] = {}
+    consultas: List[ConsultaBatch]
+
+CAMPOS_DADOS = (
+    "NOME_EMPRESARIAL", "MES_REFERENCIA", "CONTRATACAO_VENDA", "CONTRATACAO_COMPRA",
+    "SIGLA_PERFIL_AGENTE", "CNPJ", "CODIGO_PERFIL_AGENTE", "DATA_CARREGAMENTO"
+)
+CAMPOS_DADOS_PADRAO = (
+    "NOME_EMPRESARIAL", "MES_REFERENCIA", "CONTRATACAO_VENDA", "CONTRATACAO_COMPRA",
+    "SIGLA_PERFIL_AGENTE", "CNPJ"
+)
+# Campos muito repetidos entre as linhas: no formato colunar viram índices num dicionário
+CAMPOS_DICIONARIO = ("NOME_EMPRESARIAL", "MES_REFERENCIA")
+
+def parse_campos(fields):
+    """Valida a lista 'fields' (separada por vírgula) contra os campos permitidos"""
+    if not fields:
+        return list(CAMPOS_DADOS_PADRAO)
+    campos = []
+    for campo in fields.split(","):
+        campo = campo.strip().upper()
+        if campo and campo not in campos:
+            campos.append(campo)
+    invalidos = [campo for campo in campos if campo not in CAMPOS_DADOS]
+    if invalidos or not campos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos inválidos: {invalidos} (válidos: {list(CAMPOS_DADOS)})"
+        )
+    return campos
+
+def montar_colunas(dados, campos):
+    """
+    Converte a lista de documentos em uma lista por campo; NOME_EMPRESARIAL e
+    MES_REFERENCIA viram índices em um dicionário de valores distintos
+    """
+    colunas = {}
+    dicionarios = {}
+    for campo in campos:
+        valores = [documento.get(campo) for documento in dados]
+        if campo in CAMPOS_DICIONARIO:
+            indices = {}
+            colunas[campo] = [indices.setdefault(valor, len(indices)) for valor in valores]
+            dicionarios[campo] = list(indices)
+        else:
+            colunas[campo] = valores
+    return colunas, dicionarios
+
 @app.get("/api/dados")
 async def get_dados(
     empresa: Optional[str] = Query(None),
     mes: Optional[str] = Query(None),
     ano: Optional[str] = Query(None),
     limit: int = Query(1000, ge=1, le=10000),
-    skip: int = Query(0, ge=0)
+    skip: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None),
+    format: str = Query("rows", regex="^(rows|columnar)$"),
+    perfil: Optional[str] = Query(None),
+    cnpj: Optional[str] = Query(None),
+    sigla: Optional[str] = Query(None),
+    mes_inicio: Optional[str] = Query(None, regex="^[0-9]{6}$"),
+    mes_fim: Optional[str] = Query(None, regex="^[0-9]{6}$")
 ):
-    """Retorna dados do MongoDB com paginação"""
+    """Retorna dados do MongoDB com paginação (linhas ou colunar, com os campos pedidos)"""
+    campos = parse_campos(fields)
     try:
-        query = {}
-        if empresa:
-            query["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}  # Busca case-insensitive
-        if mes:
-            query["MES_REFERENCIA"] = mes
-        if ano:
-            query["MES_REFERENCIA"] = {"$regex": f"^{ano}"}
-        
+        query = montar_filtro(
+            empresa=empresa, ano=ano, mes=mes, perfil=perfil, cnpj=cnpj, sigla=sigla,
+            mes_inicio=mes_inicio, mes_fim=mes_fim
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def buscar():
         # Conta total de documentos
-        total_count = collection.count_documents(query)
-        
-        # Busca dados com paginação
-        dados = list(collection.find(query, {
-            '_id': 0,
-            'NOME_EMPRESARIAL': 1,
-            'MES_REFERENCIA': 1,
-            'CONTRATACAO_VENDA': 1,
-            'CONTRATACAO_COMPRA': 1,
-            'SIGLA_PERFIL_AGENTE': 1,
-            'CNPJ': 1
-        }).skip(skip).limit(limit))
-        
-        print(f"📊 Retornando {len(dados)} registros (total: {total_count})")
-        
-        return JSONResponse(content={
+        filtro = visivel(query)
+        total_count = collection.count_documents(filtro)
+        
+        # Busca dados com paginação, projetando só os campos pedidos
+        projecao = {'_id': 0, **{campo: 1 for campo in campos}}
+        dados = list(collection.find(filtro, projecao).skip(skip).limit(limit))
+        
+        print(f"📊 Retornando {len(dados)} registros (total: {total_count}, formato: {format})")
+        
+        pagination = {
+            "total": total_count,
+            "limit": limit,
+            "skip": skip,
+            "has_more": (skip + limit) < total_count
+        }
+        
+        if format == "columnar":
+            colunas, dicionarios = montar_colunas(dados, campos)
+            return parse_json({
+                "format": "columnar",
+                "fields": campos,
+                "length": len(dados),
+                "columns": colunas,
+                "dictionaries": dicionarios,
+                "pagination": pagination
+            })
+        
+        return {
             "data": parse_json(dados),
-            "pagination": {
-                "total": total_count,
-                "limit": limit,
-                "skip": skip,
-                "has_more": (skip + limit) < total_count
-            }
-        })
+            "pagination": pagination
+        }
+    
+    try:
+        # Contagem, leitura e montagem das colunas fora do event loop
+        return JSONResponse(content=await asyncio.to_thread(buscar))
         
     except Exception as e:
         print(f"❌ Erro: {e}")
@@ -376,75 +1128,50 @@ async def get_dados_agregados(
 ):
     """Retorna dados agregados por mês, empresa ou ano"""
     try:
-        pipeline = []
-        
-        match_stage = {}
-        if empresa:
-            match_stage["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}
-        if ano:
-            match_stage["MES_REFERENCIA"] = {"$regex": f"^{ano}"}
-        
-        if match_stage:
-            pipeline.append({"$match": match_stage})
-        
-        # Define agrupamento baseado no parâmetro
-        if group_by == "empresa":
-            group_id = "$NOME_EMPRESARIAL"
-        elif group_by == "ano":
-            group_id = {"$substr": ["$MES_REFERENCIA", 0, 4]}
-        else:  # mes (default)
-            group_id = "$MES_REFERENCIA"
-        
-        pipeline.extend([
-            {
-                "$group": {
-                    "_id": group_id,
-                    "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
-                    "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
-                    "quantidade_registros": {"$sum": 1},
-                    "empresas_unicas": {"$addToSet": "$NOME_EMPRESARIAL"}
-                }
-            },
-            {
-                "$project": {
-                    "mes": "$_id",
-                    group_by: "$_id",
-                    "total_venda": 1,
-                    "total_compra": 1,
-                    "quantidade_registros": 1,
-                    "quantidade_empresas": {"$size": "$empresas_unicas"},
-                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
-                    "_id": 0
-                }
-            },
-            {
-                "$sort": {group_by: 1}
-            }
-        ])
-        
-        dados_agregados = list(collection.aggregate(pipeline))
+        dados_agregados = await executar_consulta(
+            "agregados", consultar_agregados, pesada=True, empresa=empresa, ano=ano, group_by=group_by
+        )
         print(f"📈 Retornando {len(dados_agregados)} registros agregados por {group_by}")
-        return JSONResponse(content=parse_json(dados_agregados))
+        return JSONResponse(content=dados_agregados)
         
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
     except Exception as e:
         print(f"❌ Erro: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erro ao buscar dados agregados: {str(e)}")
 
+@app.get("/api/drilldown/perfis")
+async def get_drilldown_perfis(
+    perfil: Optional[str] = Query(None),
+    cnpj: Optional[str] = Query(None),
+    sigla: Optional[str] = Query(None),
+    mes_inicio: Optional[str] = Query(None, regex="^[0-9]{6}$"),
+    mes_fim: Optional[str] = Query(None, regex="^[0-9]{6}$"),
+    limit: int = Query(100, ge=1, le=1000),
+    skip: int = Query(0, ge=0)
+):
+    """Séries mensais por perfil (listas de perfil, CNPJ ou sigla separadas por vírgula)"""
+    try:
+        resultado = await executar_consulta(
+            "perfis", consultar_perfis, perfil=perfil, cnpj=cnpj, sigla=sigla,
+            mes_inicio=mes_inicio, mes_fim=mes_fim, limit=limit, skip=skip
+        )
+        print(f"🔎 Drilldown: {len(resultado['perfis'])} perfis (total: {resultado['pagination']['total']})")
+        return JSONResponse(content=resultado)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar séries por perfil: {str(e)}")
+
 @app.get("/api/empresas")
 async def get_empresas(ano: Optional[str] = Query(None)):
     """Retorna lista de empresas"""
     try:
-        query = {}
-        if ano:
-            query["MES_REFERENCIA"] = {"$regex": f"^{ano}"}
-            
-        empresas = collection.distinct("NOME_EMPRESARIAL", query)
-        empresas.sort()
-        return {
-            "empresas": empresas,
-            "quantidade": len(empresas)
-        }
+        return await executar_consulta("empresas", consultar_empresas, ano=ano)
         
     except Exception as e:
         print(f"❌ Erro: {e}")
@@ -454,13 +1181,7 @@ async def get_empresas(ano: Optional[str] = Query(None)):
 async def get_anos():
     """Retorna lista de anos"""
     try:
-        meses = collection.distinct("MES_REFERENCIA")
-        anos = list(set(mes[:4] for mes in meses))
-        anos.sort(reverse=True)
-        return {
-            "anos": anos,
-            "quantidade": len(anos)
-        }
+        return await executar_consulta("anos", consultar_anos)
         
     except Exception as e:
         print(f"❌ Erro: {e}")
@@ -470,106 +1191,567 @@ async def get_anos():
 async def get_stats():
     """Retorna estatísticas completas"""
     try:
-        total_records = collection.count_documents({})
-        empresas_count = len(collection.distinct("NOME_EMPRESARIAL"))
-        meses = collection.distinct("MES_REFERENCIA")
-        anos = list(set(mes[:4] for mes in meses))
+        return await executar_consulta("stats", consultar_stats, pesada=True)
         
-        # Estatísticas por mês
-        pipeline_mes = [
-            {
-                "$group": {
-                    "_id": "$MES_REFERENCIA",
-                    "registros": {"$sum": 1},
-                    "empresas_distintas": {"$addToSet": "$NOME_EMPRESARIAL"},
-                    "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
-                    "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}}
-                }
-            },
-            {
-                "$project": {
-                    "mes": "$_id",
-                    "registros": 1,
-                    "quantidade_empresas": {"$size": "$empresas_distintas"},
-                    "total_venda": 1,
-                    "total_compra": 1,
-                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
-                    "_id": 0
-                }
-            },
-            {
-                "$sort": {"mes": 1}
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+
+def consultar_dashboard(ano=None):
+    return DashboardMaterializado(db).obter(ano)
+
+@app.get("/api/dashboard")
+async def get_dashboard(
+    request: Request,
+    ano: Optional[str] = Query(None, regex=r"^\d{4}$")
+):
+    """
+    Dados da primeira tela (anos, empresas, agregados por mês e top empresas) em uma
+    requisição: bytes pré-serializados, em gzip quando o cliente aceita, com ETag
+    """
+    try:
+        bundle = await executar_consulta("dashboard", consultar_dashboard, ano=ano)
+        if bundle is None:
+            raise HTTPException(status_code=404, detail=f"Sem dados para o ano {ano}")
+
+        headers = {"ETag": f'"{bundle["etag"]}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        if bundle.get("gzip") and "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=bundle["gzip"], media_type="application/json", headers=headers)
+        return Response(content=bundle["json"], media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Erro ao obter dashboard: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao obter dashboard: {str(e)}")
+
+@app.post("/api/batch")
+async def post_batch(requisicao: RequisicaoBatch):
+    """Executa várias consultas do dashboard em paralelo, com filtros e cache compartilhados"""
+    if not requisicao.consultas:
+        raise HTTPException(status_code=400, detail="Nenhuma consulta informada")
+    if len(requisicao.consultas) > 20:
+        raise HTTPException(status_code=400, detail="Máximo de 20 consultas por batch")
+    
+    nomes = [consulta.nome for consulta in requisicao.consultas]
+    if len(set(nomes)) != len(nomes):
+        raise HTTPException(status_code=400, detail="Nomes de consultas repetidos")
+    
+    for consulta in requisicao.consultas:
+        if consulta.tipo not in CONSULTAS_BATCH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tipo de consulta inválido: {consulta.tipo} (válidos: {sorted(CONSULTAS_BATCH)})"
+            )
+    
+    async def executar(consulta):
+        funcao, aceitos = CONSULTAS_BATCH[consulta.tipo]
+        # Filtros compartilhados primeiro; parâmetros da sub-consulta têm prioridade
+        params = {**requisicao.filtros, **consulta.params}
+        params = {chave: valor for chave, valor in params.items() if chave in aceitos and valor is not None}
+        if params.get("group_by", "mes") not in ("mes", "empresa", "ano"):
+            return {"sucesso": False, "erro": "group_by deve ser mes, empresa ou ano", "tempo_ms": 0.0}
+        
+        inicio = time.perf_counter()
+        try:
+            dados = await executar_consulta(
+                consulta.tipo, funcao, pesada=consulta.tipo in CONSULTAS_PESADAS, **params
+            )
+            return {
+                "sucesso": True,
+                "dados": dados,
+                "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
             }
-        ]
+        except Sobrecarga as e:
+            return {
+                "sucesso": False,
+                "erro": str(e),
+                "retry_after": e.retry_after,
+                "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+            }
+        except Exception as e:
+            print(f"❌ Erro na sub-consulta {consulta.nome}: {e}")
+            return {
+                "sucesso": False,
+                "erro": str(e),
+                "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+            }
+    
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(executar(consulta) for consulta in requisicao.consultas))
+    tempo_total = round((time.perf_counter() - inicio) * 1000, 2)
+    
+    print(f"📦 Batch com {len(nomes)} consultas em {tempo_total} ms")
+    
+    return JSONResponse(content=parse_json({
+        "resultados": dict(zip(nomes, resultados)),
+        "tempo_total_ms": tempo_total
+    }))
+
+def consultar_comparacao(periodo, base=None, modo="mom", empresa=None):
+    """Compara dois períodos (MoM / YoY) por empresa usando o rollup mensal"""
+    if not base:
+        base = periodo_base(periodo, modo)
+    if len(base) != len(periodo):
+        raise ValueError("periodo e base devem ter o mesmo formato (YYYY ou YYYYMM)")
+    
+    meses_periodo = meses_do_periodo(periodo)
+    meses_base = meses_do_periodo(base)
+    
+    # Ano ainda incompleto: compara só os meses que o período já tem com os mesmos
+    # meses da base (jan-mar/2025 x jan-mar/2024), não com o ano base inteiro
+    parcial = False
+    if len(periodo) == 4:
+        presentes = sorted(get_rollup().collection.distinct("MES_REFERENCIA", {"MES_REFERENCIA": {"$in": meses_periodo}}))
+        if len(presentes) < len(meses_periodo):
+            parcial = True
+            meses_periodo = presentes
+            meses_base = [f"{base}{mes[4:]}" for mes in presentes]
+    
+    # Busca limitada pelo índice (MES_REFERENCIA, NOME_EMPRESARIAL) do rollup
+    match_stage = {"MES_REFERENCIA": {"$in": meses_periodo + meses_base}}
+    if empresa:
+        match_stage["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}
+    
+    def soma_se(meses, campo):
+        return {"$sum": {"$cond": [{"$in": ["$MES_REFERENCIA", meses]}, campo, 0]}}
+    
+    pipeline = [
+        {"$match": match_stage},
+        {
+            "$group": {
+                "_id": "$NOME_EMPRESARIAL",
+                "venda_base": soma_se(meses_base, "$total_venda"),
+                "compra_base": soma_se(meses_base, "$total_compra"),
+                "registros_base": soma_se(meses_base, "$registros"),
+                "venda_periodo": soma_se(meses_periodo, "$total_venda"),
+                "compra_periodo": soma_se(meses_periodo, "$total_compra"),
+                "registros_periodo": soma_se(meses_periodo, "$registros")
+            }
+        }
+    ]
+    
+    linhas = cache_consultas.get_or_set(
+        ("comparacao", tuple(meses_periodo), tuple(meses_base), empresa),
+        lambda: list(get_rollup().collection.aggregate(pipeline))
+    )
+    
+    empresas = []
+    entrantes = []
+    saintes = []
+    totais = {campo: 0.0 for campo in ("venda_base", "compra_base", "venda_periodo", "compra_periodo")}
+    
+    for linha in linhas:
+        nome = linha["_id"]
+        saldo_base = linha["venda_base"] - linha["compra_base"]
+        saldo_periodo = linha["venda_periodo"] - linha["compra_periodo"]
         
-        stats_mes = list(collection.aggregate(pipeline_mes))
+        if linha["registros_base"] == 0:
+            entrantes.append(nome)
+        elif linha["registros_periodo"] == 0:
+            saintes.append(nome)
         
-        # Top empresas
-        pipeline_empresas = [
-            {
-                "$group": {
-                    "_id": "$NOME_EMPRESARIAL",
-                    "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
-                    "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
-                    "meses_ativos": {"$addToSet": "$MES_REFERENCIA"}
-                }
-            },
-            {
-                "$project": {
-                    "empresa": "$_id",
-                    "total_venda": 1,
-                    "total_compra": 1,
-                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
-                    "meses_ativos": {"$size": "$meses_ativos"},
-                    "_id": 0
-                }
-            },
-            {
-                "$sort": {"saldo_liquido": -1}
-            },
-            {
-                "$limit": 10
-            }
-        ]
+        for campo in totais:
+            totais[campo] += linha[campo]
         
-        top_empresas = list(collection.aggregate(pipeline_empresas))
+        empresas.append({
+            "empresa": nome,
+            "venda_base": linha["venda_base"],
+            "venda_periodo": linha["venda_periodo"],
+            "delta_venda": linha["venda_periodo"] - linha["venda_base"],
+            "variacao_venda_pct": variacao_percentual(linha["venda_base"], linha["venda_periodo"]),
+            "compra_base": linha["compra_base"],
+            "compra_periodo": linha["compra_periodo"],
+            "delta_compra": linha["compra_periodo"] - linha["compra_base"],
+            "variacao_compra_pct": variacao_percentual(linha["compra_base"], linha["compra_periodo"]),
+            "saldo_base": saldo_base,
+            "saldo_periodo": saldo_periodo,
+            "delta_saldo": saldo_periodo - saldo_base,
+            "variacao_saldo_pct": variacao_percentual(saldo_base, saldo_periodo)
+        })
+    
+    empresas.sort(key=lambda item: abs(item["delta_saldo"]), reverse=True)
+    
+    saldo_base_total = totais["venda_base"] - totais["compra_base"]
+    saldo_periodo_total = totais["venda_periodo"] - totais["compra_periodo"]
+    
+    print(f"📊 Comparação {base} → {periodo}: {len(empresas)} empresas{' (parcial)' if parcial else ''}")
+    
+    return {
+        "periodo": periodo,
+        "base": base,
+        "tipo": modo,
+        "parcial": parcial,
+        "meses_periodo": meses_periodo,
+        "meses_base": meses_base,
+        "totais": {
+            "venda_base": totais["venda_base"],
+            "venda_periodo": totais["venda_periodo"],
+            "delta_venda": totais["venda_periodo"] - totais["venda_base"],
+            "variacao_venda_pct": variacao_percentual(totais["venda_base"], totais["venda_periodo"]),
+            "compra_base": totais["compra_base"],
+            "compra_periodo": totais["compra_periodo"],
+            "delta_compra": totais["compra_periodo"] - totais["compra_base"],
+            "variacao_compra_pct": variacao_percentual(totais["compra_base"], totais["compra_periodo"]),
+            "saldo_base": saldo_base_total,
+            "saldo_periodo": saldo_periodo_total,
+            "delta_saldo": saldo_periodo_total - saldo_base_total,
+            "variacao_saldo_pct": variacao_percentual(saldo_base_total, saldo_periodo_total)
+        },
+        "empresas": empresas,
+        "entrantes": sorted(entrantes),
+        "saintes": sorted(saintes),
+        "quantidade_empresas": len(empresas)
+    }
+
+@app.get("/api/comparacao")
+async def get_comparacao(
+    periodo: str = Query(..., regex="^[0-9]{4}([0-9]{2})?$"),
+    base: Optional[str] = Query(None, regex="^[0-9]{4}([0-9]{2})?$"),
+    tipo: str = Query("mom", regex="^(mom|yoy)$"),
+    empresa: Optional[str] = Query(None)
+):
+    """Compara dois períodos (MoM / YoY) por empresa usando o rollup mensal"""
+    try:
+        return await executar_consulta(
+            "comparacao", consultar_comparacao, pesada=True, periodo=periodo, base=base, modo=tipo, empresa=empresa
+        )
         
-        return {
-            "total_registros": total_records,
-            "quantidade_empresas": empresas_count,
-            "anos": anos,
-            "meses": meses,
-            "estatisticas_por_mes": stats_mes,
-            "top_empresas": top_empresas,
-            "timestamp": datetime.now().isoformat(),
-            "environment": "Local Development",
-            "database": DATABASE_NAME,
-            "authentication": "enabled",
-            "user": MONGODB_USER
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao comparar períodos: {str(e)}")
+
+# "Unrecognized pipeline stage name": MongoDB < 5.0 não tem $setWindowFields
+CODIGO_ESTAGIO_DESCONHECIDO = 40324
+
+def consultar_janelas(janelas="3,6,12", empresa=None, ano=None, metrica="venda"):
+    """Somas móveis (3/6/12 meses) e acumulado do ano por empresa, calculados no banco"""
+    tamanhos = sorted(set(int(janela) for janela in janelas.split(",") if int(janela) > 0))
+    if not tamanhos or tamanhos[-1] > 120:
+        raise ValueError("janelas devem estar entre 1 e 120 meses")
+    
+    match_stage = {}
+    mes_inicio = None
+    if empresa:
+        match_stage["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}
+    if ano:
+        # Inclui os meses anteriores necessários para a maior janela
+        mes_inicio = f"{ano}01"
+        match_stage["MES_INDICE"] = {
+            "$gte": indice_mes(mes_inicio) - (tamanhos[-1] - 1),
+            "$lte": indice_mes(f"{ano}12")
         }
+    
+    def calcular():
+        rollup = get_rollup()
+        try:
+            series = list(rollup.collection.aggregate(
+                pipeline_janelas(match_stage, metrica, tamanhos, mes_inicio),
+                allowDiskUse=True
+            ))
+            motor = "mongodb"
+        except OperationFailure as e:
+            if e.code != CODIGO_ESTAGIO_DESCONHECIDO:
+                raise
+            # Calcula sobre o rollup em memória
+            print(f"⚠️  $setWindowFields indisponível ({e}), usando cálculo local")
+            campo = METRICAS_ROLLUP[metrica][1:]
+            cursor = rollup.collection.find(
+                match_stage,
+                {"_id": 0, "NOME_EMPRESARIAL": 1, "MES_REFERENCIA": 1, campo: 1}
+            ).sort([("NOME_EMPRESARIAL", 1), ("MES_REFERENCIA", 1)])
+            linhas = ({**linha, "valor": linha.get(campo)} for linha in cursor)
+            series = calcular_janelas(linhas, tamanhos, mes_inicio)
+            motor = "python"
+        
+        for serie in series:
+            serie["empresa"] = serie.pop("_id")
+        
+        print(f"📈 Janelas {tamanhos} de {len(series)} empresas ({motor})")
+        return parse_json({
+            "metrica": metrica,
+            "janelas": tamanhos,
+            "ano": ano,
+            "motor": motor,
+            "series": series,
+            "quantidade_empresas": len(series)
+        })
+    
+    return cache_consultas.get_or_set(("janelas", tuple(tamanhos), empresa, ano, metrica), calcular)
+
+@app.get("/api/janelas")
+async def get_janelas(
+    empresa: Optional[str] = Query(None),
+    ano: Optional[str] = Query(None, regex="^[0-9]{4}$"),
+    metrica: str = Query("venda", regex="^(venda|compra|saldo)$"),
+    janelas: str = Query("3,6,12", regex="^[0-9]+(,[0-9]+)*$")
+):
+    """Somas móveis (3/6/12 meses) e acumulado do ano por empresa, calculados no banco"""
+    try:
+        resultado = await executar_consulta(
+            "janelas", consultar_janelas, pesada=True, janelas=janelas, empresa=empresa, ano=ano, metrica=metrica
+        )
+        return JSONResponse(content=resultado)
         
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ Erro: {e}")
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular janelas: {str(e)}")
+
+def calcular_distribuicao(periodo=None, campo="venda", buckets=20):
+    """Histograma, quantis e índices de concentração (Gini/HHI) dos volumes contratados"""
+    campo_bruto = "CONTRATACAO_VENDA" if campo == "venda" else "CONTRATACAO_COMPRA"
+    campo_rollup = "$total_venda" if campo == "venda" else "$total_compra"
+    
+    match_stage = {}
+    if periodo:
+        match_stage["MES_REFERENCIA"] = {"$in": meses_do_periodo(periodo)}
+    
+    saida_bucket = {
+        "quantidade": {"$sum": 1},
+        "soma": {"$sum": "$valor"},
+        "maximo": {"$max": "$valor"}
+    }
+    
+    # Tudo calculado no servidor: o Python só recebe os buckets
+    pipeline = [
+        {"$match": visivel(match_stage)},
+        {"$project": {"_id": 0, "valor": {"$toDouble": f"${campo_bruto}"}}},
+        {"$match": {"valor": {"$ne": None}}},
+        {
+            "$facet": {
+                "histograma": [
+                    {"$bucketAuto": {"groupBy": "$valor", "buckets": buckets, "output": saida_bucket}}
+                ],
+                "percentis": [
+                    {"$bucketAuto": {"groupBy": "$valor", "buckets": 100, "output": saida_bucket}}
+                ],
+                "resumo": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "quantidade": {"$sum": 1},
+                            "soma": {"$sum": "$valor"},
+                            "minimo": {"$min": "$valor"},
+                            "maximo": {"$max": "$valor"},
+                            "media": {"$avg": "$valor"}
+                        }
+                    },
+                    {"$project": {"_id": 0}}
+                ]
+            }
+        }
+    ]
+    
+    resultado = next(collection.aggregate(pipeline, allowDiskUse=True), {})
+    resumo = (resultado.get("resumo") or [{}])[0]
+    total = resumo.get("quantidade", 0)
+    
+    histograma = [
+        {
+            "de": bucket["_id"]["min"],
+            "ate": bucket["_id"]["max"],
+            "quantidade": bucket["quantidade"],
+            "soma": bucket["soma"]
+        }
+        for bucket in resultado.get("histograma", [])
+    ]
+    
+    # Concentração por empresa sobre o rollup (uma linha por empresa)
+    pipeline_empresas = [
+        {"$match": match_stage},
+        {"$group": {"_id": "$NOME_EMPRESARIAL", "total": {"$sum": campo_rollup}}}
+    ]
+    totais_empresas = [linha["total"] for linha in get_rollup().collection.aggregate(pipeline_empresas)]
+    
+    print(f"📊 Distribuição de {campo_bruto} ({periodo or 'todos'}): {total:,} registros")
+    
+    return parse_json({
+        "periodo": periodo,
+        "campo": campo_bruto,
+        "resumo": resumo,
+        "quantis": quantis_de_buckets(resultado.get("percentis", []), total, (0.5, 0.9, 0.99)),
+        "histograma": histograma,
+        "concentracao": {
+            "quantidade_empresas": len(totais_empresas),
+            "gini": indice_gini(totais_empresas),
+            "hhi": indice_hhi(totais_empresas)
+        }
+    })
+
+def consultar_distribuicao(periodo=None, campo="venda", buckets=20):
+    return cache_consultas.get_or_set(
+        ("distribuicao", periodo, campo, buckets),
+        lambda: calcular_distribuicao(periodo, campo, buckets)
+    )
+
+@app.get("/api/distribuicao")
+async def get_distribuicao(
+    periodo: Optional[str] = Query(None, regex="^[0-9]{4}([0-9]{2})?$"),
+    campo: str = Query("venda", regex="^(venda|compra)$"),
+    buckets: int = Query(20, ge=2, le=100)
+):
+    """Histograma, quantis e índices de concentração (Gini/HHI) dos volumes contratados"""
+    try:
+        resultado = await executar_consulta(
+            "distribuicao", consultar_distribuicao, pesada=True, periodo=periodo, campo=campo, buckets=buckets
+        )
+        return JSONResponse(content=resultado)
+        
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular distribuição: {str(e)}")
+
+CAMPOS_PIVOT = {
+    "venda": "total_venda",
+    "compra": "total_compra",
+    "saldo": "saldo_liquido",
+    "registros": "registros"
+}
+
+def calcular_pivot(metrica="venda", ano=None, empresa=None):
+    """Tabela dinâmica empresa x mês com totais de linha e coluna, montada sobre o rollup"""
+    campo = CAMPOS_PIVOT[metrica]
+    query = {}
+    if ano:
+        query["ANO"] = ano
+    if empresa:
+        query["NOME_EMPRESARIAL"] = {"$regex": empresa, "$options": "i"}
+    
+    rollup = get_rollup()
+    meses = sorted(rollup.collection.distinct("MES_REFERENCIA", query))
+    posicao = {mes: i for i, mes in enumerate(meses)}
+    
+    # Percorre o rollup ordenado por empresa: uma linha da tabela por empresa
+    cursor = rollup.collection.find(
+        query,
+        {"_id": 0, "NOME_EMPRESARIAL": 1, "MES_REFERENCIA": 1, campo: 1}
+    ).sort([("NOME_EMPRESARIAL", 1), ("MES_REFERENCIA", 1)])
+    
+    linhas = []
+    valores = None
+    for linha in cursor:
+        if not linhas or linhas[-1]["empresa"] != linha["NOME_EMPRESARIAL"]:
+            valores = [None] * len(meses)
+            linhas.append({"empresa": linha["NOME_EMPRESARIAL"], "valores": valores})
+        valores[posicao[linha["MES_REFERENCIA"]]] = linha.get(campo, 0)
+    
+    totais = [0] * len(meses)
+    for linha in linhas:
+        linha["total"] = sum(valor for valor in linha["valores"] if valor is not None)
+        for i, valor in enumerate(linha["valores"]):
+            if valor is not None:
+                totais[i] += valor
+    
+    print(f"📊 Pivot {metrica}: {len(linhas)} empresas x {len(meses)} meses")
+    return parse_json({
+        "metrica": metrica,
+        "colunas": meses,
+        "linhas": linhas,
+        "totais": totais,
+        "total_geral": sum(totais)
+    })
+
+def consultar_pivot(metrica="venda", ano=None, empresa=None):
+    return cache_consultas.get_or_set(
+        ("pivot", metrica, ano, empresa),
+        lambda: calcular_pivot(metrica, ano, empresa)
+    )
+
+@app.get("/api/pivot")
+async def get_pivot(
+    metrica: str = Query("venda", regex="^(venda|compra|saldo|registros)$"),
+    ano: Optional[str] = Query(None, regex="^[0-9]{4}$"),
+    empresa: Optional[str] = Query(None),
+    formato: str = Query("json", regex="^(json|csv)$")
+):
+    """Tabela dinâmica empresa x mês com totais de linha e coluna (JSON ou CSV para Excel)"""
+    try:
+        pivot = await executar_consulta(
+            "pivot", consultar_pivot, pesada=True, metrica=metrica, ano=ano, empresa=empresa
+        )
+        if formato == "json":
+            return JSONResponse(content=pivot)
+        
+        def gerar_csv():
+            # BOM + ';' + vírgula decimal: abre direto no Excel pt-BR
+            yield "\ufeff" + ";".join(["Rótulos de Linha"] + pivot["colunas"] + ["Total Geral"]) + "\r\n"
+            bloco = []
+            for linha in pivot["linhas"]:
+                celulas = ["" if valor is None else formatar_numero_ptbr(valor) for valor in linha["valores"]]
+                bloco.append(";".join(
+                    [linha["empresa"].replace(";", ",")] + celulas + [formatar_numero_ptbr(linha["total"])]
+                ) + "\r\n")
+                if len(bloco) >= 500:
+                    yield "".join(bloco)
+                    bloco = []
+            bloco.append(";".join(
+                ["Total Geral"] + [formatar_numero_ptbr(total) for total in pivot["totais"]]
+                + [formatar_numero_ptbr(pivot["total_geral"])]
+            ) + "\r\n")
+            yield "".join(bloco)
+        
+        nome_arquivo = f"ccee_pivot_{metrica}_{ano or 'todos'}.csv"
+        return StreamingResponse(
+            gerar_csv(),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'}
+        )
+        
+    except Sobrecarga as e:
+        raise erro_sobrecarga(e)
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar pivot: {str(e)}")
 
 @app.delete("/api/clear-data")
 async def clear_data():
     """Limpa todos os dados (apenas desenvolvimento)"""
+    def limpar():
+        # Mesmo lease da atualização: não apaga no meio de uma publicação
+        with LeaseMongo(db, LEASE_ATUALIZACAO, ttl_segundos=CCEE_LOCK_TTL_SECONDS):
+            result = collection.delete_many({})
+            get_rollup().clear()
+            materializar_dashboard(db)
+        return result.deleted_count
+    
     try:
-        result = collection.delete_many({})
+        deleted_count = await asyncio.to_thread(limpar)
+        cache_consultas.clear()
         return {
             "message": "Dados removidos com sucesso",
-            "deleted_count": result.deleted_count,
+            "deleted_count": deleted_count,
             "timestamp": datetime.now().isoformat()
         }
+    except LeaseOcupado as e:
+        raise HTTPException(status_code=409, detail=f"Atualização em andamento: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
 
 @app.get("/api/config")
 async def get_config():
     """Retorna configurações atuais (apenas desenvolvimento)"""
-    return {
+    config = {
         "mongodb_uri": f"mongodb://{MONGODB_USER}:******@{MONGODB_HOST}:{MONGODB_PORT}/{DATABASE_NAME}",
         "database_name": DATABASE_NAME,
         "api_port": API_PORT,
@@ -578,6 +1760,12 @@ async def get_config():
         "authentication": "enabled",
         "user": MONGODB_USER
     }
+    # O catálogo vem do Mongo: fora do event loop, e sem ele se o banco não responder
+    try:
+        config["ccee_resources"] = parse_json(await asyncio.to_thread(DescobertaCKAN(db, CCEE_API_URL).estado))
+    except Exception as e:
+        print(f"⚠️  Catálogo CKAN indisponível em /api/config: {e}")
+    return config
 
 @app.post("/api/update-ccee-data")
 async def update_ccee_data():
@@ -585,13 +1773,14 @@ async def update_ccee_data():
     try:
         print("🔄 Iniciando atualização de dados da CCEE...")
         
-        updater = CCEEDataUpdater()
-        result = updater.update_new_data()
+        result = await asyncio.to_thread(executar_atualizacao, "api")
         
         print(f"🎯 Resultado da atualização: {result}")
         
         return result
         
+    except LeaseOcupado as e:
+        raise HTTPException(status_code=409, detail=f"Atualização já em andamento: {e}")
     except Exception as e:
         print(f"❌ Erro na atualização: {e}")
         traceback.print_exc()
@@ -600,6 +1789,122 @@ async def update_ccee_data():
             detail=f"Erro ao atualizar dados: {str(e)}"
         )
 
+@app.get("/api/ingestao/eventos")
+async def stream_eventos_ingestao(
+    request: Request,
+    ultimo_id: int = Query(0, ge=0),
+    historico: bool = Query(True)
+):
+    """
+    Server-Sent Events com o progresso da ingestão (páginas, registros, meses, ETA, erros)
+    
+    O barramento é em processo: com API_WORKERS > 1 o cliente só vê a ingestão que
+    roda no worker em que conectou (o agendador ingere em um worker só, o do lease).
+    """
+    # Last-Event-ID inválido é ignorado: o cliente recebe o histórico como se fosse novo
+    try:
+        ultimo_id = max(int(request.headers.get("last-event-id") or ultimo_id), 0)
+    except ValueError:
+        pass
+    if not historico and not ultimo_id:
+        ultimo_id = barramento.publicados
+    assinatura = barramento.assinar()
+    
+    def formatar(evento):
+        dados = json.dumps(evento, default=str, ensure_ascii=False)
+        return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+    
+    async def gerar():
+        try:
+            # Reconexão (Last-Event-ID) ou cliente novo: repassa o histórico recente
+            enviados = ultimo_id
+            for evento in barramento.recentes(ultimo_id):
+                enviados = evento["id"]
+                yield formatar(evento)
+            while not await request.is_disconnected():
+                try:
+                    evento = await assinatura.proximo(timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if evento["id"] > enviados:
+                    yield formatar(evento)
+        finally:
+            barramento.cancelar(assinatura)
+    
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/admin/consultas-lentas")
+async def get_consultas_lentas(limit: int = Query(50, ge=1, le=200)):
+    """Últimas consultas acima de SLOW_QUERY_MS, com resumo do explain"""
+    recentes = list(consultas_lentas.recentes)[-limit:]
+    return {
+        "limite_ms": consultas_lentas.limite_ms,
+        "arquivo": consultas_lentas.arquivo,
+        "consultas": list(reversed(recentes)),
+        "quantidade": len(recentes)
+    }
+
+@app.get("/api/admin/agendador")
+async def get_agendador():
+    """Estado do agendador deste worker e o lease de atualização atual"""
+    try:
+        lease = await asyncio.to_thread(LeaseMongo(db, LEASE_ATUALIZACAO).estado)
+        return JSONResponse(content=parse_json({**estado_agendador, "lease": lease}))
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar agendador: {str(e)}")
+
+@app.get("/api/admin/indices")
+async def get_relatorio_indices():
+    """Índices faltando, sem uso e redundantes em relação à especificação (indices.py)"""
+    try:
+        return JSONResponse(content=parse_json(await asyncio.to_thread(relatorio_indices, db)))
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar relatório de índices: {str(e)}")
+
+@app.get("/api/admin/memoria")
+async def get_perfil_memoria(
+    limit: int = Query(20, ge=1, le=100),
+    top: int = Query(10, ge=1, le=50),
+    tipo: Optional[str] = Query(None, regex="^(requisicao|etapa)$")
+):
+    """Picos de memória por requisição/etapa de ingestão e maiores alocações vivas (tracemalloc)"""
+    try:
+        relatorio = perfil_memoria.relatorio(limite=limit, tipo=tipo)
+        relatorio["alocacoes_atuais"] = await asyncio.to_thread(perfil_memoria.alocacoes_atuais, top)
+        return relatorio
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar perfil de memória: {str(e)}")
+
+@app.post("/api/admin/memoria")
+async def configurar_perfil_memoria(
+    ativo: bool = Query(...),
+    frames: int = Query(MEMORY_PROFILING_FRAMES, ge=1, le=100),
+    limpar: bool = Query(False)
+):
+    """Liga/desliga o perfil de memória neste worker (tracemalloc deixa o processo mais lento)"""
+    if limpar:
+        perfil_memoria.limpar()
+    if ativo:
+        perfil_memoria.iniciar(frames)
+    else:
+        perfil_memoria.parar()
+    return {"ativo": perfil_memoria.ativo, "frames": perfil_memoria.frames, "pid": os.getpid()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas do processo no formato texto do Prometheus"""
+    return PlainTextResponse(registro.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Iniciando servidor FastAPI - Ambiente Local")
@@ -609,5 +1914,8 @@ if __name__ == "__main__":
     print(f"👤 Usuário MongoDB: {MONGODB_USER}")
     print(f"🔐 Autenticação: HABILITADA")
     print(f"🔧 CORS configurado para: {len(allowed_origins)} origens")
+    print(f"⚙️  Workers: {API_WORKERS}")
     print("=" * 50)
-    uvicorn.run(app, host="0.0.0.0", port=API_PORT, log_level="info")
\ No newline at end of file
+    # Com mais de um worker o uvicorn importa o app em cada processo ("main:app"),
+    # e cada worker abre o próprio cliente MongoDB no lifespan
+    uvicorn.run("main:app", host=API_HOST, port=API_PORT, workers=API_WORKERS, log_level="info")
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Perfil de memória opcional com tracemalloc
+
+Desligado por padrão (custo zero). Ligado (MEMORY_PROFILING=1, POST
+/api/admin/memoria ou --perfil-memoria no loader), cada etapa de ingestão e cada
+requisição registra a memória antes/depois, o pico durante a etapa e os pontos do
+código do backend que mais alocaram (diferença entre snapshots de início e fim).
+
+O tracemalloc mede o processo inteiro: com requisições concorrentes o pico de uma
+inclui o que as outras alocaram no mesmo intervalo. Para atribuir um pico a um
+endpoint, reproduza a requisição isolada.
+"""
+import functools
+import linecache
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+MB = 1024 * 1024
+
+# Alocações atribuídas à linha mais recente do código deste diretório na pilha
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Alocações do próprio tracemalloc, do linecache e do import de módulos não interessam
+FILTROS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def quadro_do_projeto(traceback):
+    """Quadro mais recente da pilha que pertence ao backend (ou o mais recente de todos)"""
+    for quadro in reversed(traceback):
+        if quadro.filename.startswith(DIRETORIO) and quadro.filename != __file__:
+            return quadro
+    return traceback[-1]
+
+
+def nome_local(quadro):
+    if quadro.filename.startswith(DIRETORIO):
+        return f"{os.path.relpath(quadro.filename, DIRETORIO)}:{quadro.lineno}"
+    # Bibliotecas: só pacote/arquivo
+    return f"{'/'.join(quadro.filename.split(os.sep)[-2:])}:{quadro.lineno}"
+
+
+def principais_alocacoes(estatisticas, limite):
+    """
+    Agrupa estatísticas por traceback (Statistic ou StatisticDiff) na linha do
+    backend que originou a alocação, ordenadas pelo tamanho
+    """
+    por_local = {}
+    for estatistica in estatisticas:
+        quadro = quadro_do_projeto(estatistica.traceback)
+        chave = (quadro.filename, quadro.lineno)
+        total = por_local.setdefault(chave, {"quadro": quadro, "bytes": 0, "blocos": 0})
+        total["bytes"] += getattr(estatistica, "size_diff", estatistica.size)
+        total["blocos"] += getattr(estatistica, "count_diff", estatistica.count)
+
+    resultado = []
+    for total in sorted(por_local.values(), key=lambda total: -abs(total["bytes"]))[:limite]:
+        quadro = total["quadro"]
+        resultado.append({
+            "local": nome_local(quadro),
+            "codigo": linecache.getline(quadro.filename, quadro.lineno).strip(),
+            "kb": round(total["bytes"] / 1024, 1),
+            "blocos": total["blocos"]
+        })
+    return resultado
+
+
+class _Etapa:
+    def __init__(self, nome, tipo, detalhe):
+        self.nome = nome
+        self.tipo = tipo
+        self.detalhe = detalhe
+        self.inicio = time.perf_counter()
+        self.memoria_antes = tracemalloc.get_traced_memory()[0]
+        self.pico = self.memoria_antes
+        self.snapshot = None
+
+
+class PerfilMemoria:
+    """Registra memória e pico por etapa/requisição enquanto o tracemalloc está ativo"""
+
+    def __init__(self, historico=100, top=10, frames=10):
+        self.top = top
+        self.frames = frames
+        self.registros = deque(maxlen=historico)
+        self.por_nome = {}
+        self._abertas = []
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return tracemalloc.is_tracing()
+
+    def iniciar(self, frames=None):
+        if not self.ativo:
+            self.frames = frames or self.frames
+            tracemalloc.start(self.frames)
+            print(f"🧠 Perfil de memória ativo (tracemalloc, {self.frames} frames)")
+
+    def parar(self):
+        if self.ativo:
+            tracemalloc.stop()
+            print("🧠 Perfil de memória desativado")
+        with self._lock:
+            self._abertas.clear()
+
+    def limpar(self):
+        with self._lock:
+            self.registros.clear()
+            self.por_nome.clear()
+
+    def _acumular_pico(self):
+        # reset_peak é global: antes de zerar, guarda o pico em todas as etapas abertas
+        _, pico = tracemalloc.get_traced_memory()
+        for etapa in self._abertas:
+            etapa.pico = max(etapa.pico, pico)
+        tracemalloc.reset_peak()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(FILTROS)
+
+    @contextmanager
+    def etapa(self, nome, tipo="etapa", detalhe=None):
+        """Mede um bloco de código; sem tracemalloc ativo não faz nada"""
+        if not self.ativo:
+            yield
+            return
+        etapa = _Etapa(nome, tipo, detalhe)
+        etapa.snapshot = self._snapshot()
+        with self._lock:
+            self._acumular_pico()
+            self._abertas.append(etapa)
+        try:
+            yield
+        finally:
+            if self.ativo:
+                self._finalizar(etapa)
+
+    def _finalizar(self, etapa):
+        with self._lock:
+            self._acumular_pico()
+            if etapa in self._abertas:
+                self._abertas.remove(etapa)
+        memoria_depois = tracemalloc.get_traced_memory()[0]
+        diferenca = self._snapshot().compare_to(etapa.snapshot, "traceback")
+        registro = {
+            "nome": etapa.nome,
+            "tipo": etapa.tipo,
+            "detalhe": etapa.detalhe,
+            "quando": datetime.now().isoformat(),
+            "duracao_ms": round((time.perf_counter() - etapa.inicio) * 1000, 1),
+            "antes_mb": round(etapa.memoria_antes / MB, 2),
+            "depois_mb": round(memoria_depois / MB, 2),
+            "pico_mb": round((etapa.pico - etapa.memoria_antes) / MB, 2),
+            "top": principais_alocacoes(diferenca, self.top)
+        }
+        with self._lock:
+            self.registros.append(registro)
+            resumo = self.por_nome.setdefault(etapa.nome, {"execucoes": 0, "pico_max_mb": 0.0, "pico_total_mb": 0.0})
+            resumo["execucoes"] += 1
+            resumo["pico_max_mb"] = max(resumo["pico_max_mb"], registro["pico_mb"])
+            resumo["pico_total_mb"] += registro["pico_mb"]
+
+    def medir(self, nome):
+        """Decorator: mede cada chamada da função como uma etapa (argumentos no detalhe)"""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def envoltorio(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                # Ignora self; argumentos grandes (listas de registros) viram só o tamanho
+                argumentos = [
+                    f"<{len(arg)} itens>" if isinstance(arg, (list, tuple, dict)) else repr(arg)
+                    for arg in args[1:] if not hasattr(arg, "__dict__")
+                ]
+                with self.etapa(nome, detalhe=", ".join(argumentos) or None):
+                    return funcao(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    def alocacoes_atuais(self, limite=None):
+        """Pontos do código com mais memória viva agora"""
+        if not self.ativo:
+            return []
+        estatisticas = self._snapshot().statistics("traceback")
+        return principais_alocacoes(estatisticas, limite or self.top)
+
+    def resumo_por_nome(self):
+        with self._lock:
+            return {
+                nome: {
+                    "execucoes": resumo["execucoes"],
+                    "pico_max_mb": resumo["pico_max_mb"],
+                    "pico_medio_mb": round(resumo["pico_total_mb"] / resumo["execucoes"], 2)
+                }
+                for nome, resumo in sorted(self.por_nome.items(), key=lambda item: -item[1]["pico_max_mb"])
+            }
+
+    def relatorio(self, limite=20, tipo=None):
+        atual = tracemalloc.get_traced_memory()[0] if self.ativo else 0
+        with self._lock:
+            registros = [registro for registro in self.registros if tipo is None or registro["tipo"] == tipo]
+        return {
+            "ativo": self.ativo,
+            "frames": self.frames,
+            "memoria_rastreada_mb": round(atual / MB, 2),
+            "por_nome": self.resumo_por_nome(),
+            "maiores_picos": sorted(registros, key=lambda registro: -registro["pico_mb"])[:limite],
+            "recentes": registros[-limite:][::-1]
+        }
+
+    def imprimir_relatorio(self, limite=10):
+        """Resumo no terminal (loader CLI)"""
+        print(f"\n{'='*50}")
+        print("🧠 PERFIL DE MEMÓRIA (tracemalloc)")
+        print(f"{'='*50}")
+        for nome, resumo in self.resumo_por_nome().items():
+            print(f"   {nome}: pico máx {resumo['pico_max_mb']:.1f} MB, médio {resumo['pico_medio_mb']:.1f} MB "
+                  f"({resumo['execucoes']}x)")
+        with self._lock:
+            maiores = sorted(self.registros, key=lambda registro: -registro["pico_mb"])[:3]
+        for registro in maiores:
+            print(f"\n📍 {registro['nome']}({registro['detalhe'] or ''}): pico {registro['pico_mb']:.1f} MB, "
+                  f"{registro['antes_mb']:.1f} → {registro['depois_mb']:.1f} MB")
+            for alocacao in registro["top"][:limite]:
+                print(f"   {alocacao['kb']:>+10,.1f} KB  {alocacao['local']}  {alocacao['codigo']}")
+
+
+perfil_memoria = PerfilMemoria()
@@ -0,0 +1,234 @@
+import threading
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Endpoint da requisição em andamento (propagado para threads via asyncio.to_thread)
+endpoint_atual = ContextVar("endpoint_atual", default="fora_de_requisicao")
+
+# Tempos por etapa (db, serialize) da requisição em andamento, para o Server-Timing
+tempos_requisicao = ContextVar("tempos_requisicao", default=None)
+
+
+def somar_tempo(etapa, segundos):
+    """Soma segundos na etapa da requisição corrente (ignorado fora de requisição)"""
+    tempos = tempos_requisicao.get()
+    if tempos is not None:
+        tempos[etapa] = tempos.get(etapa, 0.0) + segundos
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_labels(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+def _formatar_valor(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor))
+
+
+class Contador:
+    """Contador monotônico com labels"""
+
+    tipo = "counter"
+
+    def __init__(self, nome, descricao, labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **labels):
+        chave = tuple(labels.get(nome, "") for nome in self.labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def render(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [
+            f"{self.nome}{_formatar_labels(self.labels, chave)} {_formatar_valor(valor)}"
+            for chave, valor in itens
+        ]
+
+
+class Medidor:
+    """Valor instantâneo com labels"""
+
+    tipo = "gauge"
+
+    def __init__(self, nome, descricao, labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def set(self, valor, **labels):
+        chave = tuple(labels.get(nome, "") for nome in self.labels)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def render(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [
+            f"{self.nome}{_formatar_labels(self.labels, chave)} {_formatar_valor(valor)}"
+            for chave, valor in itens
+        ]
+
+
+class MetricaCalculada:
+    """Métrica lida de uma função no momento da coleta (ex.: estatísticas do cache)"""
+
+    def __init__(self, nome, descricao, funcao, tipo="gauge", labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.funcao = funcao
+        self.tipo = tipo
+        self.labels = tuple(labels)
+
+    def render(self):
+        linhas = []
+        for valores_labels, valor in self.funcao():
+            if valor is None:
+                continue
+            chave = tuple(valores_labels.get(nome, "") for nome in self.labels)
+            linhas.append(f"{self.nome}{_formatar_labels(self.labels, chave)} {_formatar_valor(valor)}")
+        return linhas
+
+
+class Histograma:
+    """Histograma cumulativo no formato Prometheus"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, labels=(), buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valor, **labels):
+        chave = tuple(labels.get(nome, "") for nome in self.labels)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = {"contagens": [0] * len(self.buckets), "soma": 0.0, "total": 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["contagens"][i] += 1
+                    break
+            serie["soma"] += valor
+            serie["total"] += 1
+
+    def render(self):
+        with self._lock:
+            itens = [(chave, dict(serie, contagens=list(serie["contagens"]))) for chave, serie in self._series.items()]
+        linhas = []
+        for chave, serie in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie["contagens"]):
+                acumulado += contagem
+                labels = _formatar_labels(self.labels, chave, ("le", _formatar_valor(limite)))
+                linhas.append(f"{self.nome}_bucket{labels} {acumulado}")
+            labels = _formatar_labels(self.labels, chave)
+            linhas.append(f"{self.nome}_sum{labels} {_formatar_valor(serie['soma'])}")
+            linhas.append(f"{self.nome}_count{labels} {serie['total']}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas do processo, exportado em texto Prometheus"""
+
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, descricao, labels=()):
+        return self.registrar(Contador(nome, descricao, labels))
+
+    def medidor(self, nome, descricao, labels=()):
+        return self.registrar(Medidor(nome, descricao, labels))
+
+    def calculada(self, nome, descricao, funcao, tipo="gauge", labels=()):
+        return self.registrar(MetricaCalculada(nome, descricao, funcao, tipo, labels))
+
+    def histograma(self, nome, descricao, labels=(), buckets=BUCKETS_LATENCIA):
+        return self.registrar(Histograma(nome, descricao, labels, buckets))
+
+    def render(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.render())
+        return "\n".join(linhas) + "\n"
+
+
+registro = RegistroMetricas()
+
+http_requisicoes = registro.histograma(
+    "ccee_http_request_duration_seconds",
+    "Latência das requisições HTTP por rota e status",
+    labels=("method", "route", "status")
+)
+mongo_comandos = registro.histograma(
+    "ccee_mongo_command_duration_seconds",
+    "Duração dos comandos MongoDB por endpoint",
+    labels=("endpoint", "command")
+)
+mongo_falhas = registro.contador(
+    "ccee_mongo_command_failures_total",
+    "Comandos MongoDB com falha por endpoint",
+    labels=("endpoint", "command")
+)
+ccee_paginas = registro.histograma(
+    "ccee_api_page_duration_seconds",
+    "Latência das páginas baixadas da API CCEE (datastore_search)",
+    labels=("status",)
+)
+ccee_retentativas = registro.contador(
+    "ccee_api_retries_total",
+    "Retentativas de requisições à API CCEE"
+)
+ingestao_registros = registro.contador(
+    "ccee_ingest_records_total",
+    "Registros inseridos pela ingestão"
+)
+ingestao_vazao = registro.medidor(
+    "ccee_ingest_records_per_second",
+    "Vazão (registros/s) da última ingestão de mês"
+)
+
+
+class MonitorComandosMongo(monitoring.CommandListener):
+    """Mede a duração de cada comando MongoDB e atribui ao endpoint corrente"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        segundos = event.duration_micros / 1_000_000
+        mongo_comandos.observe(segundos, endpoint=endpoint_atual.get(), command=event.command_name)
+        somar_tempo("db", segundos)
+
+    def failed(self, event):
+        mongo_falhas.inc(endpoint=endpoint_atual.get(), command=event.command_name)
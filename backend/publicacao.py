@@ -0,0 +1,218 @@
+"""
+Publicação atômica de meses da CCEE
+
+Os registros baixados vão primeiro para energy_contracts_staging, marcados com um
+LOTE_CARGA, e só são publicados depois de validados. A publicação é por mês e o
+custo é o do mês, não o da coleção:
+
+1. o lote é marcado como pendente em versoes_mes e copiado do staging para a
+   coleção principal ($merge no servidor); leitores não o veem enquanto pendente;
+2. a troca é uma única escrita no documento do mês em versoes_mes: o lote vira o
+   publicado e os registros anteriores do mês passam a ficar ocultos;
+3. o rollup do mês é recalculado a partir do lote novo, os registros anteriores
+   são apagados e o dashboard é rematerializado.
+
+Os leitores aplicam versoes.filtro_visivel() (vazio quando não há publicação em
+andamento), então veem o mês antigo ou o novo, nunca pela metade ou em dobro. Vale
+igual em standalone (deploy do docker-compose) e em replica set, sem transação. O
+rollup e o dashboard são derivados e acompanham a troca logo em seguida (o rollup
+é substituído no lugar, sem janela com o mês vazio).
+
+Uma carga que morre no meio deixa o lote pendente oculto; a próxima publicação
+limpa essas sobras (limpar_pendencias).
+
+Quem publica segura o lease LEASE_ATUALIZACAO (API/agendador, data_updater,
+data_loader, importação e gerador_dados): um único escritor por vez.
+"""
+import time
+import uuid
+from datetime import datetime
+
+from dashboard import materializar_dashboard
+from eventos import barramento
+from memoria import perfil_memoria
+from rollup import MonthlyRollup
+from versoes import VERSOES_COLLECTION, filtro_visivel
+
+STAGING_COLLECTION = "energy_contracts_staging"
+
+
+class PublicacaoInvalida(Exception):
+    """Lote recusado na validação: o mês publicado continua o anterior"""
+
+
+class PublicadorMes:
+    """Carrega um mês em staging, valida e troca atomicamente na coleção principal"""
+
+    def __init__(self, db, source_name="energy_contracts", proporcao_minima=0.5, tamanho_lote=10000):
+        self.db = db
+        self.collection = db[source_name]
+        self.staging = db[STAGING_COLLECTION]
+        self.versoes = db[VERSOES_COLLECTION]
+        self.rollup = MonthlyRollup(db, source_name)
+        self.proporcao_minima = proporcao_minima
+        self.tamanho_lote = tamanho_lote
+
+    def lote_publicado(self, mes_referencia):
+        versao = self.versoes.find_one({"_id": mes_referencia})
+        return versao.get("lote") if versao else None
+
+    def preparar(self, mes_referencia, registros, lote):
+        """Grava o lote no staging (descarta restos de cargas anteriores do mesmo mês)"""
+        self.staging.delete_many({"MES_REFERENCIA": mes_referencia})
+        agora = datetime.now()
+        total = 0
+        for inicio in range(0, len(registros), self.tamanho_lote):
+            documentos = []
+            for registro in registros[inicio:inicio + self.tamanho_lote]:
+                documento = {chave: valor for chave, valor in registro.items() if chave != "_id"}
+                documento["LOTE_CARGA"] = lote
+                documento["DATA_CARREGAMENTO"] = agora
+                documentos.append(documento)
+            total += len(self.staging.insert_many(documentos, ordered=False).inserted_ids)
+        return total
+
+    def validar(self, mes_referencia, lote, esperado, forcar=False):
+        """Confere o lote antes de publicar; levanta PublicacaoInvalida se algo não bate"""
+        no_staging = self.staging.count_documents({"LOTE_CARGA": lote})
+        if no_staging == 0:
+            raise PublicacaoInvalida(f"{mes_referencia}: lote vazio")
+        if no_staging != esperado:
+            raise PublicacaoInvalida(f"{mes_referencia}: {no_staging:,} registros no staging, esperados {esperado:,}")
+
+        outros_meses = self.staging.count_documents({"LOTE_CARGA": lote, "MES_REFERENCIA": {"$ne": mes_referencia}})
+        if outros_meses:
+            raise PublicacaoInvalida(f"{mes_referencia}: {outros_meses:,} registros de outro MES_REFERENCIA no lote")
+
+        atual = self.collection.count_documents({"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.db)})
+        if not forcar and atual and no_staging < atual * self.proporcao_minima:
+            raise PublicacaoInvalida(
+                f"{mes_referencia}: novo lote tem {no_staging:,} registros contra {atual:,} publicados "
+                f"(mínimo {self.proporcao_minima:.0%}); use forcar=True para publicar mesmo assim"
+            )
+        return no_staging
+
+    def encenar(self, mes_referencia, registros, forcar=False):
+        """
+        Grava e valida o lote de um mês no staging, sem tocar na coleção principal
+
+        Returns:
+            dict: mês, lote e registros (entrada de trocar)
+        """
+        mes_referencia = str(mes_referencia)
+        lote = uuid.uuid4().hex
+        print(f"📦 {mes_referencia}: preparando lote {lote[:8]} no staging...")
+        try:
+            self.preparar(mes_referencia, registros, lote)
+            total = self.validar(mes_referencia, lote, len(registros), forcar)
+        except Exception:
+            self.staging.delete_many({"LOTE_CARGA": lote})
+            raise
+        return {"mes": mes_referencia, "lote": lote, "registros": total}
+
+    def limpar_pendencias(self):
+        """Remove sobras de publicações interrompidas (lotes pendentes e registros retirados)"""
+        for versao in self.versoes.find({"$or": [{"pendente": {"$exists": True}}, {"retirando": True}]}):
+            mes = versao["_id"]
+            if versao.get("pendente"):
+                removidos = self.collection.delete_many({"MES_REFERENCIA": mes, "LOTE_CARGA": versao["pendente"]})
+                self.versoes.update_one({"_id": mes, "pendente": versao["pendente"]}, {"$unset": {"pendente": ""}})
+                print(f"🧹 {mes}: lote pendente {versao['pendente'][:8]} descartado ({removidos.deleted_count:,} registros)")
+            if versao.get("retirando"):
+                self._retirar_anteriores(mes, versao["lote"])
+
+    def _retirar_anteriores(self, mes_referencia, lote):
+        """Apaga os registros do mês que não são do lote publicado e encerra a troca"""
+        removidos = self.collection.delete_many({"MES_REFERENCIA": mes_referencia, "LOTE_CARGA": {"$ne": lote}})
+        self.versoes.update_one({"_id": mes_referencia, "lote": lote}, {"$unset": {"retirando": ""}})
+        return removidos.deleted_count
+
+    def pipeline_copia(self, lote):
+        """Copia um lote do staging para a coleção principal, no servidor"""
+        return [
+            {"$match": {"LOTE_CARGA": lote}},
+            {"$project": {"_id": 0}},
+            {"$merge": {"into": self.collection.name, "whenMatched": "fail", "whenNotMatched": "insert"}}
+        ]
+
+    def trocar_mes(self, encenado):
+        """
+        Publica um mês encenado: cópia oculta, troca do ponteiro em versoes_mes,
+        rollup do lote novo e remoção dos registros anteriores (custo do mês)
+
+        Returns:
+            dict: mes, lote, registros e modo ("ponteiro")
+        """
+        mes, lote = encenado["mes"], encenado["lote"]
+        inicio = time.perf_counter()
+        anterior = self.lote_publicado(mes)
+
+        self.versoes.update_one({"_id": mes}, {"$set": {"pendente": lote}}, upsert=True)
+        try:
+            list(self.staging.aggregate(self.pipeline_copia(lote), allowDiskUse=True))
+        except Exception:
+            self.collection.delete_many({"MES_REFERENCIA": mes, "LOTE_CARGA": lote})
+            self.versoes.update_one({"_id": mes, "pendente": lote}, {"$unset": {"pendente": ""}})
+            raise
+        finally:
+            self.staging.delete_many({"LOTE_CARGA": lote})
+
+        # A troca: uma escrita num único documento, atômica para os leitores
+        self.versoes.update_one(
+            {"_id": mes},
+            {
+                "$set": {
+                    "lote": lote,
+                    "lote_anterior": anterior,
+                    "registros": encenado["registros"],
+                    "publicado_em": datetime.now(),
+                    "retirando": True
+                },
+                "$unset": {"pendente": ""}
+            }
+        )
+        self.rollup.refresh_month(mes, lote)
+        removidos = self._retirar_anteriores(mes, lote)
+        print(f"🔁 {mes}: lote {lote[:8]} publicado ({removidos:,} registros anteriores removidos) "
+              f"em {time.perf_counter() - inicio:.1f}s")
+        return {**encenado, "modo": "ponteiro"}
+
+    @perfil_memoria.medir("publicacao.trocar")
+    def trocar(self, encenados):
+        """
+        Publica os meses encenados, um de cada vez, e rematerializa o dashboard
+
+        Returns:
+            list: um dict por mês (mes, lote, registros, modo)
+        """
+        if not encenados:
+            return []
+        self.limpar_pendencias()
+        publicados = []
+        try:
+            for encenado in encenados:
+                publicados.append(self.trocar_mes(encenado))
+        finally:
+            # Encenados que não chegaram a ser trocados não ficam no staging
+            restantes = [encenado["lote"] for encenado in encenados[len(publicados):]]
+            if restantes:
+                self.staging.delete_many({"LOTE_CARGA": {"$in": restantes}})
+            if publicados:
+                materializar_dashboard(self.db)
+
+        for publicado in publicados:
+            barramento.publicar("registros_inseridos", mes=publicado["mes"], registros=publicado["registros"],
+                                modo=publicado["modo"], lote=publicado["lote"])
+            print(f"✅ {publicado['mes']}: {publicado['registros']:,} registros publicados (lote {publicado['lote'][:8]})")
+        return publicados
+
+    @perfil_memoria.medir("publicacao.publicar")
+    def publicar(self, mes_referencia, registros, forcar=False):
+        """
+        Substitui o mês inteiro pelos registros informados, sem janela com o mês
+        vazio, pela metade ou em dobro
+
+        Returns:
+            dict: mes, lote, registros publicados e modo ("ponteiro")
+        """
+        return self.trocar([self.encenar(mes_referencia, registros, forcar)])[0]
@@ -0,0 +1,231 @@
+import uuid
+
+from versoes import filtro_visivel
+
+ROLLUP_COLLECTION = "energy_contracts_mensal"
+
+
+class MonthlyRollup:
+    """Agregado mensal por empresa (uma linha por MES_REFERENCIA x NOME_EMPRESARIAL)"""
+
+    def __init__(self, db, source_name="energy_contracts"):
+        self.source = db[source_name]
+        self.collection = db[ROLLUP_COLLECTION]
+
+    def filtro_mes(self, mes_referencia, lote=None):
+        """Registros do mês que entram no rollup: os do lote informado ou os visíveis"""
+        if lote:
+            return {"MES_REFERENCIA": mes_referencia, "LOTE_CARGA": lote}
+        return {"MES_REFERENCIA": mes_referencia, **filtro_visivel(self.source.database)}
+
+    def pipeline_mes(self, mes_referencia, versao=None, lote=None):
+        """Pipeline que recalcula o rollup de um mês a partir da coleção bruta"""
+        return [
+            {"$match": self.filtro_mes(mes_referencia, lote)},
+            {
+                "$group": {
+                    "_id": "$NOME_EMPRESARIAL",
+                    "total_venda": {"$sum": {"$toDouble": "$CONTRATACAO_VENDA"}},
+                    "total_compra": {"$sum": {"$toDouble": "$CONTRATACAO_COMPRA"}},
+                    "registros": {"$sum": 1},
+                    "perfis": {"$addToSet": "$CODIGO_PERFIL_AGENTE"}
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "MES_REFERENCIA": {"$literal": mes_referencia},
+                    "NOME_EMPRESARIAL": "$_id",
+                    "ANO": {"$literal": mes_referencia[:4]},
+                    "MES_INDICE": {"$literal": indice_mes(mes_referencia)},
+                    "total_venda": 1,
+                    "total_compra": 1,
+                    "saldo_liquido": {"$subtract": ["$total_venda", "$total_compra"]},
+                    "registros": 1,
+                    "quantidade_perfis": {"$size": "$perfis"},
+                    "VERSAO": {"$literal": versao}
+                }
+            },
+            {
+                "$merge": {
+                    "into": ROLLUP_COLLECTION,
+                    "on": ["MES_REFERENCIA", "NOME_EMPRESARIAL"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert"
+                }
+            }
+        ]
+
+    def refresh_month(self, mes_referencia, lote=None):
+        """
+        Recalcula o rollup de um mês (apaga empresas que sumiram do mês)
+
+        O índice único exigido pelo $merge é criado uma vez por quem abre o banco
+        (lifespan da API, CCEEDataLoader), não a cada recálculo.
+
+        Args:
+            lote: LOTE_CARGA recém-publicado (publicacao.py); sem ele, os registros visíveis
+        """
+        mes_referencia = str(mes_referencia)
+        # Substitui as linhas no lugar e só depois remove as da versão anterior:
+        # o mês nunca fica vazio para quem está lendo
+        versao = uuid.uuid4().hex
+        list(self.source.aggregate(self.pipeline_mes(mes_referencia, versao, lote), allowDiskUse=True))
+        self.collection.delete_many({"MES_REFERENCIA": mes_referencia, "VERSAO": {"$ne": versao}})
+        count = self.collection.count_documents({"MES_REFERENCIA": mes_referencia})
+        print(f"🧮 Rollup {mes_referencia}: {count:,} empresas")
+        return count
+
+    def refresh(self, meses=None):
+        """Recalcula o rollup dos meses informados (ou de todos)"""
+        if meses is None:
+            meses = self.source.distinct("MES_REFERENCIA", filtro_visivel(self.source.database))
+        return sum(self.refresh_month(mes) for mes in sorted(meses))
+
+    def sync(self):
+        """Cria o rollup dos meses que existem na coleção bruta mas não no rollup"""
+        meses_fonte = set(self.source.distinct("MES_REFERENCIA", filtro_visivel(self.source.database)))
+        meses_rollup = set(self.collection.distinct("MES_REFERENCIA"))
+
+        faltando = sorted(meses_fonte - meses_rollup)
+        sobrando = sorted(meses_rollup - meses_fonte)
+
+        if sobrando:
+            self.collection.delete_many({"MES_REFERENCIA": {"$in": sobrando}})
+        if faltando:
+            print(f"🧮 Sincronizando rollup: {len(faltando)} meses")
+            self.refresh(faltando)
+        return faltando
+
+    def clear(self):
+        """Remove todo o rollup"""
+        return self.collection.delete_many({}).deleted_count
+
+
+METRICAS_ROLLUP = {
+    "venda": "$total_venda",
+    "compra": "$total_compra",
+    "saldo": "$saldo_liquido"
+}
+
+
+def indice_mes(mes_referencia):
+    """Converte YYYYMM em um inteiro contínuo (ano * 12 + mês - 1)"""
+    return int(mes_referencia[:4]) * 12 + int(mes_referencia[4:6]) - 1
+
+
+def pipeline_janelas(match_stage, metrica, janelas, mes_inicio=None):
+    """Pipeline $setWindowFields com somas móveis e acumulado do ano por empresa"""
+    saidas = {
+        f"soma_{janela}m": {"$sum": "$valor", "window": {"range": [-(janela - 1), 0]}}
+        for janela in janelas
+    }
+
+    pipeline = [
+        {"$match": match_stage},
+        {
+            "$project": {
+                "_id": 0,
+                "NOME_EMPRESARIAL": 1,
+                "MES_REFERENCIA": 1,
+                "MES_INDICE": 1,
+                "ANO": 1,
+                "valor": METRICAS_ROLLUP[metrica]
+            }
+        },
+        {
+            "$setWindowFields": {
+                "partitionBy": "$NOME_EMPRESARIAL",
+                "sortBy": {"MES_INDICE": 1},
+                "output": saidas
+            }
+        },
+        {
+            "$setWindowFields": {
+                "partitionBy": {"empresa": "$NOME_EMPRESARIAL", "ano": "$ANO"},
+                "sortBy": {"MES_INDICE": 1},
+                "output": {
+                    "acumulado_ano": {"$sum": "$valor", "window": {"documents": ["unbounded", "current"]}}
+                }
+            }
+        }
+    ]
+
+    # Meses anteriores ao início só entram para alimentar as janelas
+    if mes_inicio:
+        pipeline.append({"$match": {"MES_REFERENCIA": {"$gte": mes_inicio}}})
+
+    pipeline.extend([
+        {"$sort": {"NOME_EMPRESARIAL": 1, "MES_INDICE": 1}},
+        {
+            "$group": {
+                "_id": "$NOME_EMPRESARIAL",
+                "meses": {"$push": "$MES_REFERENCIA"},
+                "valor": {"$push": "$valor"},
+                "acumulado_ano": {"$push": "$acumulado_ano"},
+                **{campo: {"$push": f"${campo}"} for campo in saidas}
+            }
+        },
+        {"$sort": {"_id": 1}}
+    ])
+    return pipeline
+
+
+def calcular_janelas(linhas, janelas, mes_inicio=None):
+    """
+    Fallback em memória do pipeline_janelas (MongoDB < 5.0, sem $setWindowFields)
+
+    Recebe linhas (NOME_EMPRESARIAL, MES_REFERENCIA, valor) ordenadas por empresa
+    e mês e calcula cada janela com somas de prefixo, em O(n) por empresa.
+    """
+    series = []
+    atual = None
+
+    def fechar(serie):
+        indices = serie.pop("_indices")
+        valores = serie["valor"]
+
+        prefixo = [0.0]
+        for valor in valores:
+            prefixo.append(prefixo[-1] + valor)
+
+        for janela in janelas:
+            somas = []
+            inicio = 0
+            for pos, indice in enumerate(indices):
+                # A janela é por intervalo de meses, então meses sem dados não contam
+                while indices[inicio] <= indice - janela:
+                    inicio += 1
+                somas.append(prefixo[pos + 1] - prefixo[inicio])
+            serie[f"soma_{janela}m"] = somas
+
+        acumulado = []
+        for pos, mes in enumerate(serie["meses"]):
+            if pos == 0 or serie["meses"][pos - 1][:4] != mes[:4]:
+                total_ano = 0.0
+            total_ano += valores[pos]
+            acumulado.append(total_ano)
+        serie["acumulado_ano"] = acumulado
+
+        if mes_inicio:
+            manter = [pos for pos, mes in enumerate(serie["meses"]) if mes >= mes_inicio]
+            for campo, valores_campo in list(serie.items()):
+                if isinstance(valores_campo, list):
+                    serie[campo] = [valores_campo[pos] for pos in manter]
+            if not manter:
+                return
+        series.append(serie)
+
+    for linha in linhas:
+        empresa = linha["NOME_EMPRESARIAL"]
+        if atual is None or atual["_id"] != empresa:
+            if atual is not None:
+                fechar(atual)
+            atual = {"_id": empresa, "meses": [], "valor": [], "_indices": []}
+        atual["meses"].append(linha["MES_REFERENCIA"])
+        atual["valor"].append(linha.get("valor") or 0.0)
+        atual["_indices"].append(indice_mes(linha["MES_REFERENCIA"]))
+
+    if atual is not None:
+        fechar(atual)
+    return series
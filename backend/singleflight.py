@@ -0,0 +1,75 @@
+import asyncio
+
+
+class Sobrecarga(Exception):
+    """Portão de consultas pesadas cheio: o cliente deve tentar de novo depois"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Consultas pesadas no limite, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PortaoConsultas:
+    """Limita quantas consultas pesadas rodam ao mesmo tempo no worker"""
+
+    def __init__(self, limite=4, espera_max=2.0, retry_after=5):
+        self.limite = limite
+        self.espera_max = espera_max
+        self.retry_after = retry_after
+        self.em_execucao = 0
+        self.rejeitadas = 0
+        self._semaforo = asyncio.Semaphore(limite)
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), timeout=self.espera_max)
+        except asyncio.TimeoutError:
+            self.rejeitadas += 1
+            raise Sobrecarga(self.retry_after)
+        self.em_execucao += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.em_execucao -= 1
+        self._semaforo.release()
+        return False
+
+
+class SingleFlight:
+    """
+    Coalesce chamadas idênticas concorrentes: a primeira executa (em thread) e as
+    demais aguardam o mesmo resultado, inclusive erros
+    """
+
+    def __init__(self):
+        self._em_voo = {}
+        self.executadas = 0
+        self.compartilhadas = 0
+
+    async def executar(self, chave, funcao, portao=None, **params):
+        futuro = self._em_voo.get(chave)
+        if futuro is not None:
+            self.compartilhadas += 1
+        else:
+            self.executadas += 1
+            futuro = asyncio.ensure_future(self._rodar(funcao, portao, params))
+            self._em_voo[chave] = futuro
+            futuro.add_done_callback(lambda f: self._finalizar(chave, f))
+        # shield: um cliente que desconecta não cancela o cálculo dos outros
+        return await asyncio.shield(futuro)
+
+    async def _rodar(self, funcao, portao, params):
+        if portao is None:
+            return await asyncio.to_thread(funcao, **params)
+        async with portao:
+            return await asyncio.to_thread(funcao, **params)
+
+    def _finalizar(self, chave, futuro):
+        if self._em_voo.get(chave) is futuro:
+            del self._em_voo[chave]
+        # Marca a exceção como lida mesmo se todos os clientes já desistiram
+        if not futuro.cancelled():
+            futuro.exception()
+
+    def em_voo(self):
+        return len(self._em_voo)
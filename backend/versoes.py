@@ -0,0 +1,31 @@
+"""
+Ponteiro de versão por mês (versoes_mes) e o filtro de visibilidade dos leitores
+
+Cada documento {_id: MES_REFERENCIA, lote, ...} diz qual LOTE_CARGA está publicado.
+Durante uma publicação (publicacao.py) o documento também marca o lote que está
+sendo copiado (pendente) ou que os registros anteriores ainda não foram apagados
+(retirando); filtro_visivel esconde os dois dos leitores.
+"""
+
+VERSOES_COLLECTION = "versoes_mes"
+
+
+def filtro_visivel(db):
+    """
+    Filtro que esconde dos leitores os lotes ainda em cópia e, nos meses já
+    trocados e ainda não limpos, os registros anteriores ao lote publicado
+
+    Returns:
+        dict: {} sem publicação em andamento, ou {"$nor": [...]}
+    """
+    ocultos = []
+    em_andamento = db[VERSOES_COLLECTION].find(
+        {"$or": [{"pendente": {"$exists": True}}, {"retirando": True}]},
+        {"lote": 1, "pendente": 1, "retirando": 1}
+    )
+    for versao in em_andamento:
+        if versao.get("pendente"):
+            ocultos.append({"MES_REFERENCIA": versao["_id"], "LOTE_CARGA": versao["pendente"]})
+        if versao.get("retirando"):
+            ocultos.append({"MES_REFERENCIA": versao["_id"], "LOTE_CARGA": {"$ne": versao["lote"]}})
+    return {"$nor": ocultos} if ocultos else {}
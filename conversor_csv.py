@@ -1,8 +1,19 @@
 import json
 import csv
+import io
 import os
+import argparse
 from datetime import datetime
-from collections import Counter
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# Campo de origem de cada métrica da tabela dinâmica (None = contagem de registros)
+METRICAS_PIVOT = {
+    "registros": None,
+    "venda": "CONTRATACAO_VENDA",
+    "compra": "CONTRATACAO_COMPRA",
+    "saldo": None
+}
 
 def carregar_json(nome_arquivo):
     """
@@ -34,6 +45,263 @@ def carregar_json(nome_arquivo):
         print(f"❌ Erro ao ler arquivo: {e}")
         return None
 
+def iterar_json_arquivo(file, tamanho_bloco=1024 * 1024, progresso=None):
+    """
+    Lê um arquivo texto aberto (array JSON ou um JSON por linha) elemento a elemento
+    
+    Args:
+        file: Arquivo texto aberto (ou um trecho, ver TrechoArquivo)
+        tamanho_bloco: Caracteres lidos por vez
+        progresso: Dict opcional atualizado com 'bytes' e 'registros' lidos
+    
+    Yields:
+        dict: Um registro por vez
+    """
+    decoder = json.JSONDecoder()
+    if progresso is None:
+        progresso = {}
+    progresso.setdefault("bytes", 0)
+    progresso.setdefault("registros", 0)
+    
+    buffer = ""
+    pos = 0
+    fim_arquivo = False
+    
+    while True:
+        # Pula espaços, '[' inicial, ',' entre elementos e ']' final
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,[]":
+            pos += 1
+        
+        if pos >= len(buffer):
+            if fim_arquivo:
+                return
+            bloco = file.read(tamanho_bloco)
+            progresso["bytes"] += len(bloco.encode('utf-8'))
+            buffer = buffer[pos:] + bloco
+            pos = 0
+            fim_arquivo = not bloco
+            continue
+        
+        try:
+            item, fim = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if fim_arquivo:
+                raise
+            # Elemento incompleto: lê mais um bloco e tenta de novo
+            bloco = file.read(tamanho_bloco)
+            progresso["bytes"] += len(bloco.encode('utf-8'))
+            buffer = buffer[pos:] + bloco
+            pos = 0
+            fim_arquivo = not bloco
+            continue
+        
+        pos = fim
+        progresso["registros"] += 1
+        yield item
+
+def iterar_json(nome_arquivo, tamanho_bloco=1024 * 1024, progresso=None):
+    """
+    Lê um array JSON (ou um JSON por linha) elemento a elemento, sem carregar o arquivo inteiro
+    
+    Args:
+        nome_arquivo: Nome do arquivo JSON
+        tamanho_bloco: Bytes lidos por vez
+        progresso: Dict opcional atualizado com 'bytes' e 'registros' lidos
+    
+    Yields:
+        dict: Um registro por vez
+    """
+    if progresso is None:
+        progresso = {}
+    with open(nome_arquivo, 'r', encoding='utf-8') as file:
+        yield from iterar_json_arquivo(file, tamanho_bloco, progresso=progresso)
+
+def filtrar_por_ano(registros, ano):
+    """
+    Filtra registros de um ano sob demanda (gerador)
+    """
+    prefixo = str(ano)
+    for item in registros:
+        if 'MES_REFERENCIA' in item and str(item['MES_REFERENCIA']).startswith(prefixo):
+            yield item
+
+def json_para_csv_streaming(registros, nome_arquivo_saida, tamanho_lote=5000, progresso=None):
+    """
+    Converte registros para CSV em lotes, com memória constante
+    
+    Args:
+        registros: Iterável de dicionários (ex.: iterar_json)
+        nome_arquivo_saida: Nome do arquivo de saída
+        tamanho_lote: Registros gravados por chamada de writerows
+        progresso: Dict de iterar_json, usado para reportar MB/s
+    
+    Returns:
+        str: Caminho do arquivo CSV gerado
+    """
+    inicio = datetime.now()
+    total = 0
+    writer = None
+    ignorados = Counter()
+    
+    try:
+        with open(nome_arquivo_saida, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as csvfile:
+            lote = []
+            for item in registros:
+                if writer is None:
+                    # Cabeçalhos do primeiro registro, como no modo tradicional
+                    headers = list(item.keys())
+                    conhecidos = set(headers)
+                    writer = csv.DictWriter(csvfile, fieldnames=headers, extrasaction='ignore')
+                    writer.writeheader()
+                    print(f"\n💾 Gerando arquivo CSV (streaming)...")
+                    print(f"   Arquivo: {nome_arquivo_saida}")
+                    print(f"   Colunas: {len(headers)}")
+                
+                # Campo que não está no cabeçalho não cabe no CSV: conta para avisar no fim
+                ignorados.update(item.keys() - conhecidos)
+                lote.append(item)
+                if len(lote) >= tamanho_lote:
+                    writer.writerows(lote)
+                    total += len(lote)
+                    lote = []
+                    if total % 100000 < tamanho_lote:
+                        print(f"   Processados: {total:,} registros")
+            
+            if lote:
+                writer.writerows(lote)
+                total += len(lote)
+        
+        if writer is None:
+            print("❌ Nenhum dado para converter")
+            os.remove(nome_arquivo_saida)
+            return None
+        
+        segundos = max((datetime.now() - inicio).total_seconds(), 1e-9)
+        print(f"✅ CSV gerado com sucesso: {nome_arquivo_saida}")
+        print(f"   Registros gravados: {total:,}")
+        if ignorados:
+            descricao = ", ".join(f"{campo} ({quantidade:,})" for campo, quantidade in ignorados.most_common())
+            print(f"⚠️  Campos ausentes no primeiro registro não foram gravados: {descricao}")
+        if progresso and progresso.get("bytes"):
+            mb_lidos = progresso["bytes"] / 1024 / 1024
+            print(f"   Lidos: {progresso['registros']:,} registros, {mb_lidos:.2f} MB em {segundos:.2f}s ({mb_lidos / segundos:.2f} MB/s)")
+        
+        tamanho_arquivo = os.path.getsize(nome_arquivo_saida)
+        print(f"📏 Tamanho do arquivo: {tamanho_arquivo:,} bytes ({tamanho_arquivo / 1024 / 1024:.2f} MB)")
+        
+        return nome_arquivo_saida
+        
+    except Exception as e:
+        print(f"❌ Erro ao gerar CSV: {e}")
+        return None
+
+class AcumuladorEstatisticas:
+    """
+    Estatísticas da análise calculadas em uma única passada
+    
+    Funciona com registros em streaming e pode ser mesclado com outro
+    acumulador, para processar partes do dado em processos separados.
+    """
+    
+    def __init__(self):
+        self.total = 0
+        self.campos = None
+        self.meses = set()
+        self.empresas = Counter()
+        self.perfis = set()
+        self.volume_por_mes = defaultdict(lambda: [0.0, 0.0])
+        self.tem_volumes = False
+    
+    def adicionar(self, item):
+        if self.campos is None:
+            self.campos = list(item.keys())
+        self.total += 1
+        
+        mes = item.get('MES_REFERENCIA', 'N/A')
+        self.meses.add(mes)
+        self.empresas[item.get('NOME_EMPRESARIAL', 'N/A')] += 1
+        self.perfis.add(str(item.get('CODIGO_PERFIL_AGENTE', 'N/A')))
+        
+        if 'CONTRATACAO_VENDA' in item or 'CONTRATACAO_COMPRA' in item:
+            self.tem_volumes = True
+            volumes = self.volume_por_mes[mes]
+            volumes[0] += valor_numerico(item.get('CONTRATACAO_VENDA'))
+            volumes[1] += valor_numerico(item.get('CONTRATACAO_COMPRA'))
+    
+    def adicionar_varios(self, registros):
+        for item in registros:
+            self.adicionar(item)
+        return self
+    
+    def observar(self, registros):
+        """
+        Repassa os registros adiante acumulando as estatísticas no caminho (gerador)
+        """
+        for item in registros:
+            self.adicionar(item)
+            yield item
+    
+    def mesclar(self, outro):
+        """
+        Combina as estatísticas de outro acumulador neste
+        """
+        if self.campos is None:
+            self.campos = outro.campos
+        self.total += outro.total
+        self.meses |= outro.meses
+        self.empresas.update(outro.empresas)
+        self.perfis |= outro.perfis
+        self.tem_volumes = self.tem_volumes or outro.tem_volumes
+        for mes, (venda, compra) in outro.volume_por_mes.items():
+            volumes = self.volume_por_mes[mes]
+            volumes[0] += venda
+            volumes[1] += compra
+        return self
+    
+    def __getstate__(self):
+        # defaultdict com lambda não é serializável entre processos
+        estado = self.__dict__.copy()
+        estado['volume_por_mes'] = dict(self.volume_por_mes)
+        return estado
+    
+    def __setstate__(self, estado):
+        volumes = estado.pop('volume_por_mes')
+        self.__dict__.update(estado)
+        self.volume_por_mes = defaultdict(lambda: [0.0, 0.0], volumes)
+    
+    def imprimir_relatorio(self, top_n=5):
+        if not self.total:
+            return
+        
+        print("\n📈 ANÁLISE DOS DADOS:")
+        print("=" * 50)
+        print(f"📊 Total de registros: {self.total:,}")
+        print(f"📋 Campos disponíveis: {', '.join(self.campos)}")
+        
+        # Análise por mês (se existir o campo)
+        if 'MES_REFERENCIA' in self.campos:
+            print(f"📅 Meses encontrados: {len(self.meses)}")
+            print(f"   Período: {min(self.meses)} a {max(self.meses)}")
+        
+        # Análise por empresa (se existir o campo)
+        if 'NOME_EMPRESARIAL' in self.campos:
+            print(f"🏢 Empresas únicas: {len(self.empresas):,}")
+            
+            print(f"\n🏆 Top {top_n} empresas com mais registros:")
+            for empresa, count in self.empresas.most_common(top_n):
+                print(f"   {empresa}: {count:,} registros")
+        
+        # Análise por perfil (se existir o campo)
+        if 'CODIGO_PERFIL_AGENTE' in self.campos:
+            print(f"🔢 Códigos de perfil únicos: {len(self.perfis)}")
+        
+        # Volumes por mês (se existirem os campos)
+        if self.tem_volumes:
+            print("\n⚡ Volumes por mês (venda / compra):")
+            for mes in sorted(self.volume_por_mes):
+                venda, compra = self.volume_por_mes[mes]
+                print(f"   {mes}: {venda:,.2f} / {compra:,.2f}")
+
 def analisar_dados(dados):
     """
     Analisa os dados antes da conversão
@@ -41,36 +309,126 @@ def analisar_dados(dados):
     if not dados:
         return
     
-    print("\n📈 ANÁLISE DOS DADOS:")
-    print("=" * 50)
-    print(f"📊 Total de registros: {len(dados):,}")
+    AcumuladorEstatisticas().adicionar_varios(dados).imprimir_relatorio()
+
+class TrechoArquivo(io.RawIOBase):
+    """Leitura binária limitada a [inicio, fim) de um arquivo"""
     
-    # Verifica a estrutura dos dados
-    if dados:
-        primeiro_registro = dados[0]
-        print(f"📋 Campos disponíveis: {', '.join(primeiro_registro.keys())}")
-    
-    # Análise por mês (se existir o campo)
-    if 'MES_REFERENCIA' in primeiro_registro:
-        meses = set(item.get('MES_REFERENCIA', 'N/A') for item in dados)
-        print(f"📅 Meses encontrados: {len(meses)}")
-        print(f"   Período: {min(meses)} a {max(meses)}")
-    
-    # Análise por empresa (se existir o campo)
-    if 'NOME_EMPRESARIAL' in primeiro_registro:
-        empresas = set(item.get('NOME_EMPRESARIAL', 'N/A') for item in dados)
-        print(f"🏢 Empresas únicas: {len(empresas):,}")
-        
-        # Top 5 empresas com mais registros
-        empresa_counts = Counter(item.get('NOME_EMPRESARIAL', 'N/A') for item in dados)
-        print("\n🏆 Top 5 empresas com mais registros:")
-        for empresa, count in empresa_counts.most_common(5):
-            print(f"   {empresa}: {count:,} registros")
-    
-    # Análise por perfil (se existir o campo)
-    if 'CODIGO_PERFIL_AGENTE' in primeiro_registro:
-        perfis = set(str(item.get('CODIGO_PERFIL_AGENTE', 'N/A')) for item in dados)
-        print(f"🔢 Códigos de perfil únicos: {len(perfis)}")
+    def __init__(self, nome_arquivo, inicio, fim):
+        self.arquivo = open(nome_arquivo, 'rb')
+        self.arquivo.seek(inicio)
+        self.restante = fim - inicio
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if self.restante <= 0:
+            return 0
+        lidos = self.arquivo.readinto(memoryview(buffer)[:self.restante])
+        self.restante -= lidos or 0
+        return lidos
+    
+    def close(self):
+        self.arquivo.close()
+        super().close()
+
+def inicio_de_registro(nome_arquivo, posicao, tamanho_amostra=64 * 1024):
+    """
+    Primeiro byte >= posicao onde começa um elemento do array (ou uma linha JSON)
+    
+    Um '{' só conta se vier depois de '[', ',' ou quebra de linha e decodificar um
+    registro inteiro: um '{' dentro de texto não passa nas duas condições.
+    Retorna o tamanho do arquivo se não houver mais registros.
+    """
+    decoder = json.JSONDecoder()
+    with open(nome_arquivo, 'rb') as arquivo:
+        while True:
+            arquivo.seek(posicao)
+            bloco = arquivo.read(tamanho_amostra)
+            if not bloco:
+                return posicao
+            for indice in range(len(bloco)):
+                if bloco[indice] != ord('{'):
+                    continue
+                anterior = bloco[:indice].rstrip(b" \t\r")
+                if anterior:
+                    separador = anterior[-1:]
+                else:
+                    arquivo.seek(max(posicao - 256, 0))
+                    separador = (arquivo.read(min(posicao, 256)).rstrip(b" \t\r") or b"\n")[-1:]
+                if separador not in (b"[", b",", b"\n"):
+                    continue
+                arquivo.seek(posicao + indice)
+                amostra = arquivo.read(tamanho_amostra).decode('utf-8', errors='ignore')
+                try:
+                    item, _ = decoder.raw_decode(amostra)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(item, dict):
+                    return posicao + indice
+            posicao += len(bloco)
+
+def dividir_arquivo(nome_arquivo, tamanho_trecho):
+    """
+    Divide um arquivo JSON em trechos de ~tamanho_trecho bytes alinhados a registros
+    
+    Returns:
+        list: (arquivo, inicio, fim) de cada trecho
+    """
+    tamanho = os.path.getsize(nome_arquivo)
+    if tamanho_trecho <= 0 or tamanho <= tamanho_trecho:
+        return [(nome_arquivo, 0, tamanho)]
+    
+    limites = [0]
+    for corte in range(tamanho_trecho, tamanho, tamanho_trecho):
+        limite = inicio_de_registro(nome_arquivo, max(corte, limites[-1] + 1))
+        if limite >= tamanho:
+            break
+        limites.append(limite)
+    limites.append(tamanho)
+    return [(nome_arquivo, inicio, fim) for inicio, fim in zip(limites, limites[1:])]
+
+def acumular_trecho(trecho):
+    """
+    Acumula as estatísticas de um trecho de arquivo (executado em processo separado)
+    """
+    nome_arquivo, inicio, fim = trecho
+    texto = io.TextIOWrapper(io.BufferedReader(TrechoArquivo(nome_arquivo, inicio, fim)), encoding='utf-8')
+    with texto:
+        return AcumuladorEstatisticas().adicionar_varios(iterar_json_arquivo(texto))
+
+def analisar_arquivos(arquivos, processos=1, tamanho_trecho=64 * 1024 * 1024):
+    """
+    Analisa um ou mais arquivos JSON em streaming, em paralelo por trecho
+    
+    Arquivos maiores que tamanho_trecho são divididos em trechos alinhados ao início
+    de um registro, então um único arquivo grande também usa todos os processos.
+    
+    Args:
+        arquivos: Lista de arquivos (ex.: shards mensais de uma exportação)
+        processos: Número de processos paralelos
+        tamanho_trecho: Bytes por trecho (0 = um trecho por arquivo)
+    
+    Returns:
+        AcumuladorEstatisticas: Estatísticas combinadas
+    """
+    acumulador = AcumuladorEstatisticas()
+    
+    if processos > 1:
+        trechos = [trecho for arquivo in arquivos for trecho in dividir_arquivo(arquivo, tamanho_trecho)]
+    else:
+        trechos = [(arquivo, 0, os.path.getsize(arquivo)) for arquivo in arquivos]
+    
+    if processos > 1 and len(trechos) > 1:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            for parcial in executor.map(acumular_trecho, trechos):
+                acumulador.mesclar(parcial)
+    else:
+        for trecho in trechos:
+            acumulador.mesclar(acumular_trecho(trecho))
+    
+    return acumulador
 
 def json_para_csv(dados, nome_arquivo_saida=None):
     """
@@ -128,45 +486,178 @@ def json_para_csv(dados, nome_arquivo_saida=None):
         print(f"❌ Erro ao gerar CSV: {e}")
         return None
 
-def filtrar_dados_2025(dados):
+def filtrar_dados(dados, ano):
     """
-    Filtra dados apenas do ano 2025
+    Filtra dados de um ano
     """
     if not dados:
         return []
     
-    dados_2025 = [
+    prefixo = str(ano)
+    dados_ano = [
         item for item in dados 
-        if 'MES_REFERENCIA' in item and str(item['MES_REFERENCIA']).startswith('2025')
+        if 'MES_REFERENCIA' in item and str(item['MES_REFERENCIA']).startswith(prefixo)
     ]
     
-    print(f"\n🎯 Filtro aplicado - Ano 2025:")
+    print(f"\n🎯 Filtro aplicado - Ano {ano}:")
     print(f"   Registros antes do filtro: {len(dados):,}")
-    print(f"   Registros após filtro: {len(dados_2025):,}")
+    print(f"   Registros após filtro: {len(dados_ano):,}")
     
-    return dados_2025
+    return dados_ano
 
-# Execução principal
-if __name__ == "__main__":
-    print("🚀 CONVERSOR CCEE ENERGY CONTRACTS - JSON para CSV")
-    print("=" * 60)
+def filtrar_dados_2025(dados):
+    """
+    Filtra dados apenas do ano 2025
+    """
+    return filtrar_dados(dados, 2025)
+
+def valor_numerico(valor):
+    """
+    Converte um valor da CCEE (número, texto com ponto ou vírgula) para float
+    """
+    if valor is None or valor == "":
+        return 0.0
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).replace(",", "."))
+    except ValueError:
+        return 0.0
+
+def formatar_numero(valor):
+    """
+    Formata número para Excel pt-BR (vírgula decimal, sem separador de milhar)
+    """
+    if isinstance(valor, int):
+        return str(valor)
+    return f"{valor:.6f}".rstrip("0").rstrip(".").replace(".", ",")
+
+def gerar_pivot(dados, metrica="registros", ano=None):
+    """
+    Monta a tabela dinâmica empresa x mês em uma única passada
     
-    # Nome do arquivo JSON
-    arquivo_json = "ccee_data.energy_contracts.json"
+    Args:
+        dados: Iterável de registros
+        metrica: registros, venda, compra ou saldo
+        ano: Filtra apenas um ano (opcional)
+    
+    Returns:
+        tuple: (lista de meses, dict empresa -> dict mês -> valor)
+    """
+    tabela = defaultdict(lambda: defaultdict(int if metrica == "registros" else float))
+    meses = set()
+    
+    for item in dados:
+        mes = str(item.get('MES_REFERENCIA', ''))
+        if not mes or (ano and not mes.startswith(str(ano))):
+            continue
+        
+        if metrica == "registros":
+            valor = 1
+        elif metrica == "saldo":
+            valor = valor_numerico(item.get('CONTRATACAO_VENDA')) - valor_numerico(item.get('CONTRATACAO_COMPRA'))
+        else:
+            valor = valor_numerico(item.get(METRICAS_PIVOT[metrica]))
+        
+        tabela[item.get('NOME_EMPRESARIAL', 'N/A')][mes] += valor
+        meses.add(mes)
+    
+    return sorted(meses), tabela
+
+def salvar_pivot_csv(meses, tabela, nome_arquivo_saida):
+    """
+    Grava a tabela dinâmica no layout da planilha (Rótulos de Linha / Total Geral)
+    
+    Args:
+        meses: Colunas da tabela
+        tabela: Resultado de gerar_pivot
+        nome_arquivo_saida: Caminho do CSV
+    
+    Returns:
+        str: Caminho do arquivo CSV gerado
+    """
+    totais = [0] * len(meses)
+    
+    try:
+        # utf-8-sig + ';' para o Excel abrir direto com acentos e colunas
+        with open(nome_arquivo_saida, 'w', newline='', encoding='utf-8-sig') as csvfile:
+            writer = csv.writer(csvfile, delimiter=';')
+            writer.writerow(["Rótulos de Linha"] + meses + ["Total Geral"])
+            
+            for empresa in sorted(tabela):
+                valores_empresa = tabela[empresa]
+                linha = [empresa]
+                for i, mes in enumerate(meses):
+                    valor = valores_empresa.get(mes)
+                    if valor is None:
+                        linha.append("")
+                    else:
+                        totais[i] += valor
+                        linha.append(formatar_numero(valor))
+                linha.append(formatar_numero(sum(valores_empresa.values())))
+                writer.writerow(linha)
+            
+            writer.writerow(
+                ["Total Geral"] + [formatar_numero(total) for total in totais] + [formatar_numero(sum(totais))]
+            )
+        
+        print(f"✅ Pivot gerado: {nome_arquivo_saida}")
+        print(f"   Empresas: {len(tabela):,} | Meses: {len(meses)}")
+        return nome_arquivo_saida
+        
+    except Exception as e:
+        print(f"❌ Erro ao gerar pivot: {e}")
+        return None
+
+def executar_conversao_streaming(args):
+    """
+    JSON -> filtro -> CSV elemento a elemento, sem carregar o arquivo em memória
+    """
+    if not os.path.exists(args.entrada):
+        print(f"❌ Arquivo não encontrado: {args.entrada}")
+        return
+    
+    progresso = {}
+    acumulador = AcumuladorEstatisticas()
+    try:
+        registros = acumulador.observar(iterar_json(args.entrada, progresso=progresso))
+        if args.ano:
+            registros = filtrar_por_ano(registros, args.ano)
+        csv_file = json_para_csv_streaming(registros, args.saida, args.lote, progresso)
+    except json.JSONDecodeError as e:
+        print(f"❌ Erro ao decodificar JSON: {e}")
+        return
+    
+    acumulador.imprimir_relatorio()
+    
+    if csv_file:
+        print(f"\n🎯 Conversão concluída!")
+        print(f"💡 Arquivo salvo: {csv_file}")
+    else:
+        print("❌ Falha na conversão para CSV")
+
+def executar_conversao(args):
+    """
+    Fluxo original: JSON -> análise -> filtro do ano -> CSV
+    """
+    if args.streaming:
+        executar_conversao_streaming(args)
+        return
     
     # Carrega os dados do JSON
-    dados = carregar_json(arquivo_json)
+    dados = carregar_json(args.entrada)
     
     if dados:
         # Analisa os dados
         analisar_dados(dados)
         
-        # Filtra apenas 2025 (opcional - remova esta linha se quiser todos os dados)
-        dados = filtrar_dados_2025(dados)
+        # Filtra o ano (padrão 2025; --ano "" converte todos os dados)
+        if args.ano:
+            dados = filtrar_dados(dados, args.ano)
         
         # Converte para CSV
         if dados:
-            csv_file = json_para_csv(dados, "ccee_energy_contracts_2025.csv")
+            csv_file = json_para_csv(dados, args.saida)
             
             if csv_file:
                 print(f"\n🎯 Conversão concluída!")
@@ -176,5 +667,313 @@ if __name__ == "__main__":
                 print("❌ Falha na conversão para CSV")
     else:
         print("❌ Não foi possível carregar os dados")
+
+def executar_pivot(args):
+    """
+    Gera a tabela dinâmica empresa x mês a partir do JSON, em streaming
+    """
+    if not os.path.exists(args.entrada):
+        print(f"❌ Arquivo não encontrado: {args.entrada}")
+        return
+    
+    inicio = datetime.now()
+    try:
+        meses, tabela = gerar_pivot(iterar_json(args.entrada), args.metrica, args.ano)
+    except json.JSONDecodeError as e:
+        print(f"❌ Erro ao decodificar JSON: {e}")
+        return
+    if not tabela:
+        print("❌ Nenhum registro para o pivot")
+        return
+    
+    nome_saida = args.saida or f"ccee_pivot_{args.metrica}_{args.ano or 'todos'}.csv"
+    if salvar_pivot_csv(meses, tabela, nome_saida):
+        print(f"⏱️  Pivot em {(datetime.now() - inicio).total_seconds():.2f}s")
+
+def executar_analise(args):
+    """
+    Relatório de análise em streaming, sem gerar CSV
+    """
+    faltando = [arquivo for arquivo in args.entrada if not os.path.exists(arquivo)]
+    if faltando:
+        print(f"❌ Arquivo não encontrado: {', '.join(faltando)}")
+        return
+    
+    inicio = datetime.now()
+    acumulador = analisar_arquivos(args.entrada, args.processos, int(args.trecho_mb * 1024 * 1024))
+    acumulador.imprimir_relatorio(args.top)
+    print(f"\n⏱️  Análise em {(datetime.now() - inicio).total_seconds():.2f}s")
+
+# Campos numéricos gravados como float no Parquet
+CAMPOS_NUMERICOS = ("CONTRATACAO_VENDA", "CONTRATACAO_COMPRA")
+
+def conectar_mongodb():
+    """
+    Conecta ao MongoDB com as mesmas variáveis de ambiente do backend
+    
+    Returns:
+        Collection: energy_contracts
+    """
+    from pymongo import MongoClient
+    
+    usuario = os.getenv("MONGODB_USER", "belpit")
+    senha = os.getenv("MONGODB_PASS", "Belpit364!")
+    host = os.getenv("MONGODB_HOST", "localhost")
+    porta = os.getenv("MONGODB_PORT", "27017")
+    banco = os.getenv("MONGODB_DB", "ccee_data")
+    
+    uri = f"mongodb://{usuario}:{senha}@{host}:{porta}/{banco}?authSource=admin"
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    return client[banco]["energy_contracts"]
+
+def listar_meses_exportacao(collection, anos=None, meses=None):
+    """
+    Lista os MES_REFERENCIA do banco que atendem aos filtros de ano e mês
+    """
+    disponiveis = collection.distinct("MES_REFERENCIA")
+    selecionados = []
+    for mes_referencia in sorted(disponiveis):
+        mes_referencia = str(mes_referencia)
+        if anos and mes_referencia[:4] not in anos:
+            continue
+        if meses and int(mes_referencia[4:6]) not in meses:
+            continue
+        selecionados.append(mes_referencia)
+    return selecionados
+
+def listar_campos_exportacao(collection, meses):
+    """
+    União dos campos dos meses exportados, pela posição em que aparecem nos documentos
+    
+    Meses carregados por caminhos diferentes não têm os mesmos campos (ex.: LOTE_CARGA
+    e DATA_CARREGAMENTO só existem nos publicados pelo loader); todos os shards usam
+    esta lista para que as colunas fiquem alinhadas ao concatenar.
+    
+    Olha todos os documentos dos meses (no servidor), não uma amostra: um campo
+    que só aparece em parte dos registros de um mês também vira coluna.
+    """
+    pipeline = [
+        {"$match": {"MES_REFERENCIA": {"$in": list(meses)}}},
+        {"$project": {"_id": 0, "campos": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": {"path": "$campos", "includeArrayIndex": "posicao"}},
+        {"$match": {"campos.k": {"$ne": "_id"}}},
+        {"$group": {"_id": "$campos.k", "posicao": {"$min": "$posicao"}}},
+        {"$sort": {"posicao": 1, "_id": 1}}
+    ]
+    return [campo["_id"] for campo in collection.aggregate(pipeline, allowDiskUse=True)]
+
+def exportar_shard(mes_referencia, diretorio, formato, campos, tamanho_lote=10000):
+    """
+    Exporta um mês do MongoDB para CSV ou Parquet (executado em processo separado)
+    
+    Args:
+        campos: Colunas de listar_campos_exportacao, iguais em todos os shards
+    
+    Returns:
+        tuple: (mes_referencia, arquivo, registros, segundos)
+    """
+    inicio = datetime.now()
+    collection = conectar_mongodb()
+    cursor = collection.find({"MES_REFERENCIA": mes_referencia}, {"_id": 0}, batch_size=tamanho_lote)
+    arquivo = os.path.join(diretorio, f"ccee_energy_contracts_{mes_referencia}.{formato}")
+    total = 0
+    conhecidos = set(campos)
+    ignorados = set()
+    
+    try:
+        if formato == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            
+            # Esquema fixo: campo ausente no mês vira coluna nula, mas do mesmo tipo
+            schema = pa.schema([
+                (campo, pa.float64() if campo in CAMPOS_NUMERICOS else pa.string()) for campo in campos
+            ])
+            writer = pq.ParquetWriter(arquivo, schema)
+            lote = []
+            
+            def gravar(lote):
+                colunas = {}
+                for campo in campos:
+                    if campo in CAMPOS_NUMERICOS:
+                        colunas[campo] = [valor_numerico(item.get(campo)) for item in lote]
+                    else:
+                        colunas[campo] = [None if item.get(campo) is None else str(item.get(campo)) for item in lote]
+                writer.write_table(pa.table(colunas, schema=schema))
+            
+            for item in cursor:
+                ignorados.update(item.keys() - conhecidos)
+                lote.append(item)
+                if len(lote) >= tamanho_lote:
+                    gravar(lote)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                gravar(lote)
+                total += len(lote)
+            writer.close()
+        else:
+            with open(arquivo, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=campos, extrasaction='ignore')
+                writer.writeheader()
+                lote = []
+                for item in cursor:
+                    ignorados.update(item.keys() - conhecidos)
+                    lote.append(item)
+                    if len(lote) >= tamanho_lote:
+                        writer.writerows(lote)
+                        total += len(lote)
+                        lote = []
+                if lote:
+                    writer.writerows(lote)
+                    total += len(lote)
+    finally:
+        collection.database.client.close()
+    
+    if ignorados:
+        print(f"⚠️  {mes_referencia}: campos fora do cabeçalho não exportados: {', '.join(sorted(ignorados))}")
+    return mes_referencia, arquivo, total, (datetime.now() - inicio).total_seconds()
+
+def concatenar_shards(arquivos, nome_arquivo_saida, formato):
+    """
+    Junta os shards mensais em um único arquivo (cabeçalho do CSV só uma vez)
+    
+    Os shards precisam ter as mesmas colunas (listar_campos_exportacao)
+    """
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+        
+        writer = None
+        for arquivo in arquivos:
+            tabela = pq.read_table(arquivo)
+            if writer is None:
+                writer = pq.ParquetWriter(nome_arquivo_saida, tabela.schema)
+            writer.write_table(tabela.cast(writer.schema))
+        if writer is not None:
+            writer.close()
+    else:
+        with open(nome_arquivo_saida, 'wb') as saida:
+            for i, arquivo in enumerate(arquivos):
+                with open(arquivo, 'rb') as shard:
+                    cabecalho = shard.readline()
+                    if i == 0:
+                        saida.write(cabecalho)
+                    while True:
+                        bloco = shard.read(1024 * 1024)
+                        if not bloco:
+                            break
+                        saida.write(bloco)
+    
+    print(f"📦 Shards concatenados em: {nome_arquivo_saida}")
+    return nome_arquivo_saida
+
+def executar_exportacao(args):
+    """
+    Exporta direto do MongoDB em shards mensais paralelos
+    """
+    try:
+        import pymongo  # noqa: F401
+    except ImportError:
+        print("❌ pymongo não instalado (pip install pymongo)")
+        return
+    if args.formato == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("❌ pyarrow não instalado (pip install pyarrow)")
+            return
+    
+    anos = [ano.strip() for ano in args.anos.split(",")] if args.anos else None
+    meses = [int(mes) for mes in args.meses.split(",")] if args.meses else None
+    
+    collection = conectar_mongodb()
+    try:
+        shards = listar_meses_exportacao(collection, anos, meses)
+        campos = listar_campos_exportacao(collection, shards)
+    finally:
+        collection.database.client.close()
+    
+    if not shards:
+        print("❌ Nenhum mês encontrado para os filtros informados")
+        return
+    
+    os.makedirs(args.diretorio, exist_ok=True)
+    print(f"📅 {len(shards)} meses para exportar ({shards[0]} a {shards[-1]}) com {args.processos} processos")
+    
+    inicio = datetime.now()
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=args.processos) as executor:
+        futuros = [
+            executor.submit(exportar_shard, mes_referencia, args.diretorio, args.formato, campos, args.lote)
+            for mes_referencia in shards
+        ]
+        for futuro in futuros:
+            mes_referencia, arquivo, total, segundos = futuro.result()
+            resultados[mes_referencia] = (arquivo, total)
+            print(f"   ✅ {mes_referencia}: {total:,} registros em {segundos:.2f}s")
+    
+    total_registros = sum(total for _, total in resultados.values())
+    segundos = max((datetime.now() - inicio).total_seconds(), 1e-9)
+    print(f"🎯 Exportação concluída: {total_registros:,} registros em {segundos:.2f}s ({total_registros / segundos:,.0f} registros/s)")
+    
+    if args.concatenar:
+        arquivos = [resultados[mes][0] for mes in shards if resultados[mes][1] > 0]
+        concatenar_shards(arquivos, args.concatenar, args.formato)
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Conversor CCEE energy contracts")
+    subparsers = parser.add_subparsers(dest="comando")
+    
+    parser_converter = subparsers.add_parser("converter", help="JSON para CSV (padrão)")
+    parser_converter.add_argument("--entrada", default="ccee_data.energy_contracts.json")
+    parser_converter.add_argument("--saida", default="ccee_energy_contracts_2025.csv")
+    parser_converter.add_argument("--streaming", action="store_true",
+                                  help="Lê o JSON incrementalmente (memória constante)")
+    parser_converter.add_argument("--ano", default="2025", help="Ano filtrado (vazio = todos)")
+    parser_converter.add_argument("--lote", type=int, default=5000, help="Registros por lote gravado")
+    
+    parser_analisar = subparsers.add_parser("analisar", help="Relatório em uma passada (streaming)")
+    parser_analisar.add_argument("--entrada", nargs="+", default=["ccee_data.energy_contracts.json"])
+    parser_analisar.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser_analisar.add_argument("--top", type=int, default=5)
+    parser_analisar.add_argument("--trecho-mb", type=float, default=64,
+                                 help="Arquivos maiores são divididos em trechos paralelos (0 = um processo por arquivo)")
+    
+    parser_exportar = subparsers.add_parser("exportar", help="MongoDB para CSV/Parquet em shards mensais paralelos")
+    parser_exportar.add_argument("--anos", default=None, help="Ex.: 2024,2025 (padrão: todos)")
+    parser_exportar.add_argument("--meses", default=None, help="Ex.: 1,2,3 (padrão: todos)")
+    parser_exportar.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser_exportar.add_argument("--diretorio", default="exportacao_ccee")
+    parser_exportar.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser_exportar.add_argument("--lote", type=int, default=10000, help="Registros por lote lido/gravado")
+    parser_exportar.add_argument("--concatenar", default=None, help="Arquivo final com todos os shards")
+    
+    parser_pivot = subparsers.add_parser("pivot", help="Tabela dinâmica empresa x mês")
+    parser_pivot.add_argument("--entrada", default="ccee_data.energy_contracts.json")
+    parser_pivot.add_argument("--saida", default=None)
+    parser_pivot.add_argument("--metrica", choices=list(METRICAS_PIVOT), default="registros")
+    parser_pivot.add_argument("--ano", default=None)
+    
+    return parser
+
+# Execução principal
+if __name__ == "__main__":
+    print("🚀 CONVERSOR CCEE ENERGY CONTRACTS - JSON para CSV")
+    print("=" * 60)
+    
+    parser = criar_parser()
+    args = parser.parse_args()
+    
+    if args.comando == "pivot":
+        executar_pivot(args)
+    elif args.comando == "analisar":
+        executar_analise(args)
+    elif args.comando == "exportar":
+        executar_exportacao(args)
+    else:
+        # Sem subcomando mantém o comportamento original
+        if args.comando is None:
+            args = parser.parse_args(["converter"])
+        executar_conversao(args)
     
     print("\n" + "=" * 60)
\ No newline at end of file
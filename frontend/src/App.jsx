@@ -1,6 +1,6 @@
 import React, { useEffect } from 'react'
 import { useDispatch } from 'react-redux'
-import { fetchAggregatedData, fetchEmpresas, fetchAnos } from './store/slices/dataSlice'
+import { fetchDashboardBundle, fetchDashboardBatch } from './store/slices/dataSlice'
 import Controls from './components/Controls'
 import CompanyFilter from './components/CompanyFilter'
 import EnergyChart from './components/EnergyChart'
@@ -14,9 +14,13 @@ function App() {
     const loadInitialData = async () => {
       try {
         console.log('🚀 Carregando dados iniciais automaticamente...')
-        await dispatch(fetchAggregatedData({})).unwrap()
-        await dispatch(fetchEmpresas()).unwrap()
-        await dispatch(fetchAnos()).unwrap()
+        try {
+          await dispatch(fetchDashboardBundle({})).unwrap()
+        } catch (error) {
+          // Backend sem /api/dashboard (ou bundle indisponível): consultas em batch
+          console.warn('⚠️ Bundle do dashboard indisponível, usando batch:', error)
+          await dispatch(fetchDashboardBatch({})).unwrap()
+        }
         console.log('✅ Dados iniciais carregados automaticamente com sucesso')
       } catch (error) {
         console.error('❌ Erro ao carregar dados iniciais:', error)
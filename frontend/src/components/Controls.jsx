@@ -1,6 +1,6 @@
 import React, { useEffect } from 'react'
 import { useDispatch, useSelector } from 'react-redux'
-import { reloadFrontendData, updateCCEEData, clearReloadMessage, clearUpdateMessage } from '../store/slices/dataSlice'
+import { reloadFrontendData, updateCCEEData, clearReloadMessage, clearUpdateMessage, ingestionEventReceived, API_BASE_URL } from '../store/slices/dataSlice'
 
 const Controls = () => {
   const dispatch = useDispatch()
@@ -9,9 +9,22 @@ const Controls = () => {
     reloadMessage, 
     updateStatus,
     updateMessage,
+    ingestionProgress,
     selectedYear 
   } = useSelector(state => state.data)
 
+  // ✅ Progresso da atualização via Server-Sent Events enquanto o POST está em andamento
+  useEffect(() => {
+    if (updateStatus !== 'loading') return
+    
+    const eventos = new EventSource(`${API_BASE_URL}/api/ingestao/eventos?historico=false`)
+    const tipos = ['pagina', 'registros_inseridos', 'mes_concluido', 'erro']
+    const aoReceber = (event) => dispatch(ingestionEventReceived(JSON.parse(event.data)))
+    tipos.forEach(tipo => eventos.addEventListener(tipo, aoReceber))
+    
+    return () => eventos.close()
+  }, [updateStatus, dispatch])
+
   // ✅ EFFECT para limpar mensagem de reload após 5 segundos
   useEffect(() => {
     if (reloadStatus === 'succeeded' || reloadStatus === 'failed') {
@@ -91,6 +104,13 @@ const Controls = () => {
           )}
         </button>
         
+        {/* ✅ PROGRESSO AO VIVO DA ATUALIZAÇÃO */}
+        {updateStatus === 'loading' && ingestionProgress && (
+          <span className="text-sm text-blue-700">
+            {updateMessage}
+          </span>
+        )}
+        
         {/* ✅ MENSAGENS QUE VÃO SUMIR APÓS 5s */}
         {(reloadStatus === 'succeeded' || reloadStatus === 'failed') && (
           <span className={`text-sm font-bold ${
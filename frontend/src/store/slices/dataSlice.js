@@ -2,7 +2,7 @@ import { createSlice, createAsyncThunk } from '@reduxjs/toolkit'
 import axios from 'axios'
 
 // ✅ Usa variável de ambiente do Vite do frontend
-const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
 console.log(`🌐 API URL: ${API_BASE_URL}`)
 
@@ -40,7 +40,8 @@ export const updateCCEEData = createAsyncThunk(
   async (_, { rejectWithValue }) => {
     try {
       console.log('🔄 Atualizando dados da CCEE...')
-      const response = await api.post('/api/update-ccee-data')
+      // Sem timeout: o progresso chega pelo stream de eventos (/api/ingestao/eventos)
+      const response = await api.post('/api/update-ccee-data', null, { timeout: 0 })
       console.log('✅ Atualização CCEE concluída:', response.data)
       return response.data
     } catch (error) {
@@ -152,6 +153,75 @@ export const fetchEmpresas = createAsyncThunk(
   }
 )
 
+// ✅ Carga do dashboard em uma única requisição (/api/batch)
+export const fetchDashboardBatch = createAsyncThunk(
+  'data/fetchDashboardBatch',
+  async ({ empresa = null, ano = null } = {}, { rejectWithValue }) => {
+    try {
+      const filtros = {}
+      if (empresa) filtros.empresa = empresa
+      if (ano) filtros.ano = ano
+
+      console.log('🔄 Buscando dados do dashboard em batch...', filtros)
+      const response = await api.post('/api/batch', {
+        filtros,
+        consultas: [
+          { nome: 'agregados', tipo: 'agregados' },
+          { nome: 'empresas', tipo: 'empresas' },
+          { nome: 'anos', tipo: 'anos' }
+        ]
+      })
+
+      const { resultados, tempo_total_ms } = response.data
+      const falhas = Object.entries(resultados).filter(([, resultado]) => !resultado.sucesso)
+      if (falhas.length > 0) {
+        throw new Error(falhas.map(([nome, resultado]) => `${nome}: ${resultado.erro}`).join('; '))
+      }
+
+      console.log(`✅ Batch recebido em ${tempo_total_ms} ms`)
+      return {
+        aggregatedData: resultados.agregados.dados,
+        empresas: resultados.empresas.dados.empresas,
+        anos: resultados.anos.dados.anos
+      }
+    } catch (error) {
+      console.error('❌ Erro ao buscar batch do dashboard:', error)
+      return rejectWithValue(
+        error.response?.data?.detail ||
+        error.message ||
+        'Erro ao buscar dados do dashboard'
+      )
+    }
+  }
+)
+
+// ✅ Primeira tela em uma requisição: bundle pré-calculado a cada ingestão (/api/dashboard)
+export const fetchDashboardBundle = createAsyncThunk(
+  'data/fetchDashboardBundle',
+  async ({ ano = null } = {}, { rejectWithValue }) => {
+    try {
+      console.log('🔄 Buscando bundle do dashboard...', { ano })
+      const response = await api.get('/api/dashboard', { params: ano ? { ano } : {} })
+      const bundle = response.data
+
+      console.log(`✅ Bundle gerado em ${bundle.gerado_em} recebido`)
+      return {
+        aggregatedData: bundle.agregados,
+        empresas: bundle.empresas,
+        anos: bundle.anos,
+        stats: { ...bundle.resumo, top_empresas: bundle.top_empresas }
+      }
+    } catch (error) {
+      console.error('❌ Erro ao buscar bundle do dashboard:', error)
+      return rejectWithValue(
+        error.response?.data?.detail ||
+        error.message ||
+        'Erro ao buscar dados do dashboard'
+      )
+    }
+  }
+)
+
 const dataSlice = createSlice({
   name: 'data',
   initialState: {
@@ -173,6 +243,7 @@ const dataSlice = createSlice({
     
     updateStatus: 'idle',     // Para updateCCEEData  
     updateMessage: '',
+    ingestionProgress: null,  // Último evento de progresso do stream SSE
     
     // ✅ NOVO: Timer IDs para controle dos timeouts
     messageTimers: {
@@ -223,6 +294,20 @@ const dataSlice = createSlice({
       })
       state.messageTimers = { reload: null, update: null }
     },
+    // ✅ Evento do stream de ingestão (SSE)
+    ingestionEventReceived: (state, action) => {
+      const evento = action.payload
+      if (evento.tipo === 'pagina') {
+        state.ingestionProgress = evento
+        const total = evento.total ? ` de ${evento.total.toLocaleString('pt-BR')}` : ''
+        const eta = evento.eta_s != null ? ` - ETA ${Math.ceil(evento.eta_s)}s` : ''
+        state.updateMessage = `📥 ${evento.mes}: ${evento.baixados.toLocaleString('pt-BR')}${total} registros (${Math.round(evento.registros_por_s)}/s)${eta}`
+      } else if (evento.tipo === 'registros_inseridos') {
+        state.updateMessage = `💾 ${evento.mes}: ${evento.registros.toLocaleString('pt-BR')} registros gravados`
+      } else if (evento.tipo === 'erro') {
+        state.updateMessage = `⚠️ ${evento.mes || ''} ${evento.mensagem}`
+      }
+    },
     setSelectedEmpresa: (state, action) => {
       state.selectedEmpresa = action.payload
     },
@@ -269,6 +354,7 @@ const dataSlice = createSlice({
         }
       })
       .addCase(updateCCEEData.fulfilled, (state, action) => {
+        state.ingestionProgress = null
         if (action.payload.success) {
           if (action.payload.updated) {
             state.updateStatus = 'succeeded'
@@ -288,6 +374,7 @@ const dataSlice = createSlice({
         }
       })
       .addCase(updateCCEEData.rejected, (state, action) => {
+        state.ingestionProgress = null
         state.updateStatus = 'failed'
         state.updateMessage = `❌ Erro na atualização: ${action.payload}`
       })
@@ -363,6 +450,55 @@ const dataSlice = createSlice({
         state.error = action.payload
       })
       
+      // Fetch Dashboard Batch
+      .addCase(fetchDashboardBatch.pending, (state) => {
+        state.loading = true
+        state.loadingEmpresas = true
+        state.loadingAnos = true
+        state.error = null
+      })
+      .addCase(fetchDashboardBatch.fulfilled, (state, action) => {
+        state.loading = false
+        state.loadingEmpresas = false
+        state.loadingAnos = false
+        state.aggregatedData = Array.isArray(action.payload.aggregatedData) ? action.payload.aggregatedData : []
+        state.empresas = Array.isArray(action.payload.empresas) ? action.payload.empresas : []
+        state.anos = Array.isArray(action.payload.anos) ? action.payload.anos : []
+        state.dataLoaded = true
+        state.lastUpdate = new Date().toISOString()
+      })
+      .addCase(fetchDashboardBatch.rejected, (state, action) => {
+        state.loading = false
+        state.loadingEmpresas = false
+        state.loadingAnos = false
+        state.error = action.payload
+      })
+      
+      // Fetch Dashboard Bundle
+      .addCase(fetchDashboardBundle.pending, (state) => {
+        state.loading = true
+        state.loadingEmpresas = true
+        state.loadingAnos = true
+        state.error = null
+      })
+      .addCase(fetchDashboardBundle.fulfilled, (state, action) => {
+        state.loading = false
+        state.loadingEmpresas = false
+        state.loadingAnos = false
+        state.aggregatedData = Array.isArray(action.payload.aggregatedData) ? action.payload.aggregatedData : []
+        state.empresas = Array.isArray(action.payload.empresas) ? action.payload.empresas : []
+        state.anos = Array.isArray(action.payload.anos) ? action.payload.anos : []
+        state.stats = action.payload.stats
+        state.dataLoaded = true
+        state.lastUpdate = new Date().toISOString()
+      })
+      .addCase(fetchDashboardBundle.rejected, (state) => {
+        // Sem erro na tela: o App cai para o /api/batch
+        state.loading = false
+        state.loadingEmpresas = false
+        state.loadingAnos = false
+      })
+      
       // Fetch Empresas
       .addCase(fetchEmpresas.pending, (state) => {
         state.loadingEmpresas = true
@@ -383,6 +519,7 @@ export const {
   clearReloadMessage,
   clearUpdateMessage, 
   clearAllMessages,
+  ingestionEventReceived,
   setSelectedEmpresa, 
   setSelectedYear,
   clearFilters,